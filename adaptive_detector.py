@@ -0,0 +1,231 @@
+"""
+Adaptive Detector Module
+Tự chọn kích thước model và độ phân giải inference cho từng ảnh
+để đáp ứng ngân sách thời gian (latency budget) hoặc mục tiêu chất lượng
+"""
+
+import math
+import time
+
+import numpy as np
+
+from person_detector import PersonDetector, MODE_AUTO, tile_grid
+from model_registry import ModelRegistry
+
+# Kích thước khuôn mặt nhỏ nhất (pixel, sau khi resize) mà model còn phát hiện ổn định
+MIN_FACE_PX = 12
+
+# Lượt probe rẻ: model nano ở độ phân giải thấp
+PROBE_IMGSZ = 320
+
+# Ước lượng ban đầu (ms trên CPU) trước khi có số đo thực tế
+DEFAULT_LATENCY_MS = {
+    ('n', 320): 25, ('n', 640): 80, ('n', 960): 180, ('n', 1280): 320,
+    ('s', 640): 200, ('s', 960): 450, ('s', 1280): 800,
+    ('m', 640): 450, ('m', 960): 1000, ('m', 1280): 1800,
+}
+
+# Mức chất lượng -> model lớn nhất được phép dùng
+QUALITY_MAX_SIZE = {'fast': 'n', 'balanced': 's', 'accurate': 'm'}
+
+
+class AdaptiveDetector:
+    """
+    Chọn cấu hình (model, imgsz, tiling) cho từng ảnh
+
+    1. Probe: model nano ở 320px -> ước lượng mật độ và kích thước khuôn mặt
+    2. Ảnh thưa (chân dung, ít mặt, mặt lớn): dùng luôn kết quả probe hoặc nano 640
+    3. Ảnh đông: tính imgsz cần để mặt nhỏ nhất còn >= MIN_FACE_PX, chọn cấu hình
+       chất lượng cao nhất có thời gian ước lượng nằm trong ngân sách; nếu cần
+       độ phân giải vượt 1280 thì chuyển sang tiling
+    Thời gian của mỗi cấu hình được đo online (trung bình trượt) để ước lượng chính xác dần.
+    """
+
+    def __init__(self, latency_budget_ms: float = None, quality: str = 'balanced',
+                 mode: str = MODE_AUTO, backend: str = 'pt', registry: ModelRegistry = None):
+        """
+        Args:
+            latency_budget_ms: Ngân sách thời gian cho mỗi ảnh (None: không giới hạn)
+            quality: 'fast', 'balanced' hoặc 'accurate'
+            mode: Chế độ phát hiện của PersonDetector
+            backend: 'pt' hoặc 'onnx'
+            registry: ModelRegistry dùng chung
+        """
+        if quality not in QUALITY_MAX_SIZE:
+            raise ValueError(f"Mức chất lượng không hợp lệ: {quality}")
+        self.latency_budget_ms = latency_budget_ms
+        self.quality = quality
+        self.mode = mode
+        self.backend = backend
+        self.registry = registry or ModelRegistry()
+
+        self._detectors = {}
+        self._latency = dict(DEFAULT_LATENCY_MS)
+        self.last_choice = None
+
+        # Model nano luôn được load (dùng cho probe)
+        self._detector('n')
+        self.model_name = "adaptive"
+
+    def _detector(self, size: str):
+        """Lấy (hoặc load lần đầu) detector cho một kích thước model"""
+        if size not in self._detectors:
+            self._detectors[size] = PersonDetector(
+                self.mode, model_size=size, backend=self.backend, registry=self.registry
+            )
+        return self._detectors[size]
+
+    def _sizes(self) -> list:
+        """Các kích thước model được phép theo mức chất lượng"""
+        allowed = ['n', 's', 'm']
+        return allowed[:allowed.index(QUALITY_MAX_SIZE[self.quality]) + 1]
+
+    # ------------------------------------------------------------------
+    # Đo thời gian
+    # ------------------------------------------------------------------
+    def _estimate(self, size: str, imgsz: int) -> float:
+        if (size, imgsz) in self._latency:
+            return self._latency[(size, imgsz)]
+        # Chưa có số đo: nội suy theo số pixel so với cấu hình 640
+        base = self._latency.get((size, 640), DEFAULT_LATENCY_MS[(size, 640)])
+        return base * (imgsz / 640) ** 2
+
+    def _record(self, size: str, imgsz: int, elapsed_ms: float, calls: int = 1):
+        """Cập nhật trung bình trượt thời gian của một cấu hình"""
+        per_call = elapsed_ms / max(1, calls)
+        old = self._latency.get((size, imgsz))
+        self._latency[(size, imgsz)] = per_call if old is None else 0.7 * old + 0.3 * per_call
+
+    def _timed(self, size: str, imgsz: int, func, calls: int = 1):
+        start = time.perf_counter()
+        result = func()
+        self._record(size, imgsz, (time.perf_counter() - start) * 1000, calls)
+        return result
+
+    # ------------------------------------------------------------------
+    # Chọn cấu hình
+    # ------------------------------------------------------------------
+    def _candidates(self, width: int, height: int, needed_imgsz: int) -> list:
+        """
+        Danh sách cấu hình theo chất lượng tăng dần: (size, imgsz, tile_size hoặc None)
+        """
+        long_side = max(width, height)
+        candidates = []
+        for size in self._sizes():
+            for imgsz in (640, 960, 1280):
+                if imgsz > max(640, long_side):
+                    break
+                candidates.append((size, imgsz, None))
+        if needed_imgsz > 1280:
+            # Tile trên ảnh gốc sao cho mặt nhỏ nhất vẫn đủ lớn ở 640px
+            scale = needed_imgsz / long_side
+            tile_size = max(320, int(640 / scale))
+            for size in self._sizes():
+                candidates.append((size, 640, tile_size))
+        return candidates
+
+    def _cost(self, candidate: tuple, width: int, height: int) -> float:
+        size, imgsz, tile_size = candidate
+        if tile_size is None:
+            return self._estimate(size, imgsz)
+        tiles = len(tile_grid(width, height, tile_size))
+        return tiles * self._estimate(size, imgsz)
+
+    def choose(self, width: int, height: int, probe: list) -> tuple:
+        """
+        Chọn cấu hình từ kết quả probe
+
+        Returns:
+            (size, imgsz, tile_size) hoặc None nếu dùng luôn kết quả probe
+        """
+        long_side = max(width, height)
+        probe_scale = PROBE_IMGSZ / long_side
+
+        if probe:
+            heights = np.array([det['bbox'][3] - det['bbox'][1] for det in probe], dtype=np.float32)
+            smallest = float(np.percentile(heights, 10))
+            # Mặt nhỏ trong probe có thể còn nhỏ hơn ở các vùng probe bỏ sót
+            needed_imgsz = MIN_FACE_PX * 1.5 * long_side / max(1.0, smallest)
+            sparse = len(probe) <= 3 and smallest * probe_scale >= 4 * MIN_FACE_PX
+        else:
+            # Không thấy gì: ảnh nhỏ coi như trống, ảnh lớn có thể có mặt rất nhỏ
+            needed_imgsz = 640 if long_side <= 1280 else long_side / 2
+            sparse = long_side <= 1280
+
+        if sparse and self.quality == 'fast':
+            return None
+        if sparse:
+            return ('n', 640, None)
+
+        needed_imgsz = int(math.ceil(needed_imgsz / 32) * 32)
+        candidates = self._candidates(width, height, needed_imgsz)
+        budget = self.latency_budget_ms
+        if budget is not None:
+            budget -= self._estimate('n', PROBE_IMGSZ)
+
+        # Ưu tiên cấu hình đủ độ phân giải; trong cùng mức, model lớn hơn tốt hơn
+        def rank(candidate):
+            size, imgsz, tile_size = candidate
+            effective = needed_imgsz if tile_size is not None else imgsz
+            return (min(effective, needed_imgsz), 'nsm'.index(size))
+
+        affordable = [
+            c for c in candidates
+            if budget is None or self._cost(c, width, height) <= budget
+        ]
+        if not affordable:
+            # Không cấu hình nào vừa ngân sách -> rẻ nhất
+            return min(candidates, key=lambda c: self._cost(c, width, height))
+        return max(affordable, key=rank)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def detect(self, image, confidence: float = 0.3) -> list:
+        """
+        Phát hiện khuôn mặt với cấu hình tự chọn
+
+        Args:
+            image: Đường dẫn tới ảnh hoặc ảnh BGR (numpy array)
+            confidence: Ngưỡng confidence tối thiểu (0-1)
+
+        Returns:
+            List detection giống PersonDetector.detect; cấu hình đã chọn
+            và thời gian thực tế nằm trong self.last_choice
+        """
+        start = time.perf_counter()
+        nano = self._detector('n')
+        image = nano._load_image(image)
+        height, width = image.shape[:2]
+
+        probe = self._timed('n', PROBE_IMGSZ, lambda: nano.detect(image, confidence, imgsz=PROBE_IMGSZ))
+        choice = self.choose(width, height, probe)
+
+        if choice is None:
+            detections = probe
+        else:
+            size, imgsz, tile_size = choice
+            detector = self._detector(size)
+            if tile_size is None:
+                detections = self._timed(size, imgsz, lambda: detector.detect(image, confidence, imgsz=imgsz))
+            else:
+                tiles = len(tile_grid(width, height, tile_size))
+                detections = self._timed(
+                    size, imgsz,
+                    lambda: detector.detect_tiled(image, confidence, tile_size=tile_size, imgsz=imgsz),
+                    calls=tiles
+                )
+
+        self.last_choice = {
+            'config': choice or ('n', PROBE_IMGSZ, None),
+            'probe_count': len(probe),
+            'elapsed_ms': (time.perf_counter() - start) * 1000,
+        }
+        return detections
+
+    def detect_batch(self, images: list, confidence: float = 0.3) -> list:
+        """Tương thích với DetectionPipeline: chọn cấu hình riêng cho từng ảnh"""
+        return [self.detect(image, confidence) for image in images]
+
+    def draw_results(self, image, detections: list, max_size: int = None):
+        return self._detector('n').draw_results(image, detections, max_size)
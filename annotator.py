@@ -0,0 +1,194 @@
+"""
+Annotator Module
+Vẽ bounding box và số thứ tự trực tiếp lên ảnh đã decode bằng OpenCV/NumPy:
+font được cache theo cỡ chữ, label số được render sẵn thành sprite và chỉ copy vào ảnh
+"""
+
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Màu sắc cho bounding box (theo số thứ tự)
+COLORS = [
+    '#FF6B6B',  # Đỏ
+    '#4ECDC4',  # Xanh ngọc
+    '#45B7D1',  # Xanh dương
+    '#96CEB4',  # Xanh lá nhạt
+    '#FFEAA7',  # Vàng
+    '#DDA0DD',  # Tím nhạt
+    '#98D8C8',  # Mint
+    '#F7DC6F',  # Gold
+    '#BB8FCE',  # Lavender
+    '#85C1E9',  # Sky blue
+]
+_RGB_COLORS = [tuple(int(c[i:i + 2], 16) for i in (1, 3, 5)) for c in COLORS]
+_BGR_COLORS = [color[::-1] for color in _RGB_COLORS]
+
+# Font thử lần lượt; font mặc định của PIL nếu không có font nào
+FONT_CANDIDATES = ("arial.ttf", "C:/Windows/Fonts/arial.ttf", "DejaVuSans.ttf")
+
+LABEL_PADDING = 5
+MAX_SPRITES = 4096
+
+
+@lru_cache(maxsize=32)
+def load_font(size: int):
+    """Load font một lần cho mỗi cỡ chữ"""
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def style_for(width: int, height: int) -> tuple:
+    """Cỡ chữ và độ dày viền theo kích thước ảnh: (font_size, box_width)"""
+    short_side = min(width, height)
+    return max(20, short_side // 30), max(2, short_side // 200)
+
+
+class Annotator:
+    """
+    Renderer annotation dùng chung (an toàn khi gọi từ nhiều thread)
+
+    Label "1".."N" được render bằng PIL đúng một lần cho mỗi (số, cỡ chữ)
+    rồi giữ lại dưới dạng mảng RGB; vẽ ảnh chỉ còn cv2.rectangle cho viền
+    và một phép gán slice NumPy cho mỗi label.
+    """
+
+    def __init__(self, max_sprites: int = MAX_SPRITES):
+        self.max_sprites = max_sprites
+        self._sprites = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sprite(self, number: int, font_size: int, bgr: bool = False) -> np.ndarray:
+        """Sprite (nền màu + số trắng) của một label, render lần đầu rồi cache"""
+        key = (number, font_size, bgr)
+        with self._lock:
+            cached = self._sprites.get(key)
+            if cached is not None:
+                self._sprites.move_to_end(key)
+                return cached
+
+        font = load_font(font_size)
+        label = str(number)
+        left, top, right, bottom = font.getbbox(label)
+        width = right - left + LABEL_PADDING * 2
+        height = bottom - top + LABEL_PADDING * 2
+        color = _RGB_COLORS[(number - 1) % len(_RGB_COLORS)]
+        tile = Image.new('RGB', (width, height), color)
+        ImageDraw.Draw(tile).text((LABEL_PADDING - left, LABEL_PADDING - top), label, fill='white', font=font)
+        sprite = np.asarray(tile)
+        if bgr:
+            sprite = np.ascontiguousarray(sprite[:, :, ::-1])
+
+        with self._lock:
+            self._sprites[key] = sprite
+            while len(self._sprites) > self.max_sprites:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    def prerender(self, count: int, font_size: int):
+        """Render sẵn label 1..count (vd: trước khi export cả thư mục cùng kích thước)"""
+        for number in range(1, count + 1):
+            self.sprite(number, font_size)
+
+    def draw(self, pixels: np.ndarray, detections: list, scale: float = 1.0, bgr: bool = False,
+             origin: tuple = (0, 0), style: tuple = None) -> np.ndarray:
+        """
+        Vẽ annotation trực tiếp (in-place) lên ảnh
+
+        Args:
+            pixels: Ảnh (H, W, 3) uint8, sẽ bị ghi đè
+            detections: Kết quả detect() theo toạ độ ảnh gốc
+            scale: Tỉ lệ của pixels so với ảnh gốc (ảnh preview đã thu nhỏ)
+            bgr: Ảnh theo thứ tự kênh BGR (OpenCV) thay vì RGB
+            origin: Vị trí góc trên trái của pixels trong ảnh đã scale
+                (pixels là một tile cắt ra từ ảnh lớn)
+            style: (font_size, box_width) cố định; None: tính theo kích thước pixels
+
+        Returns:
+            Chính mảng pixels
+        """
+        colors = _BGR_COLORS if bgr else _RGB_COLORS
+        img_height, img_width = pixels.shape[:2]
+        font_size, box_width = style or style_for(img_width, img_height)
+        origin_x, origin_y = origin
+
+        for det in detections:
+            number = det['number']
+            x1, y1, x2, y2 = (int(round(v * scale)) for v in det['bbox'])
+            sprite = self.sprite(number, font_size, bgr)
+            h, w = sprite.shape[:2]
+            # Vị trí label quyết định theo toạ độ cả ảnh để các tile ghép khớp nhau
+            top = (y1 - h if y1 - h >= 0 else y1) - origin_y
+            x1, x2 = x1 - origin_x, x2 - origin_x
+            y1, y2 = y1 - origin_y, y2 - origin_y
+            cv2.rectangle(pixels, (x1, y1), (x2, y2), colors[(number - 1) % len(colors)], box_width)
+
+            # Cắt phần sprite nằm ngoài ảnh
+            sx1, sy1 = max(0, -x1), max(0, -top)
+            dx1, dy1 = max(0, x1), max(0, top)
+            dx2, dy2 = min(img_width, x1 + w), min(img_height, top + h)
+            if dx2 > dx1 and dy2 > dy1:
+                pixels[dy1:dy2, dx1:dx2] = sprite[sy1:sy1 + dy2 - dy1, sx1:sx1 + dx2 - dx1]
+        return pixels
+
+    def annotate(self, image, detections: list, max_size: int = None, bgr: bool = False) -> np.ndarray:
+        """
+        Vẽ annotation lên một bản sao của ảnh
+
+        Args:
+            image: Đường dẫn ảnh, ảnh BGR (numpy array) hoặc PIL Image
+            detections: Kết quả detect()
+            max_size: Cạnh dài tối đa của ảnh kết quả (preview); None: giữ nguyên kích thước
+            bgr: Trả về mảng BGR (để encode bằng OpenCV) thay vì RGB
+
+        Returns:
+            Mảng uint8 (H, W, 3) đã vẽ annotation
+        """
+        is_bgr = isinstance(image, np.ndarray)
+        if is_bgr:
+            pixels = image
+        else:
+            if not isinstance(image, Image.Image):
+                image = Image.open(image)
+            pixels = np.asarray(image.convert('RGB'))
+
+        scale = 1.0
+        height, width = pixels.shape[:2]
+        resized = False
+        if max_size and max(width, height) > max_size:
+            scale = max_size / max(width, height)
+            pixels = cv2.resize(pixels, (max(1, int(width * scale)), max(1, int(height * scale))),
+                                interpolation=cv2.INTER_AREA)
+            resized = True
+
+        # Luôn vẽ lên một mảng mới để không ghi đè ảnh đầu vào
+        if is_bgr != bgr:
+            out = cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB if is_bgr else cv2.COLOR_RGB2BGR)
+        else:
+            out = pixels if resized else pixels.copy()
+        return self.draw(out, detections, scale, bgr)
+
+    def render(self, image, detections: list, max_size: int = None) -> Image.Image:
+        """
+        Vẽ annotation và trả về PIL Image
+
+        Args:
+            image: Đường dẫn ảnh, ảnh BGR (numpy array) hoặc PIL Image
+            detections: Kết quả detect()
+            max_size: Cạnh dài tối đa của ảnh kết quả (preview); None: giữ nguyên kích thước
+
+        Returns:
+            PIL Image RGB đã vẽ annotation
+        """
+        return Image.fromarray(self.annotate(image, detections, max_size))
+
+# Renderer dùng chung để cache sprite giữa các lần gọi
+default_annotator = Annotator()
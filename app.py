@@ -4,12 +4,22 @@ Person Counter App - GUI Application
 """
 
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, ttk, simpledialog
 from PIL import Image, ImageTk
 import os
+import time
 import threading
 
 from person_detector import PersonDetector
+from pipeline import DetectionPipeline
+from frame_source import is_animated, iter_animation, detect_frames, summarize
+from roi import RoiConfig, RoiDetector
+from raw_cache import RawOutputCache
+from results_store import ResultsStore, DEFAULT_DB_PATH
+from zoom_view import ZoomView, ImagePyramid
+from memory_budget import get_budget
+from live_counter import LiveCounter
+from annotator import default_annotator
 
 
 class PersonCounterApp:
@@ -32,9 +42,22 @@ class PersonCounterApp:
         
         # Biến lưu trữ
         self.current_image_path = None
-        self.result_image = None
         self.detector = None
-        self.photo_image = None  # Giữ reference để tránh garbage collection
+        self.results_store = None
+        
+        # Vùng đếm (ROI) vẽ trên canvas, toạ độ tỉ lệ 0-1 theo ảnh
+        self.rois = []
+        self.roi_mode = False
+        self.roi_config = RoiConfig.load()
+        self._drag_start = None
+        self._press_pos = None  # Vị trí nhấn chuột (phân biệt click chọn và kéo ảnh)
+        
+        # Chế độ trực tiếp (camera/stream): chỉ hiển thị kết quả mới nhất
+        self.live = None
+        self._live_latest = None
+        self._live_scheduled = False
+        self._live_photo = None
+        self._canvas_size = (1, 1)  # Cập nhật trong thread Tk, đọc từ thread inference
         
         # Tạo giao diện
         self._create_widgets()
@@ -88,6 +111,77 @@ class PersonCounterApp:
         )
         self.select_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        # Button vẽ vùng đếm (ROI)
+        self.roi_btn = tk.Button(
+            control_frame,
+            text="▭ Vùng đếm",
+            font=("Segoe UI", 10),
+            bg=self.secondary_bg,
+            fg=self.text_color,
+            activebackground="#0f3460",
+            activeforeground="white",
+            relief=tk.FLAT,
+            padx=10,
+            pady=8,
+            cursor="hand2",
+            command=self._toggle_roi_mode
+        )
+        self.roi_btn.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.clear_roi_btn = tk.Button(
+            control_frame,
+            text="✖ Bỏ vùng",
+            font=("Segoe UI", 10),
+            bg=self.secondary_bg,
+            fg=self.text_color,
+            activebackground="#0f3460",
+            activeforeground="white",
+            relief=tk.FLAT,
+            padx=10,
+            pady=8,
+            cursor="hand2",
+            command=self._clear_rois
+        )
+        self.clear_roi_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        # Button đếm trực tiếp từ camera/stream/file video
+        self.live_btn = tk.Button(
+            control_frame,
+            text="📹 Trực tiếp",
+            font=("Segoe UI", 10),
+            bg=self.secondary_bg,
+            fg=self.text_color,
+            activebackground="#0f3460",
+            activeforeground="white",
+            relief=tk.FLAT,
+            padx=10,
+            pady=8,
+            cursor="hand2",
+            state=tk.DISABLED,
+            command=self._toggle_live
+        )
+        self.live_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
+        # Ngưỡng confidence: đổi ngưỡng chỉ chạy lại hậu xử lý (output thô đã cache)
+        self.confidence = tk.DoubleVar(value=0.3)
+        self.confidence_scale = tk.Scale(
+            control_frame,
+            from_=0.05,
+            to=0.95,
+            resolution=0.05,
+            orient=tk.HORIZONTAL,
+            variable=self.confidence,
+            label="Ngưỡng",
+            length=120,
+            font=("Segoe UI", 8),
+            fg=self.text_color,
+            bg=self.bg_color,
+            troughcolor=self.secondary_bg,
+            highlightthickness=0
+        )
+        self.confidence_scale.pack(side=tk.LEFT, padx=(0, 10))
+        self.confidence_scale.bind("<ButtonRelease-1>", lambda e: self._rerun_current())
+        
         # Status label
         self.status_label = tk.Label(
             control_frame,
@@ -128,16 +222,29 @@ class PersonCounterApp:
             fill="#666"
         )
         
+        # Zoom/pan: lăn chuột để zoom, kéo để di chuyển, double-click để vừa khung
+        self.view = ZoomView(self.canvas)
+        self.view.on_render = self._draw_rois
+        
         # Bind resize event
         self.canvas.bind("<Configure>", self._on_canvas_resize)
         
+        # Kéo chuột: vẽ vùng đếm (chế độ vùng đếm) hoặc di chuyển ảnh
+        self.canvas.bind("<ButtonPress-1>", self._on_roi_press)
+        self.canvas.bind("<B1-Motion>", self._on_roi_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._on_roi_release)
+        
+        # Di chuột/click lên khuôn mặt để xem thông tin
+        self.canvas.bind("<Motion>", self._on_canvas_motion)
+        
         # === Footer Frame ===
         footer_frame = tk.Frame(self.root, bg=self.secondary_bg, pady=8)
         footer_frame.pack(fill=tk.X)
         
         footer_label = tk.Label(
             footer_frame,
-            text="💡 Mỗi khuôn mặt được đánh dấu bằng số thứ tự và khung màu",
+            text="💡 Mỗi khuôn mặt được đánh dấu bằng số thứ tự và khung màu"
+                 " - lăn chuột để zoom, kéo để di chuyển, double-click để xem cả ảnh",
             font=("Segoe UI", 9),
             fg="#888",
             bg=self.secondary_bg
@@ -146,6 +253,7 @@ class PersonCounterApp:
         
     def _on_canvas_resize(self, event):
         """Xử lý khi canvas thay đổi kích thước"""
+        self._canvas_size = (event.width, event.height)
         # Cập nhật vị trí placeholder
         self.canvas.coords(
             self.placeholder_id,
@@ -154,19 +262,22 @@ class PersonCounterApp:
         )
         
         # Nếu có ảnh, vẽ lại
-        if self.result_image:
-            self._display_image(self.result_image)
+        self.view.on_resize()
             
     def _load_model_async(self):
         """Load model trong background thread"""
         def load():
             try:
                 self.detector = PersonDetector()
+                self.detector.raw_cache = RawOutputCache()
+                get_budget().register_cache("raw_outputs", self.detector.raw_cache.trim)
+                self.results_store = ResultsStore(DEFAULT_DB_PATH)
                 self.root.after(0, lambda: self.status_label.config(
                     text="✅ Sẵn sàng!",
                     fg="#4ecca3"
                 ))
                 self.root.after(0, lambda: self.select_btn.config(state=tk.NORMAL))
+                self.root.after(0, lambda: self.live_btn.config(state=tk.NORMAL))
             except Exception as e:
                 self.root.after(0, lambda: self.status_label.config(
                     text=f"❌ Lỗi: {str(e)}",
@@ -186,17 +297,25 @@ class PersonCounterApp:
             ("All files", "*.*")
         ]
         
-        filepath = filedialog.askopenfilename(
+        filepaths = filedialog.askopenfilenames(
             title="Chọn ảnh để phát hiện khuôn mặt",
             filetypes=filetypes
         )
         
-        if filepath:
-            self.current_image_path = filepath
-            self._process_image(filepath)
+        if len(filepaths) == 1:
+            self.current_image_path = filepaths[0]
+            self._process_image(filepaths[0])
+        elif filepaths:
+            self._process_batch(list(filepaths))
             
-    def _process_image(self, image_path: str):
-        """Xử lý ảnh và hiển thị kết quả"""
+    def _process_image(self, image_path: str, store: bool = True):
+        """
+        Xử lý ảnh và hiển thị kết quả
+
+        Args:
+            image_path: Đường dẫn ảnh
+            store: Lưu kết quả vào lịch sử (False khi chỉ chạy lại do đổi ngưỡng/vùng đếm)
+        """
         
         # Hiển thị trạng thái đang xử lý
         self.status_label.config(text="⏳ Đang phát hiện khuôn mặt...", fg="#ffd93d")
@@ -204,18 +323,40 @@ class PersonCounterApp:
         self.select_btn.config(state=tk.DISABLED)
         self.root.update()
         
+        confidence = self.confidence.get()
+        
         def process():
             try:
-                # Phát hiện người
-                detections = self.detector.detect(image_path)
+                # Ảnh động: detect theo khung, hiển thị khung đông nhất
+                if is_animated(image_path):
+                    self._process_animation(image_path, confidence, store)
+                    return
+                
+                # Phát hiện người (chỉ trong vùng đếm nếu có)
+                rois = self.rois or self.roi_config.rois_for(image_path)
+                if rois:
+                    detections = self.detector.detect_regions([image_path], [rois], confidence)[0]
+                else:
+                    detections = self.detector.detect(image_path, confidence)
                 
-                # Vẽ kết quả
-                result_image = self.detector.draw_results(image_path, detections)
+                # Lưu lịch sử kết quả (lỗi lưu trữ không chặn việc hiển thị)
+                if store:
+                    try:
+                        self.results_store.add(
+                            image_path,
+                            detections,
+                            model=self.detector.model_name,
+                            confidence=confidence
+                        )
+                    except Exception as e:
+                        print(f"Không thể lưu kết quả: {e}")
+                
+                # Chuẩn bị ảnh để xem (annotation vẽ theo tile khi hiển thị)
+                pyramid = ImagePyramid(image_path)
                 
                 # Cập nhật UI trong main thread
                 def update_ui():
-                    self.result_image = result_image
-                    self._display_image(result_image)
+                    self._display_image(pyramid, detections)
                     
                     person_count = len(detections)
                     if person_count == 0:
@@ -248,45 +389,320 @@ class PersonCounterApp:
         thread = threading.Thread(target=process, daemon=True)
         thread.start()
         
-    def _display_image(self, image: Image.Image):
-        """Hiển thị ảnh trên canvas với resize phù hợp"""
+    def _process_animation(self, image_path: str, confidence: float, store: bool = True):
+        """Đếm khuôn mặt trên mọi khung của ảnh động (gọi từ thread nền)"""
+        rois = self.rois or self.roi_config.rois_for(image_path)
+        detector = RoiDetector(self.detector, rois) if rois else self.detector
+        results = []
+        peak = None
+        for result in detect_frames(detector, iter_animation(image_path), confidence=confidence, keep_frames=True):
+            frame = result.pop('frame')
+            results.append(result)
+            if peak is None or result['count'] > peak[0]['count']:
+                peak = (result, frame)
+        if peak is None:
+            # Báo qua đường lỗi chung của _process_image
+            raise ValueError("Ảnh động không có khung nào đọc được")
+        stats = summarize(results)
+        peak_result, peak_frame = peak
+        
+        if store:
+            try:
+                self.results_store.add(
+                    image_path,
+                    peak_result['detections'],
+                    model=self.detector.model_name,
+                    confidence=confidence
+                )
+            except Exception as e:
+                print(f"Không thể lưu kết quả: {e}")
+        
+        pyramid = ImagePyramid(peak_frame)
+        
+        def update_ui():
+            self._display_image(pyramid, peak_result['detections'])
+            self.count_label.config(
+                text=f"👤 Tối đa {stats['max']} khuôn mặt (khung {stats['peak_index'] + 1}), "
+                     f"trung bình {stats['mean']:.1f} / {stats['frames']} khung",
+                fg="#4ecca3" if stats['max'] else "#ff6b6b"
+            )
+            self.status_label.config(text="✅ Hoàn tất!", fg="#4ecca3")
+            self.select_btn.config(state=tk.NORMAL)
+            
+        self.root.after(0, update_ui)
         
-        # Ẩn placeholder
-        self.canvas.itemconfig(self.placeholder_id, state='hidden')
+    def _process_batch(self, image_paths: list):
+        """Xử lý nhiều ảnh qua pipeline, hiển thị từng kết quả khi xong"""
+        total = len(image_paths)
+        self.status_label.config(text=f"⏳ Đang xử lý 0/{total} ảnh...", fg="#ffd93d")
+        self.count_label.config(text="")
+        self.select_btn.config(state=tk.DISABLED)
         
-        # Lấy kích thước canvas
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
+        # Annotation do canvas vẽ theo tile khi hiển thị -> pipeline chỉ cần ảnh đã decode
+        # ROI theo từng ảnh giống chế độ một ảnh: vùng vẽ tay trước, sau đó cấu hình/profile của ảnh
+        manual_rois = self.rois
+        confidence = self.confidence.get()
+        pipeline = DetectionPipeline(
+            self.detector, confidence=confidence, draw=False, keep_frames=True,
+            regions_for=lambda path: manual_rois or self.roi_config.rois_for(path)
+        )
+        progress = {'done': 0, 'faces': 0, 'errors': 0}
+        # Chỉ giữ ảnh mới nhất chờ hiển thị: UI chậm hơn pipeline thì ảnh cũ bị bỏ qua
+        # thay vì dồn nhiều pyramid trong bộ nhớ
+        latest = {'entry': None}
+        
+        def on_result(result):
+            # Lưu lịch sử và dựng pyramid ngay trong thread nền
+            frame = result.pop('frame', None)
+            entry = None
+            if result['error'] is None:
+                entry = [ImagePyramid(frame), result['detections']]
+                del frame
+                previous, latest['entry'] = latest['entry'], entry
+                if previous is not None:
+                    previous[0] = None
+                try:
+                    self.results_store.add(
+                        result['path'],
+                        result['detections'],
+                        model=self.detector.model_name,
+                        confidence=confidence
+                    )
+                except Exception as e:
+                    print(f"Không thể lưu kết quả: {e}")
+            
+            def update_ui():
+                progress['done'] += 1
+                if result['error'] is None:
+                    progress['faces'] += len(result['detections'])
+                    if entry[0] is not None:
+                        self.current_image_path = result['path']
+                        self._display_image(entry[0], entry[1])
+                        entry[0] = None
+                    self.count_label.config(
+                        text=f"👤 {len(result['detections'])} khuôn mặt "
+                             f"({os.path.basename(result['path'])})",
+                        fg="#4ecca3"
+                    )
+                else:
+                    progress['errors'] += 1
+                self.status_label.config(
+                    text=f"⏳ Đang xử lý {progress['done']}/{total} ảnh...",
+                    fg="#ffd93d"
+                )
+                
+            self.root.after(0, update_ui)
+            
+        def on_done():
+            def finish():
+                text = f"✅ Hoàn tất {total} ảnh, tổng {progress['faces']} khuôn mặt"
+                if progress['errors']:
+                    text += f" ({progress['errors']} lỗi)"
+                self.status_label.config(text=text, fg="#4ecca3")
+                self.select_btn.config(state=tk.NORMAL)
+                
+            self.root.after(0, finish)
+            
+        pipeline.run_in_background(image_paths, on_result, on_done)
+        
+    def _display_image(self, pyramid: ImagePyramid, detections: list):
+        """Hiển thị ảnh kết quả trên canvas (vừa khung, có zoom/pan)"""
+        
+        # Ẩn placeholder và khung trực tiếp cuối cùng (nếu có)
+        self.canvas.itemconfig(self.placeholder_id, state='hidden')
+        self.canvas.delete("live")
+        self.view.set_image(pyramid, detections)
+        
+    # ------------------------------------------------------------------
+    # Vùng đếm (ROI)
+    # ------------------------------------------------------------------
+    def _toggle_roi_mode(self):
+        """Bật/tắt chế độ kéo chuột để vẽ vùng đếm"""
+        self.roi_mode = not self.roi_mode
+        self.roi_btn.config(bg=self.accent_color if self.roi_mode else self.secondary_bg)
+        self.canvas.config(cursor="crosshair" if self.roi_mode else "")
+        if self.roi_mode:
+            self.status_label.config(text="▭ Kéo chuột trên ảnh để thêm vùng đếm", fg="#ffd93d")
+        
+    def _clear_rois(self):
+        """Bỏ mọi vùng đếm và detect lại trên cả ảnh"""
+        if not self.rois:
+            return
+        self.rois = []
+        self.canvas.delete("roi")
+        self._rerun_current()
+        
+    def _to_image_fraction(self, x: int, y: int) -> tuple:
+        """Toạ độ canvas -> toạ độ tỉ lệ 0-1 trên ảnh"""
+        image_x, image_y = self.view.canvas_to_image(x, y)
+        return (
+            min(1.0, max(0.0, image_x / self.view.pyramid.width)),
+            min(1.0, max(0.0, image_y / self.view.pyramid.height))
+        )
         
-        if canvas_width < 10 or canvas_height < 10:
+    def _draw_rois(self):
+        """Vẽ viền các vùng đếm lên canvas (theo zoom/pan hiện tại)"""
+        self.canvas.delete("roi")
+        if not self.view.has_image:
             return
+        width, height = self.view.pyramid.width, self.view.pyramid.height
+        for x1, y1, x2, y2 in self.rois:
+            self.canvas.create_rectangle(
+                *self.view.image_to_canvas(x1 * width, y1 * height),
+                *self.view.image_to_canvas(x2 * width, y2 * height),
+                outline="#ffd93d", width=2, dash=(6, 4), tags="roi"
+            )
+        
+    def _on_roi_press(self, event):
+        if not self.roi_mode:
+            self._press_pos = (event.x, event.y)
+            self.view.start_pan(event.x, event.y)
+        elif self.view.has_image:
+            self._drag_start = (event.x, event.y)
             
-        # Tính toán kích thước mới giữ tỉ lệ
-        img_width, img_height = image.size
+    def _on_roi_drag(self, event):
+        if self._drag_start is None:
+            self.view.drag_pan(event.x, event.y)
+            return
+        self.canvas.delete("roi_drag")
+        self.canvas.create_rectangle(
+            *self._drag_start, event.x, event.y,
+            outline="#ffd93d", width=2, tags="roi_drag"
+        )
         
-        ratio = min(
-            (canvas_width - 20) / img_width,
-            (canvas_height - 20) / img_height
+    def _on_roi_release(self, event):
+        if self._drag_start is None:
+            # Nhấn rồi thả gần như tại chỗ = click chọn khuôn mặt
+            if self._press_pos is not None and \
+                    abs(event.x - self._press_pos[0]) + abs(event.y - self._press_pos[1]) <= 3:
+                self._show_detection(self.view.select_at(event.x, event.y))
+            self._press_pos = None
+            return
+        self.canvas.delete("roi_drag")
+        fx1, fy1 = self._to_image_fraction(*self._drag_start)
+        fx2, fy2 = self._to_image_fraction(event.x, event.y)
+        self._drag_start = None
+        rect = [min(fx1, fx2), min(fy1, fy2), max(fx1, fx2), max(fy1, fy2)]
+        if rect[2] - rect[0] < 0.01 or rect[3] - rect[1] < 0.01:
+            return
+        self.rois.append(rect)
+        self._draw_rois()
+        self._rerun_current()
+        
+    # ------------------------------------------------------------------
+    # Đếm trực tiếp (camera/stream)
+    # ------------------------------------------------------------------
+    def _toggle_live(self):
+        if self.live is not None:
+            self._stop_live("⏹ Đã dừng đếm trực tiếp")
+            return
+        source = simpledialog.askstring(
+            "Đếm trực tiếp",
+            "Chỉ số camera (0, 1...), URL rtsp://... / http://... hoặc đường dẫn file video:",
+            parent=self.root
         )
+        if not source:
+            return
+        source = source.strip()
+        detector = RoiDetector(self.detector, self.rois) if self.rois else self.detector
+        live = LiveCounter(detector, source, self.confidence.get(), on_result=self._on_live_result)
+        try:
+            live.start()
+        except ValueError as e:
+            messagebox.showerror("Lỗi", str(e))
+            return
         
-        new_width = int(img_width * ratio)
-        new_height = int(img_height * ratio)
+        self.live = live
+        self.view.clear()
+        self.canvas.itemconfig(self.placeholder_id, state='hidden')
+        self.live_btn.config(text="⏹ Dừng", bg=self.accent_color)
+        self.select_btn.config(state=tk.DISABLED)
+        self.status_label.config(text=f"📹 Đang đếm trực tiếp: {source}", fg="#4ecca3")
+        self.root.after(500, self._watch_live)
         
-        # Resize ảnh
-        resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    def _stop_live(self, message: str):
+        live, self.live = self.live, None
+        if live is None:
+            return
+        # Dừng trong thread nền: có thể phải chờ lượt detect đang chạy
+        threading.Thread(target=live.stop, daemon=True).start()
+        self.live_btn.config(text="📹 Trực tiếp", bg=self.secondary_bg)
+        self.select_btn.config(state=tk.NORMAL)
+        self.status_label.config(text=message, fg="#4ecca3")
+        
+    def _watch_live(self):
+        """Phát hiện nguồn đã kết thúc (hết file video)"""
+        if self.live is None:
+            return
+        if not self.live.running:
+            self._stop_live("✅ Nguồn video đã kết thúc")
+            return
+        self.root.after(500, self._watch_live)
+        
+    def _on_live_result(self, result):
+        """Gọi từ thread inference: vẽ sẵn khung vừa canvas, chỉ giữ kết quả mới nhất"""
+        frame = result.pop('frame')
+        canvas_width, canvas_height = self._canvas_size
+        height, width = frame.shape[:2]
+        scale = min(1.0, canvas_width / width, canvas_height / height)
+        result['pixels'] = default_annotator.annotate(
+            frame, result['detections'], max_size=max(1, int(max(width, height) * scale))
+        )
+        self._live_latest = result
+        if not self._live_scheduled:
+            self._live_scheduled = True
+            self.root.after(0, self._show_live_frame)
+            
+    def _show_live_frame(self):
+        self._live_scheduled = False
+        result, self._live_latest = self._live_latest, None
+        if result is None or self.live is None:
+            return
+        self._live_photo = ImageTk.PhotoImage(Image.fromarray(result['pixels']))
+        self.canvas.delete("live")
+        width, height = self._canvas_size
+        self.canvas.create_image(width // 2, height // 2, image=self._live_photo,
+                                 anchor=tk.CENTER, tags="live")
+        # Độ trễ tới lúc khung thực sự lên màn hình
+        shown_ms = (time.perf_counter() - result['captured_at']) * 1000
+        self.count_label.config(
+            text=f"👤 {result['count']} (TB {result['rolling']:.1f})",
+            fg="#4ecca3" if result['count'] else "#ff6b6b"
+        )
+        self.status_label.config(
+            text=f"📹 {result['fps']:.1f} khung/s · trễ {result['latency_ms']:.0f} ms "
+                 f"(hiển thị {shown_ms:.0f} ms) · bỏ {result['dropped']} khung",
+            fg="#4ecca3"
+        )
         
-        # Convert sang PhotoImage
-        self.photo_image = ImageTk.PhotoImage(resized)
+    # ------------------------------------------------------------------
+    # Hover / chọn khuôn mặt
+    # ------------------------------------------------------------------
+    def _on_canvas_motion(self, event):
+        if self.roi_mode or event.state & 0x0100:  # Đang vẽ vùng hoặc đang kéo ảnh
+            return
+        det = self.view.hover_at(event.x, event.y)
+        self.canvas.config(cursor="hand2" if det is not None else "")
         
-        # Xóa ảnh cũ và vẽ ảnh mới
-        self.canvas.delete("image")
-        self.canvas.create_image(
-            canvas_width // 2,
-            canvas_height // 2,
-            image=self.photo_image,
-            anchor=tk.CENTER,
-            tags="image"
+    def _show_detection(self, det):
+        """Hiện thông tin khuôn mặt đang chọn trên thanh trạng thái"""
+        if det is None:
+            return
+        x1, y1, x2, y2 = (int(v) for v in det['bbox'])
+        self.status_label.config(
+            text=f"👤 #{det['number']} - độ tin cậy {det['confidence']:.0%}, "
+                 f"{x2 - x1}x{y2 - y1}px tại ({x1}, {y1})",
+            fg=self.text_color
         )
+        
+    def _rerun_current(self):
+        """
+        Detect lại ảnh đang hiển thị với vùng đếm/ngưỡng hiện tại
+        (không ghi lịch sử: mỗi lần kéo thanh ngưỡng không phải một lần đếm mới)
+        """
+        if self.current_image_path and self.detector is not None \
+                and str(self.select_btn['state']) == tk.NORMAL:
+            self._process_image(self.current_image_path, store=False)
 
 
 def main():
@@ -0,0 +1,139 @@
+"""
+Async Detector Module
+API asyncio cho PersonDetector, dùng trong các service aiohttp/FastAPI
+mà không chặn event loop
+"""
+
+import asyncio
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+async def _aiter(items):
+    """Chuyển iterable thường hoặc async iterable thành async iterator"""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+class AsyncPersonDetector:
+    """
+    Wrapper asyncio cho PersonDetector
+
+    - Decode ảnh trên thread pool riêng
+    - Inference trên một executor chuyên dụng (model không thread-safe)
+    - Giới hạn số ảnh đang xử lý cùng lúc (max_in_flight)
+
+    Ví dụ:
+        async with AsyncPersonDetector() as detector:
+            detections = await detector.detect("photo.jpg")
+            async for path, detections in detector.detect_many(paths):
+                ...
+    """
+
+    def __init__(self, detector=None, max_in_flight: int = 4, decode_workers: int = 2):
+        """
+        Args:
+            detector: PersonDetector đã khởi tạo (mặc định: tạo mới)
+            max_in_flight: Số ảnh tối đa đang decode/inference cùng lúc
+            decode_workers: Số thread decode ảnh
+        """
+        if detector is None:
+            from person_detector import PersonDetector
+            detector = PersonDetector()
+        self.detector = detector
+        self.max_in_flight = max(1, max_in_flight)
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._decode_pool = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        self._inference_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+    @classmethod
+    async def create(cls, max_in_flight: int = 4, decode_workers: int = 2, **detector_kwargs):
+        """Tạo detector mà không chặn event loop trong lúc load model"""
+        from person_detector import PersonDetector
+        loop = asyncio.get_running_loop()
+        detector = await loop.run_in_executor(None, functools.partial(PersonDetector, **detector_kwargs))
+        return cls(detector, max_in_flight=max_in_flight, decode_workers=decode_workers)
+
+    async def detect(self, image, confidence: float = 0.3, **kwargs) -> list:
+        """
+        Phát hiện khuôn mặt (bất đồng bộ)
+
+        Args:
+            image: Đường dẫn ảnh hoặc ảnh BGR (numpy array)
+            confidence: Ngưỡng confidence tối thiểu (0-1)
+            **kwargs: Tham số khác truyền cho PersonDetector.detect
+
+        Returns:
+            List detection giống PersonDetector.detect
+        """
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            if isinstance(image, str):
+                image = await loop.run_in_executor(self._decode_pool, self.detector._load_image, image)
+            return await loop.run_in_executor(
+                self._inference_pool,
+                functools.partial(self.detector.detect, image, confidence, **kwargs)
+            )
+
+    async def detect_many(self, images, confidence: float = 0.3, ordered: bool = True, **kwargs):
+        """
+        Xử lý nhiều ảnh, trả về kết quả qua `async for`
+
+        Args:
+            images: Iterable hoặc async iterable các đường dẫn/ảnh
+            confidence: Ngưỡng confidence tối thiểu (0-1)
+            ordered: Giữ đúng thứ tự đầu vào (False: trả về theo thứ tự hoàn thành)
+
+        Yields:
+            (image, detections)
+        """
+        if ordered:
+            pending = deque()
+        else:
+            pending = set()
+
+        async def run(item):
+            return item, await self.detect(item, confidence, **kwargs)
+
+        try:
+            async for item in _aiter(images):
+                task = asyncio.ensure_future(run(item))
+                if ordered:
+                    pending.append(task)
+                    if len(pending) >= self.max_in_flight:
+                        yield await pending.popleft()
+                else:
+                    pending.add(task)
+                    if len(pending) >= self.max_in_flight:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for finished in done:
+                            yield finished.result()
+
+            while pending:
+                if ordered:
+                    yield await pending.popleft()
+                else:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for finished in done:
+                        yield finished.result()
+        finally:
+            # Consumer dừng sớm hoặc có lỗi -> huỷ các task còn lại
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        """Giải phóng các executor"""
+        self._decode_pool.shutdown(wait=False)
+        self._inference_pool.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.close)
@@ -0,0 +1,311 @@
+"""
+CPU Scheduler Module
+Chia CPU cho nhiều worker inference: số worker x số thread mỗi worker,
+gán core/NUMA node cố định và đặt số thread của OpenCV/torch/OpenMP đồng nhất
+
+Cách sử dụng:
+    python cpu_scheduler.py show
+    python cpu_scheduler.py autotune <thư mục ảnh> --samples 32
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+from model_registry import data_path
+
+PLAN_PATH = data_path("cpu_plan.json")
+
+# Các biến môi trường thread pool mà torch/OpenCV/numpy đọc lúc import
+_THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS',
+)
+
+
+def _parse_cpulist(text: str) -> list:
+    """Đọc danh sách CPU dạng '0-3,8-11'"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _available_cpus() -> list:
+    """Các CPU process được phép chạy"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    try:
+        import psutil
+        return sorted(psutil.Process().cpu_affinity())
+    except Exception:
+        return list(range(os.cpu_count() or 1))
+
+
+def detect_topology() -> dict:
+    """
+    Đọc cấu trúc CPU của máy
+
+    Returns:
+        Dict:
+        - nodes: list NUMA node, mỗi node là list core vật lý,
+                 mỗi core là list CPU logic (hyper-thread) thuộc core đó
+        - logical: tổng số CPU logic khả dụng
+    """
+    available = set(_available_cpus())
+    node_dirs = sorted(glob.glob('/sys/devices/system/node/node[0-9]*'))
+    nodes = []
+
+    if node_dirs:
+        # Linux: đọc NUMA node và core_id từ sysfs
+        for node_dir in node_dirs:
+            with open(os.path.join(node_dir, 'cpulist')) as f:
+                node_cpus = [c for c in _parse_cpulist(f.read()) if c in available]
+            cores = {}
+            for cpu in node_cpus:
+                try:
+                    with open(f'/sys/devices/system/cpu/cpu{cpu}/topology/core_id') as f:
+                        core_id = int(f.read())
+                    with open(f'/sys/devices/system/cpu/cpu{cpu}/topology/physical_package_id') as f:
+                        package_id = int(f.read())
+                except OSError:
+                    core_id, package_id = cpu, 0
+                cores.setdefault((package_id, core_id), []).append(cpu)
+            if cores:
+                nodes.append([sorted(c) for _, c in sorted(cores.items())])
+    else:
+        # Windows/macOS: không có sysfs, ước lượng hyper-thread qua psutil nếu có
+        cpus = sorted(available)
+        physical = None
+        try:
+            import psutil
+            physical = psutil.cpu_count(logical=False)
+        except Exception:
+            pass
+        per_core = max(1, len(cpus) // physical) if physical else 1
+        nodes.append([cpus[i:i + per_core] for i in range(0, len(cpus), per_core)])
+
+    if not nodes:
+        nodes = [[[cpu] for cpu in sorted(available)]]
+    return {'nodes': nodes, 'logical': len(available)}
+
+
+class CpuScheduler:
+    """Lập kế hoạch worker/thread và gán core cho inference nhiều worker"""
+
+    def __init__(self, topology: dict = None):
+        self.topology = topology or detect_topology()
+
+    @property
+    def physical_cores(self) -> int:
+        return sum(len(node) for node in self.topology['nodes'])
+
+    def plan(self, workers: int = None, threads_per_worker: int = None,
+             use_hyperthreads: bool = False) -> list:
+        """
+        Chia core vật lý thành các nhóm không chồng lấp, mỗi nhóm cho một worker
+
+        Nhóm không vượt qua ranh giới NUMA node khi đủ core. Mặc định chỉ dùng
+        một hyper-thread mỗi core (inference dày đặc không lợi từ SMT).
+
+        Args:
+            workers: Số worker (mặc định: theo threads_per_worker hoặc 4 core mỗi worker)
+            threads_per_worker: Số thread intra-op mỗi worker
+            use_hyperthreads: Dùng cả các CPU logic anh em của mỗi core
+
+        Returns:
+            List dict {'cpus': [...], 'threads': n, 'node': i}, một phần tử mỗi worker
+        """
+        total = self.physical_cores
+        if workers is None:
+            workers = max(1, total // (threads_per_worker or 4))
+        workers = max(1, min(workers, total))
+        if threads_per_worker is None:
+            threads_per_worker = max(1, total // workers)
+
+        # Phân bổ worker cho từng node theo tỉ lệ số core; worker cần nhiều
+        # core hơn một node thì đành trải trên nhiều node
+        nodes = self.topology['nodes']
+        if threads_per_worker > max(len(node) for node in nodes):
+            nodes = [[core for node in nodes for core in node]]
+        plans = []
+        remaining = workers
+        for index, node in enumerate(nodes):
+            left_nodes = len(nodes) - index
+            node_workers = remaining if left_nodes == 1 else round(workers * len(node) / total)
+            node_workers = max(0, min(node_workers, remaining, len(node)))
+            if node_workers == 0:
+                continue
+            per_worker = max(1, min(threads_per_worker, len(node) // node_workers))
+            for w in range(node_workers):
+                cores = node[w * per_worker:(w + 1) * per_worker]
+                cpus = [cpu for core in cores for cpu in (core if use_hyperthreads else core[:1])]
+                plans.append({'cpus': cpus, 'threads': len(cpus), 'node': index})
+            remaining -= node_workers
+        return plans
+
+    def save(self, plan: list, path: str = PLAN_PATH):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'plan': plan}, f, indent=1)
+
+    @staticmethod
+    def load(path: str = PLAN_PATH):
+        """Đọc plan đã autotune (None nếu chưa có)"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['plan']
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def set_thread_env(threads: int):
+    """
+    Đặt biến môi trường thread pool - phải gọi TRƯỚC khi import cv2/torch
+    trong process worker thì OpenMP/MKL mới đọc được
+    """
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+
+def apply_thread_limits(threads: int):
+    """
+    Đặt số thread intra-op của torch/OpenCV/OpenMP cho process hiện tại
+
+    Với các worker dạng thread trong cùng process (torch dùng chung một
+    thread pool), gọi với tổng core chia cho số worker để tránh oversubscription.
+    """
+    threads = max(1, threads)
+    set_thread_env(threads)
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            # Chỉ đặt được trước khi torch chạy tác vụ song song đầu tiên
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+    except ImportError:
+        pass
+
+
+def apply_worker_plan(worker_plan: dict):
+    """
+    Áp dụng plan trong process worker: gán CPU, đặt số thread torch/OpenCV
+
+    Args:
+        worker_plan: Một phần tử trả về từ CpuScheduler.plan()
+    """
+    cpus = worker_plan.get('cpus')
+    if cpus:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        else:
+            try:
+                import psutil
+                psutil.Process().cpu_affinity(cpus)
+            except Exception:
+                pass
+    apply_thread_limits(worker_plan['threads'])
+
+
+def threads_per_worker(workers: int) -> int:
+    """Số thread intra-op mỗi worker khi chia đều core vật lý"""
+    return max(1, CpuScheduler().physical_cores // max(1, workers))
+
+
+def autotune(image_paths: list, samples: int = 32, max_workers: int = None, **detector_kwargs) -> list:
+    """
+    Đo throughput thực tế cho các cách chia worker x thread
+
+    Args:
+        image_paths: Ảnh dùng để đo
+        samples: Số ảnh mỗi lần đo
+        max_workers: Số worker tối đa thử
+        **detector_kwargs: Tham số cho PersonDetector
+
+    Returns:
+        List (ảnh/giây, workers, threads_per_worker), tốt nhất trước
+    """
+    from shm_transport import SharedMemoryDetectorPool
+
+    scheduler = CpuScheduler()
+    cores = scheduler.physical_cores
+    images = (image_paths * (samples // max(1, len(image_paths)) + 1))[:samples]
+
+    splits = []
+    threads = 1
+    while threads <= cores:
+        workers = cores // threads
+        if max_workers is None or workers <= max_workers:
+            splits.append((workers, threads))
+        threads *= 2
+
+    results = []
+    for workers, threads in splits:
+        plan = scheduler.plan(workers, threads)
+        with SharedMemoryDetectorPool(workers=workers, cpu_plan=plan, **detector_kwargs) as pool:
+            # Khởi động (load model, warm-up) không tính vào thời gian đo
+            for _ in pool.map(images[:workers]):
+                pass
+            start = time.perf_counter()
+            for _ in pool.map(images):
+                pass
+            elapsed = time.perf_counter() - start
+        rate = len(images) / elapsed
+        results.append((rate, workers, threads))
+        print(f"  {workers:>3} worker x {threads:>2} thread: {rate:.2f} ảnh/s")
+    return sorted(results, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lập kế hoạch CPU cho inference nhiều worker")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    show = sub.add_parser("show", help="Xem cấu trúc CPU và plan mặc định")
+    show.add_argument("--workers", type=int, default=None)
+    show.add_argument("--threads", type=int, default=None)
+
+    tune = sub.add_parser("autotune", help="Đo và lưu cách chia tốt nhất")
+    tune.add_argument("image_dir", help="Thư mục ảnh mẫu")
+    tune.add_argument("--samples", type=int, default=32, help="Số ảnh mỗi lần đo")
+    tune.add_argument("--max-workers", type=int, default=None)
+    tune.add_argument("--save", default=PLAN_PATH, help="File lưu plan")
+
+    args = parser.parse_args()
+    scheduler = CpuScheduler()
+
+    if args.command == "show":
+        topo = scheduler.topology
+        print(f"{len(topo['nodes'])} NUMA node, {scheduler.physical_cores} core, {topo['logical']} CPU logic")
+        for i, plan in enumerate(scheduler.plan(args.workers, args.threads)):
+            print(f"  worker {i}: node {plan['node']}, {plan['threads']} thread, CPU {plan['cpus']}")
+        return
+
+    from pipeline import _expand_paths
+    paths = _expand_paths([args.image_dir])
+    if not paths:
+        print("Không tìm thấy ảnh nào")
+        sys.exit(1)
+    results = autotune(paths, args.samples, args.max_workers)
+    rate, workers, threads = results[0]
+    print(f"Tốt nhất: {workers} worker x {threads} thread ({rate:.2f} ảnh/s)")
+    scheduler.save(scheduler.plan(workers, threads), args.save)
+    print(f"Đã lưu plan vào {args.save}")
+
+
+if __name__ == "__main__":
+    main()
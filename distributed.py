@@ -0,0 +1,632 @@
+"""
+Distributed Module
+Chia việc detect cho nhiều máy: coordinator giữ danh sách ảnh (chia thành các
+work unit) và cho worker thuê (lease) qua HTTP; lease hết hạn thì unit được giao lại
+
+Cách sử dụng:
+    # Máy điều phối
+    python distributed.py coordinator --db jobs.db --add manifest.txt --host 0.0.0.0 --port 8750 --secret abc
+    # Mỗi máy worker (ảnh trên ổ dùng chung, hoặc --fetch để tải ảnh qua coordinator)
+    python distributed.py worker http://coordinator:8750 --secret abc --path-map D:/anh=/mnt/anh
+    # Theo dõi / xuất kết quả vào lịch sử SQLite
+    python distributed.py status --db jobs.db
+    python distributed.py export --db jobs.db --results-db face_counter_results.db
+    # Chạy thử trên một máy với nhiều worker process
+    python distributed.py local manifest.txt --workers 3
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import socket
+import ipaddress
+import sqlite3
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_PORT = 8750
+UNIT_SIZE = 64
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    paths TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    token TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_units_status ON units(status);
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT PRIMARY KEY,
+    unit_id INTEGER NOT NULL,
+    worker TEXT,
+    count INTEGER,
+    detections TEXT,
+    error TEXT,
+    model TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class Coordinator:
+    """
+    Trạng thái công việc trong SQLite (không giữ cả manifest trong bộ nhớ)
+
+    - Unit: nhóm UNIT_SIZE ảnh, được thuê kèm token và thời hạn
+    - Worker gia hạn lease định kỳ; lease quá hạn -> unit trở lại pending
+      (tối đa MAX_ATTEMPTS lần, sau đó failed)
+    - Kết quả khoá theo path: nộp lại (worker chậm, lease đã bị giao lại)
+      không tạo bản ghi trùng
+    """
+
+    def __init__(self, db_path: str, unit_size: int = UNIT_SIZE,
+                 lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = db_path
+        # Giới hạn số tham số của một câu SQL khi kiểm tra unit đã xong
+        self.unit_size = min(max(1, unit_size), 900)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+    def add_paths(self, paths) -> int:
+        """Chia danh sách ảnh (iterable, đọc dần) thành các unit; trả về số unit mới"""
+        created = 0
+        chunk = []
+
+        def flush():
+            nonlocal created
+            with self._lock, self._conn:
+                self._conn.execute("INSERT INTO units (paths) VALUES (?)", (json.dumps(chunk, ensure_ascii=False),))
+            created += 1
+            chunk.clear()
+
+        for path in paths:
+            chunk.append(path)
+            if len(chunk) >= self.unit_size:
+                flush()
+        if chunk:
+            flush()
+        return created
+
+    # ------------------------------------------------------------------
+    # Lease
+    # ------------------------------------------------------------------
+    def _expire_leases(self, now: float):
+        """Unit của worker không còn gia hạn -> giao lại hoặc đánh dấu failed"""
+        self._conn.execute(
+            "UPDATE units SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "token = NULL, worker = NULL, lease_expires = NULL "
+            "WHERE status = ? AND lease_expires < ?",
+            (self.max_attempts, STATUS_FAILED, STATUS_PENDING, STATUS_LEASED, now)
+        )
+
+    def lease(self, worker: str, max_units: int = 1) -> dict:
+        """
+        Cho worker thuê tối đa max_units unit
+
+        Returns:
+            {'units': [{'id', 'token', 'paths', 'lease_seconds'}], 'done': bool}
+            done=True khi không còn unit pending hay leased nào
+        """
+        now = time.time()
+        units = []
+        with self._lock, self._conn:
+            self._expire_leases(now)
+            rows = self._conn.execute(
+                "SELECT id, paths FROM units WHERE status = ? ORDER BY id LIMIT ?",
+                (STATUS_PENDING, max(1, max_units))
+            ).fetchall()
+            for row in rows:
+                token = uuid.uuid4().hex
+                self._conn.execute(
+                    "UPDATE units SET status = ?, token = ?, worker = ?, lease_expires = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (STATUS_LEASED, token, worker, now + self.lease_seconds, row['id'])
+                )
+                units.append({'id': row['id'], 'token': token, 'paths': json.loads(row['paths']),
+                              'lease_seconds': self.lease_seconds})
+            done = not units and self._conn.execute(
+                "SELECT 1 FROM units WHERE status IN (?, ?) LIMIT 1", (STATUS_PENDING, STATUS_LEASED)
+            ).fetchone() is None
+        return {'units': units, 'done': done}
+
+    def renew(self, unit_id: int, token: str) -> bool:
+        """Gia hạn lease; False nếu lease đã hết hạn và unit đã được giao cho worker khác"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE units SET lease_expires = ? WHERE id = ? AND token = ? AND status = ?",
+                (time.time() + self.lease_seconds, unit_id, token, STATUS_LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, unit_id: int, token: str, worker: str, results: list, model: str = None) -> dict:
+        """
+        Gộp kết quả của một unit (idempotent)
+
+        Kết quả được nhận kể cả khi lease đã hết hạn: ảnh đã có kết quả thì giữ
+        bản ghi đầu tiên. Unit chuyển sang done khi mọi ảnh của nó đã có kết quả.
+
+        Returns:
+            {'accepted': số kết quả mới, 'duplicates': số kết quả đã có}
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT paths FROM units WHERE id = ?", (unit_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Không có unit {unit_id}")
+            allowed = set(json.loads(row['paths']))
+
+            accepted = 0
+            for r in results:
+                if r['path'] not in allowed:
+                    continue
+                # Kết quả đầu tiên được giữ; chỉ ghi đè khi bản cũ là lỗi và bản mới thành công
+                cursor = self._conn.execute(
+                    "INSERT INTO results (path, unit_id, worker, count, detections, error, model, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET unit_id = excluded.unit_id, worker = excluded.worker, "
+                    "count = excluded.count, detections = excluded.detections, error = NULL, "
+                    "model = excluded.model, created_at = excluded.created_at "
+                    "WHERE results.error IS NOT NULL AND excluded.error IS NULL",
+                    (r['path'], unit_id, worker,
+                     None if r.get('error') else len(r['detections']),
+                     None if r.get('error') else json.dumps(r['detections'], separators=(',', ':')),
+                     r.get('error'), model, now)
+                )
+                accepted += cursor.rowcount
+
+            placeholders = ",".join("?" * len(allowed))
+            finished = self._conn.execute(
+                f"SELECT COUNT(*) FROM results WHERE path IN ({placeholders})", list(allowed)
+            ).fetchone()[0]
+            if finished >= len(allowed):
+                self._conn.execute(
+                    "UPDATE units SET status = ?, token = NULL, lease_expires = NULL WHERE id = ?",
+                    (STATUS_DONE, unit_id)
+                )
+            elif token:
+                # Nộp thiếu -> trả unit về pending để worker khác làm nốt
+                self._conn.execute(
+                    "UPDATE units SET status = ?, token = NULL, lease_expires = NULL "
+                    "WHERE id = ? AND token = ?",
+                    (STATUS_PENDING, unit_id, token)
+                )
+        return {'accepted': accepted, 'duplicates': len(results) - accepted}
+
+    def unit_paths(self, unit_id: int) -> list:
+        with self._lock:
+            row = self._conn.execute("SELECT paths FROM units WHERE id = ?", (unit_id,)).fetchone()
+        return json.loads(row['paths']) if row else []
+
+    def status(self) -> dict:
+        with self._lock:
+            units = dict(self._conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+            images, errors, faces = self._conn.execute(
+                "SELECT COUNT(*), COUNT(error), COALESCE(SUM(count), 0) FROM results"
+            ).fetchone()
+        return {'units': units, 'images': images, 'errors': errors, 'faces': faces}
+
+    def iter_results(self, batch: int = 1000):
+        """Đọc kết quả theo từng khối (không nạp toàn bộ vào bộ nhớ)"""
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM results WHERE path > ? ORDER BY path LIMIT ?", (last, batch)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last = rows[-1]['path']
+
+
+# ----------------------------------------------------------------------
+# HTTP
+# ----------------------------------------------------------------------
+def _make_handler(coordinator: Coordinator, secret: str = None):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _authorized(self) -> bool:
+            token = self.headers.get('X-Token') or ''
+            if secret and not hmac.compare_digest(token.encode('utf-8'), secret.encode('utf-8')):
+                self._send_json({'error': 'unauthorized'}, 403)
+                return False
+            return True
+
+        def _send_json(self, data: dict, code: int = 200):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            url = urllib.parse.urlparse(self.path)
+            if url.path == '/status':
+                self._send_json(coordinator.status())
+            elif url.path == '/file':
+                # Chỉ phục vụ ảnh nằm trong manifest (unit + index), không nhận path tuỳ ý
+                query = urllib.parse.parse_qs(url.query)
+                try:
+                    paths = coordinator.unit_paths(int(query['unit'][0]))
+                    with open(paths[int(query['index'][0])], 'rb') as f:
+                        data = f.read()
+                except (KeyError, ValueError, IndexError, OSError) as e:
+                    self._send_json({'error': str(e)}, 404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            else:
+                self._send_json({'error': 'not found'}, 404)
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                if self.path == '/lease':
+                    self._send_json(coordinator.lease(request['worker'], request.get('max_units', 1)))
+                elif self.path == '/renew':
+                    self._send_json({'ok': coordinator.renew(request['id'], request['token'])})
+                elif self.path == '/complete':
+                    self._send_json(coordinator.complete(
+                        request['id'], request.get('token'), request['worker'],
+                        request['results'], request.get('model')
+                    ))
+                else:
+                    self._send_json({'error': 'not found'}, 404)
+            except (KeyError, ValueError) as e:
+                self._send_json({'error': str(e)}, 400)
+
+    return Handler
+
+
+def _is_loopback(host: str) -> bool:
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(coordinator: Coordinator, host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+          secret: str = None) -> ThreadingHTTPServer:
+    """
+    Tạo HTTP server cho coordinator (gọi serve_forever() để chạy)
+
+    Raises:
+        ValueError: Khi mở ra mạng (host không phải loopback) mà không có secret -
+                    /file trả ảnh và /complete nhận kết quả cho bất kỳ ai
+    """
+    if not secret and not _is_loopback(host):
+        raise ValueError(f"Phải đặt --secret khi coordinator lắng nghe trên {host}")
+    return ThreadingHTTPServer((host, port), _make_handler(coordinator, secret))
+
+
+# ----------------------------------------------------------------------
+# Worker
+# ----------------------------------------------------------------------
+class Worker:
+    """
+    Worker thuê unit, detect theo batch và nộp kết quả
+
+    Một thread nền gia hạn lease mỗi lease_seconds/3 trong khi unit đang xử lý.
+    """
+
+    def __init__(self, url: str, worker_id: str = None, detector=None,
+                 batch_size: int = 8, confidence: float = 0.3,
+                 path_map: list = None, fetch: bool = False, secret: str = None,
+                 poll_interval: float = 5.0):
+        """
+        Args:
+            url: Địa chỉ coordinator, vd: http://host:8750
+            worker_id: Tên worker (mặc định: hostname-pid)
+            detector: PersonDetector (mặc định: tạo mới)
+            batch_size: Số ảnh mỗi lần gọi model
+            confidence: Ngưỡng confidence
+            path_map: List (tiền tố trên coordinator, tiền tố trên máy này)
+            fetch: Tải ảnh qua coordinator thay vì đọc từ ổ dùng chung
+            secret: Token dùng chung với coordinator
+            poll_interval: Thời gian chờ khi chưa có unit trống (giây)
+        """
+        self.url = url.rstrip('/')
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.detector = detector
+        self.batch_size = max(1, batch_size)
+        self.confidence = confidence
+        self.path_map = path_map or []
+        self.fetch = fetch
+        self.secret = secret
+        self.poll_interval = poll_interval
+        self.processed = 0
+
+    def _request(self, path: str, payload: dict = None, raw: bool = False):
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        req = urllib.request.Request(self.url + path, data=data)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        if self.secret:
+            req.add_header('X-Token', self.secret)
+        with urllib.request.urlopen(req, timeout=60) as response:
+            body = response.read()
+        return body if raw else json.loads(body)
+
+    def _local_path(self, path: str) -> str:
+        for remote, local in self.path_map:
+            if path.startswith(remote):
+                return local + path[len(remote):]
+        return path
+
+    def _load(self, unit_id: int, index: int, path: str):
+        import cv2
+        import numpy as np
+
+        if self.fetch:
+            data = self._request(f"/file?unit={unit_id}&index={index}", raw=True)
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            frame = cv2.imread(self._local_path(path))
+        if frame is None:
+            raise ValueError(f"Không thể đọc ảnh: {path}")
+        return frame
+
+    def _process(self, unit: dict) -> list:
+        """Detect mọi ảnh của unit; lỗi từng ảnh được ghi vào kết quả của ảnh đó"""
+        results = []
+        paths = unit['paths']
+        for start in range(0, len(paths), self.batch_size):
+            frames, batch = [], []
+            for index in range(start, min(start + self.batch_size, len(paths))):
+                try:
+                    frames.append(self._load(unit['id'], index, paths[index]))
+                    batch.append(paths[index])
+                except Exception as e:
+                    results.append({'path': paths[index], 'error': str(e)})
+            if not frames:
+                continue
+            try:
+                detections = self.detector.detect_batch(frames, self.confidence)
+            except Exception:
+                # Một ảnh hỏng không làm hỏng cả batch: chạy lại từng ảnh
+                detections = []
+                for frame in frames:
+                    try:
+                        detections.append(self.detector.detect(frame, self.confidence))
+                    except Exception as e:
+                        detections.append(e)
+            for path, dets in zip(batch, detections):
+                if isinstance(dets, Exception):
+                    results.append({'path': path, 'error': str(dets)})
+                else:
+                    results.append({'path': path, 'detections': dets})
+        return results
+
+    def _keep_alive(self, unit: dict, stop: threading.Event):
+        interval = max(1.0, unit['lease_seconds'] / 3)
+        while not stop.wait(interval):
+            try:
+                self._request('/renew', {'id': unit['id'], 'token': unit['token']})
+            except (OSError, ValueError):
+                pass
+
+    def run(self):
+        """Vòng lặp chính: chạy tới khi coordinator báo hết việc"""
+        if self.detector is None:
+            from person_detector import PersonDetector
+            self.detector = PersonDetector()
+        model = getattr(self.detector, 'model_name', None)
+
+        while True:
+            try:
+                reply = self._request('/lease', {'worker': self.worker_id, 'max_units': 1})
+            except (OSError, ValueError) as e:
+                print(f"[{self.worker_id}] Không kết nối được coordinator: {e}")
+                time.sleep(self.poll_interval)
+                continue
+            if not reply['units']:
+                if reply['done']:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+
+            for unit in reply['units']:
+                stop = threading.Event()
+                keeper = threading.Thread(target=self._keep_alive, args=(unit, stop), daemon=True)
+                keeper.start()
+                try:
+                    results = self._process(unit)
+                finally:
+                    stop.set()
+                # Nộp lại vài lần nếu mạng chập chờn - coordinator gộp idempotent
+                for attempt in range(3):
+                    try:
+                        self._request('/complete', {'id': unit['id'], 'token': unit['token'],
+                                                    'worker': self.worker_id, 'model': model,
+                                                    'results': results})
+                        break
+                    except (OSError, ValueError) as e:
+                        print(f"[{self.worker_id}] Nộp unit {unit['id']} lỗi: {e}")
+                        time.sleep(2 ** attempt)
+                self.processed += len(results)
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+def _read_manifest(path: str):
+    """Manifest là file text (mỗi dòng một ảnh) hoặc thư mục ảnh"""
+    if os.path.isdir(path):
+        from pipeline import _expand_paths
+        yield from _expand_paths([path])
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def _print_status(status: dict):
+    units = status['units']
+    print(f"Unit: {units.get(STATUS_DONE, 0)} xong, {units.get(STATUS_LEASED, 0)} đang xử lý, "
+          f"{units.get(STATUS_PENDING, 0)} chờ, {units.get(STATUS_FAILED, 0)} lỗi")
+    print(f"Ảnh: {status['images']} ({status['errors']} lỗi), tổng {status['faces']} khuôn mặt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect phân tán trên nhiều máy")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    coord = sub.add_parser("coordinator", help="Chạy coordinator")
+    coord.add_argument("--db", default="jobs.db", help="File SQLite lưu trạng thái")
+    coord.add_argument("--add", help="Thêm manifest (file text hoặc thư mục) trước khi chạy")
+    coord.add_argument("--host", default="127.0.0.1",
+                       help="Địa chỉ lắng nghe (0.0.0.0: mọi card mạng, bắt buộc có --secret)")
+    coord.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coord.add_argument("--unit-size", type=int, default=UNIT_SIZE, help="Số ảnh mỗi unit")
+    coord.add_argument("--lease", type=float, default=LEASE_SECONDS, help="Thời hạn lease (giây)")
+    coord.add_argument("--secret", default=None, help="Token dùng chung với worker")
+
+    work = sub.add_parser("worker", help="Chạy worker")
+    work.add_argument("url", help="Địa chỉ coordinator")
+    work.add_argument("--id", default=None, help="Tên worker")
+    work.add_argument("--batch-size", type=int, default=8)
+    work.add_argument("--confidence", type=float, default=0.3)
+    work.add_argument("--path-map", action="append", default=[],
+                      help="Đổi tiền tố đường dẫn: <trên coordinator>=<trên máy này>")
+    work.add_argument("--fetch", action="store_true", help="Tải ảnh qua coordinator")
+    work.add_argument("--secret", default=None)
+
+    stat = sub.add_parser("status", help="Xem tiến độ")
+    stat.add_argument("--db", default="jobs.db")
+
+    export = sub.add_parser("export", help="Xuất kết quả vào lịch sử SQLite")
+    export.add_argument("--db", default="jobs.db")
+    export.add_argument("--results-db", default=None, help="File lịch sử (mặc định của results_store)")
+
+    local = sub.add_parser("local", help="Chạy coordinator + nhiều worker process trên máy này")
+    local.add_argument("manifest", help="File manifest hoặc thư mục ảnh")
+    local.add_argument("--db", default="jobs.db")
+    local.add_argument("--workers", type=int, default=2)
+    local.add_argument("--port", type=int, default=DEFAULT_PORT)
+    local.add_argument("--unit-size", type=int, default=UNIT_SIZE)
+
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        path_map = [tuple(item.split("=", 1)) for item in args.path_map]
+        worker = Worker(args.url, args.id, batch_size=args.batch_size, confidence=args.confidence,
+                        path_map=path_map, fetch=args.fetch, secret=args.secret)
+        worker.run()
+        print(f"[{worker.worker_id}] Hết việc, đã xử lý {worker.processed} ảnh")
+        return
+
+    if args.command in ("status", "export"):
+        coordinator = Coordinator(args.db)
+        if args.command == "status":
+            _print_status(coordinator.status())
+        else:
+            from results_store import ResultsStore, DEFAULT_DB_PATH
+            store = ResultsStore(args.results_db or DEFAULT_DB_PATH)
+            records, total = [], 0
+            for row in coordinator.iter_results():
+                if row['error'] is not None:
+                    continue
+                records.append({'path': row['path'], 'detections': json.loads(row['detections']),
+                                'model': row['model'], 'created_at': row['created_at']})
+                if len(records) >= 1000:
+                    store.add_many(records)
+                    total += len(records)
+                    records = []
+            if records:
+                store.add_many(records)
+                total += len(records)
+            store.close()
+            print(f"Đã xuất {total} kết quả")
+        coordinator.close()
+        return
+
+    unit_size = args.unit_size
+    lease = getattr(args, 'lease', LEASE_SECONDS)
+    coordinator = Coordinator(args.db, unit_size, lease)
+    manifest = args.add if args.command == "coordinator" else args.manifest
+    if manifest:
+        print(f"Đã tạo {coordinator.add_paths(_read_manifest(manifest))} unit")
+
+    host = args.host if args.command == "coordinator" else '127.0.0.1'
+    secret = args.secret if args.command == "coordinator" else None
+    try:
+        server = serve(coordinator, host, args.port, secret)
+    except ValueError as e:
+        print(e)
+        coordinator.close()
+        sys.exit(1)
+    print(f"Coordinator đang chạy tại http://{host}:{args.port}")
+
+    if args.command == "coordinator":
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            coordinator.close()
+        return
+
+    # local: các worker process đóng vai các máy
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{args.port}"
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", url, "--id", f"local-{i}"])
+        for i in range(max(1, args.workers))
+    ]
+    for p in processes:
+        p.wait()
+    server.shutdown()
+    server.server_close()
+    _print_status(coordinator.status())
+    coordinator.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,583 @@
+"""
+Downloader Module
+Tải file bằng nhiều kết nối HTTP Range song song, có thể tiếp tục khi bị ngắt,
+và giải nén các file trong zip ngay khi phần dữ liệu của chúng đã tải xong
+"""
+
+import os
+import json
+import shutil
+import time
+import struct
+import hashlib
+import zipfile
+import threading
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+USER_AGENT = 'FaceCounter/1.0'
+CHUNK_SIZE = 4 * 1024 * 1024  # 4MB mỗi range request
+READ_SIZE = 256 * 1024
+WRITE_BUFFER = 1024 * 1024  # Buffer ghi khi giải nén
+MAX_RETRIES = 5
+
+
+class DownloadError(Exception):
+    """Lỗi khi tải hoặc kiểm tra file"""
+
+
+def open_url(url: str, start: int = None, end: int = None, timeout: int = 30):
+    """Mở kết nối HTTP GET, có thể kèm header Range (end tính cả byte cuối)"""
+    headers = {'User-Agent': USER_AGENT}
+    if start is not None:
+        headers['Range'] = f"bytes={start}-{end}"
+    req = urllib.request.Request(url, headers=headers)
+    return urllib.request.urlopen(req, timeout=timeout)
+
+
+def probe(url: str) -> tuple:
+    """
+    Kiểm tra kích thước file và khả năng hỗ trợ Range của server
+
+    Returns:
+        (total_size, supports_ranges, validator) - validator là ETag/Last-Modified
+        dùng để biết file trên server có thay đổi giữa các lần tải hay không
+    """
+    with open_url(url, 0, 0) as response:
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified') or ""
+        content_range = response.headers.get('Content-Range', "")
+        if response.status == 206 and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            if total != '*':
+                return int(total), True, validator
+        return int(response.headers.get('Content-Length', 0)), False, validator
+
+
+def fetch_checksum(url: str):
+    """Đọc SHA-256 từ file .sha256 trên server (None nếu không có)"""
+    try:
+        with open_url(url, timeout=15) as response:
+            text = response.read(1024).decode('ascii', 'ignore').strip()
+    except Exception:
+        return None
+    token = text.split()[0].lower() if text else ""
+    return token if len(token) == 64 else None
+
+
+def sha256_file(path: str) -> str:
+    """Tính SHA-256 của file"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class RangedDownload:
+    """
+    Tải một file bằng nhiều kết nối song song
+
+    File được chia thành các chunk cố định, mỗi chunk tải bằng một Range request
+    và ghi thẳng vào vị trí của nó trong file đã cấp phát trước. Danh sách chunk
+    đã xong được lưu vào file .state nên lần chạy sau chỉ tải phần còn thiếu.
+    """
+
+    def __init__(self, url: str, path: str, connections: int = 4,
+                 chunk_size: int = CHUNK_SIZE, on_progress=None):
+        """
+        Args:
+            url: Địa chỉ file
+            path: Nơi lưu file
+            connections: Số kết nối song song
+            chunk_size: Kích thước mỗi range request
+            on_progress: Callback(downloaded, total) sau mỗi lần nhận dữ liệu
+        """
+        self.url = url
+        self.path = path
+        self.part_path = path + ".part"
+        self.state_path = path + ".state"
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+
+        self.total_size = 0
+        self.supports_ranges = False
+        self.downloaded = 0
+        self.finished = False
+        self.error = None
+
+        self._validator = ""
+        self._done = set()
+        self._order = deque()
+        self._lock = threading.Lock()
+        # Báo cho các thread chờ dữ liệu (vd: extractor) khi có chunk mới xong
+        self.changed = threading.Condition(self._lock)
+
+    # ------------------------------------------------------------------
+    # Trạng thái
+    # ------------------------------------------------------------------
+    def _num_chunks(self) -> int:
+        return (self.total_size + self.chunk_size - 1) // self.chunk_size
+
+    def _chunk_range(self, index: int) -> tuple:
+        start = index * self.chunk_size
+        return start, min(self.total_size, start + self.chunk_size) - 1
+
+    def _load_state(self, validator: str):
+        """Khôi phục các chunk đã tải nếu file trên server không đổi"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        same = (
+            state.get('url') == self.url
+            and state.get('size') == self.total_size
+            and state.get('validator') == validator
+            and state.get('chunk_size') == self.chunk_size
+            and os.path.exists(self.part_path)
+            and os.path.getsize(self.part_path) == self.total_size
+        )
+        if same:
+            self._done = set(state.get('done', []))
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': self.url,
+                'size': self.total_size,
+                'validator': self._validator,
+                'chunk_size': self.chunk_size,
+                'done': sorted(self._done),
+            }, f)
+        os.replace(tmp_path, self.state_path)
+
+    def covered(self, start: int, end: int) -> bool:
+        """Kiểm tra đoạn [start, end) đã tải xong chưa (gọi khi đang giữ lock hoặc sau khi xong)"""
+        if self.finished:
+            return True
+        if end <= start:
+            return True
+        first = start // self.chunk_size
+        last = (end - 1) // self.chunk_size
+        return all(i in self._done for i in range(first, last + 1))
+
+    def prioritize(self, start: int, end: int):
+        """Đưa các chunk thuộc đoạn [start, end) lên đầu hàng đợi"""
+        with self._lock:
+            first = start // self.chunk_size
+            last = (max(start, end - 1)) // self.chunk_size
+            wanted = [i for i in self._order if first <= i <= last]
+            for i in wanted:
+                self._order.remove(i)
+            self._order.extendleft(reversed(wanted))
+
+    # ------------------------------------------------------------------
+    # Tải
+    # ------------------------------------------------------------------
+    def _notify_progress(self):
+        if self.on_progress is not None:
+            self.on_progress(self.downloaded, self.total_size)
+
+    def _next_chunk(self):
+        with self._lock:
+            if self.error is not None or not self._order:
+                return None
+            return self._order.popleft()
+
+    def _download_chunk(self, index: int, f):
+        """Tải một chunk, thử lại khi lỗi mạng"""
+        start, end = self._chunk_range(index)
+        for attempt in range(MAX_RETRIES):
+            received = 0
+            try:
+                with open_url(self.url, start, end) as response:
+                    if response.status != 206:
+                        raise DownloadError("Server không hỗ trợ tải theo đoạn")
+                    f.seek(start)
+                    while True:
+                        block = response.read(READ_SIZE)
+                        if not block:
+                            break
+                        f.write(block)
+                        received += len(block)
+                        with self._lock:
+                            self.downloaded += len(block)
+                        self._notify_progress()
+                if received != end - start + 1:
+                    raise ConnectionError(f"Chunk {index} không đủ dữ liệu")
+                f.flush()
+                os.fsync(f.fileno())
+                return
+            except DownloadError:
+                raise
+            except Exception:
+                # Trừ phần đã đếm của lần thử lỗi rồi thử lại
+                with self._lock:
+                    self.downloaded -= received
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                time.sleep(min(10, 2 ** attempt))
+
+    def _worker(self):
+        try:
+            with open(self.part_path, 'r+b') as f:
+                while True:
+                    index = self._next_chunk()
+                    if index is None:
+                        return
+                    self._download_chunk(index, f)
+                    with self.changed:
+                        self._done.add(index)
+                        self._save_state()
+                        self.changed.notify_all()
+        except Exception as e:
+            with self.changed:
+                if self.error is None:
+                    self.error = e
+                self.changed.notify_all()
+
+    def _download_single(self):
+        """Fallback khi server không hỗ trợ Range: tải tuần tự một kết nối"""
+        with open_url(self.url) as response, open(self.part_path, 'wb') as f:
+            while True:
+                block = response.read(READ_SIZE)
+                if not block:
+                    break
+                f.write(block)
+                self.downloaded += len(block)
+                self._notify_progress()
+        if self.total_size and self.downloaded != self.total_size:
+            raise DownloadError("Tải không đủ dữ liệu")
+        self.total_size = self.downloaded
+
+    def prepare(self):
+        """Lấy thông tin file, khôi phục trạng thái và cấp phát trước file .part"""
+        self.total_size, self.supports_ranges, self._validator = probe(self.url)
+        if not self.supports_ranges or self.total_size == 0:
+            return
+
+        self._load_state(self._validator)
+        if not self._done:
+            # Cấp phát trước để các thread ghi vào đúng vị trí
+            with open(self.part_path, 'wb') as f:
+                f.truncate(self.total_size)
+            self._save_state()
+
+        # Chunk cuối (chứa central directory của zip) tải trước, sau đó theo thứ tự
+        chunks = [i for i in range(self._num_chunks()) if i not in self._done]
+        if chunks and chunks[-1] == self._num_chunks() - 1:
+            chunks.insert(0, chunks.pop())
+        self._order = deque(chunks)
+        self.downloaded = sum(
+            self._chunk_range(i)[1] - self._chunk_range(i)[0] + 1 for i in self._done
+        )
+        self._notify_progress()
+
+    def run(self):
+        """Tải file vào .part (chặn cho đến khi xong)"""
+        try:
+            if not self.supports_ranges or self.total_size == 0:
+                self._download_single()
+            else:
+                threads = [
+                    threading.Thread(target=self._worker, daemon=True)
+                    for _ in range(min(self.connections, len(self._order)))
+                ]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                if self.error is not None:
+                    raise self.error
+        except Exception as e:
+            with self.changed:
+                if self.error is None:
+                    self.error = e
+                self.changed.notify_all()
+            raise
+
+        with self.changed:
+            self.finished = True
+            self.changed.notify_all()
+
+    def finalize(self):
+        """Đổi tên .part thành file đích và xoá trạng thái resume"""
+        os.replace(self.part_path, self.path)
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+
+
+# Vùng cuối file có thể chứa End Of Central Directory (22 bytes + comment tối đa 64KB)
+EOCD_WINDOW = 65536 + 22
+
+
+def _find_central_directory(f, total_size: int) -> int:
+    """Đọc End Of Central Directory (hỗ trợ zip64), trả về offset của central directory"""
+    tail_size = min(total_size, EOCD_WINDOW)
+    f.seek(total_size - tail_size)
+    tail = f.read(tail_size)
+    pos = tail.rfind(b'PK\x05\x06')
+    if pos < 0:
+        raise zipfile.BadZipFile("Không tìm thấy End Of Central Directory")
+    cd_offset = struct.unpack('<I', tail[pos + 16:pos + 20])[0]
+    if cd_offset == 0xFFFFFFFF and pos >= 20:
+        # Zip64 locator nằm ngay trước EOCD
+        locator = tail[pos - 20:pos]
+        if locator[:4] == b'PK\x06\x07':
+            zip64_eocd = struct.unpack('<Q', locator[8:16])[0]
+            f.seek(zip64_eocd + 48)
+            cd_offset = struct.unpack('<Q', f.read(8))[0]
+    return cd_offset
+
+
+class ProgressThrottle:
+    """
+    Gộp các cập nhật tiến độ từ nhiều thread, chỉ gọi callback tối đa
+    một lần mỗi `interval` giây (giá trị mới nhất thắng)
+    """
+
+    def __init__(self, callback, interval: float = 0.1):
+        self.callback = callback
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = 0.0
+        self._latest = None
+
+    def __call__(self, *args):
+        with self._lock:
+            self._latest = args
+            now = time.monotonic()
+            if now - self._last < self.interval:
+                return
+            self._last = now
+        self.callback(*args)
+
+    def flush(self):
+        """Gửi giá trị cuối cùng (gọi khi kết thúc)"""
+        with self._lock:
+            args, self._latest = self._latest, None
+        if args is not None:
+            self.callback(*args)
+
+
+def _safe_target(dest_dir: str, name: str) -> str:
+    """Đường dẫn giải nén an toàn (bỏ ổ đĩa, '..' và đường dẫn tuyệt đối) như zipfile.extract"""
+    name = name.replace('\\', '/')
+    parts = [p for p in name.split('/') if p not in ('', '.', '..')]
+    if parts:
+        parts[0] = os.path.splitdrive(parts[0])[1] or parts[0]
+        parts[0] = parts[0].rstrip(':')
+    return os.path.join(dest_dir, *parts)
+
+
+class StreamingZipExtractor:
+    """
+    Giải nén zip song song với quá trình tải, dùng nhiều thread
+
+    Khi chunk cuối đã tải, đọc central directory để biết vị trí từng file trong
+    archive; mỗi file được đưa vào thread pool ngay khi toàn bộ dữ liệu của nó
+    đã có trên đĩa. File đích được cấp phát trước đúng kích thước và ghi bằng
+    buffer lớn. CRC-32 của từng file được zipfile kiểm tra khi đọc.
+    """
+
+    def __init__(self, download: RangedDownload, dest_dir: str,
+                 on_progress=None, workers: int = 4):
+        """
+        Args:
+            download: RangedDownload đang chạy (đã prepare())
+            dest_dir: Thư mục giải nén
+            on_progress: Callback(extracted_bytes, total_bytes, extracted_files, total_files)
+            workers: Số thread giải nén
+        """
+        self.download = download
+        self.dest_dir = dest_dir
+        self.on_progress = on_progress
+        self.workers = max(1, workers)
+        self.extracted = 0
+        self.total = 0
+        self.extracted_bytes = 0
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _wait_for(self, start: int, end: int):
+        """Chờ tới khi đoạn [start, end) đã tải xong"""
+        d = self.download
+        with d.changed:
+            while not d.covered(start, end):
+                if d.error is not None:
+                    raise DownloadError(f"Tải thất bại: {d.error}")
+                d.changed.wait(1.0)
+
+    def _members(self, zf: zipfile.ZipFile, cd_offset: int) -> list:
+        """Danh sách (info, start, end) theo vị trí trong archive"""
+        infos = sorted(zf.infolist(), key=lambda info: info.header_offset)
+        members = []
+        for i, info in enumerate(infos):
+            end = infos[i + 1].header_offset if i + 1 < len(infos) else cd_offset
+            members.append((info, info.header_offset, end))
+        return members
+
+    def _zipfile(self) -> zipfile.ZipFile:
+        """Mỗi thread giữ một ZipFile riêng (handle file riêng, không tranh lock seek)"""
+        zf = getattr(self._local, 'zf', None)
+        if zf is None:
+            zf = zipfile.ZipFile(self.download.part_path)
+            self._local.zf = zf
+            with self._lock:
+                self._handles.append(zf)
+        return zf
+
+    def _extract_member(self, info: zipfile.ZipInfo):
+        """Giải nén một file vào vị trí đã cấp phát trước"""
+        target = _safe_target(self.dest_dir, info.filename)
+        with self._zipfile().open(info.filename) as src, open(target, 'wb', buffering=WRITE_BUFFER) as dst:
+            if info.file_size:
+                # Cấp phát trước để hệ thống file không phải nới file nhiều lần
+                dst.truncate(info.file_size)
+            while True:
+                block = src.read(WRITE_BUFFER)
+                if not block:
+                    break
+                dst.write(block)
+                with self._lock:
+                    self.extracted_bytes += len(block)
+        with self._lock:
+            self.extracted += 1
+        self._report()
+
+    def _report(self):
+        if self.on_progress is not None:
+            self.on_progress(self.extracted_bytes, self.total_bytes, self.extracted, self.total)
+
+    def run(self):
+        """Giải nén (chặn cho đến khi mọi file được giải nén)"""
+        d = self.download
+        total_size = d.total_size
+
+        if d.supports_ranges and total_size:
+            # Tải cả vùng cuối file trước (không chỉ chunk cuối) rồi mới chờ
+            tail_start = max(0, total_size - EOCD_WINDOW)
+            d.prioritize(tail_start, total_size)
+            self._wait_for(tail_start, total_size)
+            with open(d.part_path, 'rb') as f:
+                cd_offset = _find_central_directory(f, total_size)
+            d.prioritize(cd_offset, total_size)
+            self._wait_for(cd_offset, total_size)
+        else:
+            # Không tải theo đoạn được -> chờ tải xong hết
+            self._wait_for(0, 1)
+            cd_offset = None
+
+        with zipfile.ZipFile(d.part_path) as zf:
+            if cd_offset is None:
+                cd_offset = zf.start_dir
+            members = self._members(zf, cd_offset)
+
+        # Tạo toàn bộ cây thư mục trước (một thread) để các worker không tranh nhau
+        pending = []
+        for member in members:
+            info = member[0]
+            target = _safe_target(self.dest_dir, info.filename)
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                pending.append(member)
+        self.total = len(pending)
+        self.total_bytes = sum(m[0].file_size for m in pending)
+        self._report()
+
+        self._handles = []
+        futures = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract") as pool:
+                while pending:
+                    with d.changed:
+                        ready = [m for m in pending if d.covered(m[1], m[2])]
+                        if not ready:
+                            if d.error is not None:
+                                raise DownloadError(f"Tải thất bại: {d.error}")
+                            d.changed.wait(1.0)
+                            continue
+                    futures += [pool.submit(self._extract_member, m[0]) for m in ready]
+                    ready_ids = {id(m) for m in ready}
+                    pending = [m for m in pending if id(m) not in ready_ids]
+                    # Dừng sớm nếu có file lỗi (vd: sai CRC)
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                for future in futures:
+                    future.result()
+        finally:
+            for zf in self._handles:
+                zf.close()
+
+
+def download_and_extract(url: str, zip_path: str, dest_dir: str,
+                         connections: int = 4, expected_sha256: str = None,
+                         on_download=None, on_extract=None,
+                         extract_workers: int = 4, progress_interval: float = 0.1):
+    """
+    Tải zip và giải nén đồng thời vào dest_dir
+
+    Args:
+        url: Địa chỉ file zip
+        zip_path: Nơi lưu file zip (file .part/.state nằm cạnh để resume)
+        dest_dir: Thư mục giải nén (nên là thư mục tạm, đổi tên sau khi kiểm tra xong)
+        connections: Số kết nối song song
+        expected_sha256: SHA-256 mong đợi của file zip (None: không kiểm tra được, in cảnh báo)
+        on_download: Callback(downloaded, total)
+        on_extract: Callback(extracted_bytes, total_bytes, extracted_files, total_files)
+        extract_workers: Số thread giải nén
+        progress_interval: Chu kỳ tối thiểu giữa hai lần gọi callback tiến độ (giây)
+
+    Raises:
+        DownloadError: Khi tải lỗi hoặc checksum không khớp
+    """
+    download_progress = ProgressThrottle(on_download, progress_interval) if on_download else None
+    extract_progress = ProgressThrottle(on_extract, progress_interval) if on_extract else None
+
+    download = RangedDownload(url, zip_path, connections=connections, on_progress=download_progress)
+    download.prepare()
+    extractor = StreamingZipExtractor(
+        download, dest_dir, on_progress=extract_progress, workers=extract_workers
+    )
+
+    errors = []
+
+    def extract():
+        try:
+            extractor.run()
+        except Exception as e:
+            errors.append(e)
+
+    extract_thread = threading.Thread(target=extract, daemon=True)
+    extract_thread.start()
+    download.run()
+    if download_progress is not None:
+        download_progress.flush()
+    extract_thread.join()
+    if extract_progress is not None:
+        extract_progress.flush()
+    if errors:
+        raise errors[0]
+    download.finalize()
+
+    if expected_sha256:
+        actual = sha256_file(zip_path)
+        if actual != expected_sha256.lower():
+            # Không để lại file đã giải nén từ archive hỏng/bị sửa
+            os.remove(zip_path)
+            shutil.rmtree(dest_dir, ignore_errors=True)
+            raise DownloadError("Checksum không khớp, file tải về bị hỏng")
+    else:
+        print(f"⚠️ CẢNH BÁO: không có SHA-256 cho {url}, file tải về KHÔNG được kiểm tra toàn vẹn")
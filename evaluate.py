@@ -0,0 +1,319 @@
+"""
+Evaluate Module
+Đánh giá độ chính xác đếm và tốc độ của nhiều cấu hình PersonDetector trên tập ảnh có nhãn
+
+Nhãn:
+    - CSV: image,count (đường dẫn tương đối theo thư mục của file CSV)
+    - COCO JSON (vd: annotations.json của exporter.py): có box -> tính thêm AP
+
+Cách sử dụng:
+    python evaluate.py --coco labels/annotations.json --images labels/ \\
+        --models n,s --imgsz 640,960 --tiling none,640 --confidence 0.2,0.3,0.4 -o eval_out
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import itertools
+
+import numpy as np
+
+from raw_cache import RawOutputCache
+
+DEFAULT_CACHE_PATH = "face_counter_eval_raw.db"
+AP_IOU = 0.5
+# Số ảnh dùng để đo lại tốc độ khi output thô đã có sẵn trong cache
+TIMING_SAMPLE = 16
+
+
+# ----------------------------------------------------------------------
+# Nhãn
+# ----------------------------------------------------------------------
+def load_count_labels(csv_path: str) -> dict:
+    """{đường dẫn ảnh: {'count': n, 'boxes': None}} từ CSV image,count"""
+    base = os.path.dirname(os.path.abspath(csv_path))
+    labels = {}
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            path = os.path.join(base, row['image'])
+            labels[path] = {'count': int(row['count']), 'boxes': None}
+    return labels
+
+
+def load_coco_labels(json_path: str, image_dir: str = None) -> dict:
+    """{đường dẫn ảnh: {'count': n, 'boxes': mảng (N, 4) x1,y1,x2,y2}} từ COCO JSON"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    base = image_dir or os.path.dirname(os.path.abspath(json_path))
+    boxes = {image['id']: [] for image in data['images']}
+    for ann in data['annotations']:
+        x, y, w, h = ann['bbox']
+        boxes[ann['image_id']].append([x, y, x + w, y + h])
+    labels = {}
+    for image in data['images']:
+        image_boxes = np.array(boxes[image['id']], dtype=np.float32).reshape(-1, 4)
+        labels[os.path.join(base, image['file_name'])] = {'count': len(image_boxes), 'boxes': image_boxes}
+    return labels
+
+
+# ----------------------------------------------------------------------
+# Chỉ số
+# ----------------------------------------------------------------------
+def _iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    w = np.maximum(0, np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]))
+    h = np.maximum(0, np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]))
+    inter = w * h
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(1e-6, area + areas - inter)
+
+
+def average_precision(predictions: list, ground_truth: list, iou_threshold: float = AP_IOU) -> float:
+    """
+    AP (nội suy mọi điểm) của một class
+
+    Args:
+        predictions: List (list detection) cho từng ảnh
+        ground_truth: List mảng box (N, 4) cho từng ảnh (cùng thứ tự)
+    """
+    total_gt = sum(len(gt) for gt in ground_truth)
+    if total_gt == 0:
+        return float('nan')
+    scored = [
+        (det['confidence'], index, np.asarray(det['bbox'], dtype=np.float32))
+        for index, detections in enumerate(predictions)
+        for det in detections
+    ]
+    scored.sort(key=lambda item: -item[0])
+    matched = [np.zeros(len(gt), dtype=bool) for gt in ground_truth]
+    tp = np.zeros(len(scored))
+    for rank, (_, index, box) in enumerate(scored):
+        gt = ground_truth[index]
+        if len(gt) == 0:
+            continue
+        ious = _iou(box, gt)
+        ious[matched[index]] = -1
+        best = int(np.argmax(ious))
+        if ious[best] >= iou_threshold:
+            matched[index][best] = True
+            tp[rank] = 1
+    if not len(scored):
+        return 0.0
+    cum_tp = np.cumsum(tp)
+    recall = cum_tp / total_gt
+    precision = cum_tp / np.arange(1, len(scored) + 1)
+    # Precision envelope (đơn điệu giảm) rồi tích phân theo recall
+    recall = np.concatenate([[0.0], recall, [recall[-1]]])
+    precision = np.concatenate([[1.0], precision, [0.0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    steps = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1]))
+
+
+def pareto_front(rows: list) -> list:
+    """Các cấu hình không bị cấu hình khác vượt ở cả tốc độ lẫn sai số đếm"""
+    front = []
+    for row in rows:
+        dominated = any(
+            other['throughput'] >= row['throughput'] and other['mae'] <= row['mae']
+            and (other['throughput'] > row['throughput'] or other['mae'] < row['mae'])
+            for other in rows
+        )
+        if not dominated:
+            front.append(row)
+    return sorted(front, key=lambda r: r['throughput'])
+
+
+# ----------------------------------------------------------------------
+# Sweep
+# ----------------------------------------------------------------------
+class Evaluator:
+    """
+    Chạy sweep cấu hình trên tập ảnh có nhãn
+
+    Cấu hình chia thành phần inference (model, imgsz, tiling, backend, precision)
+    và phần hậu xử lý (confidence). Mỗi cấu hình inference chỉ chạy model một
+    lần; output thô nằm trong RawOutputCache nên các ngưỡng còn lại (và các lần
+    chạy evaluate sau) chỉ tốn hậu xử lý. Thời gian inference đo được lưu cạnh
+    cache để throughput vẫn đúng khi cache đã có sẵn.
+    """
+
+    def __init__(self, labels: dict, cache_path: str = DEFAULT_CACHE_PATH,
+                 mode: str = None, batch_size: int = 8):
+        self.labels = labels
+        self.paths = sorted(labels)
+        self.cache = RawOutputCache(cache_path, memory_items=len(self.paths) * 2 + 16)
+        self.timings_path = cache_path + ".timings.json"
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self._detectors = {}
+        try:
+            with open(self.timings_path, 'r', encoding='utf-8') as f:
+                self.timings = json.load(f)
+        except (OSError, ValueError):
+            self.timings = {}
+
+    def _detector(self, size: str, backend: str, half: bool):
+        from person_detector import PersonDetector, MODE_AUTO
+
+        key = (size, backend, half)
+        if key not in self._detectors:
+            detector = PersonDetector(self.mode or MODE_AUTO, model_size=size, backend=backend)
+            detector.half = half
+            detector.raw_cache = self.cache
+            self._detectors[key] = detector
+        return self._detectors[key]
+
+    def _run(self, detector, confidence: float, imgsz: int, tile_size: int, paths: list = None) -> list:
+        paths = self.paths if paths is None else paths
+        predictions = []
+        if tile_size:
+            for path in paths:
+                predictions.append(detector.detect_tiled(path, confidence, tile_size=tile_size, imgsz=imgsz))
+            return predictions
+        for start in range(0, len(paths), self.batch_size):
+            chunk = paths[start:start + self.batch_size]
+            predictions.extend(detector.detect_batch(chunk, confidence, imgsz=imgsz))
+        return predictions
+
+    def _measure(self, detector, confidence: float, imgsz: int, tile_size: int) -> float:
+        """Đo thời gian inference thật (tắt cache) trên một mẫu nhỏ"""
+        sample = self.paths[:TIMING_SAMPLE]
+        detector.raw_cache = None
+        try:
+            start = time.perf_counter()
+            self._run(detector, confidence, imgsz, tile_size, sample)
+            return (time.perf_counter() - start) / len(sample)
+        finally:
+            detector.raw_cache = self.cache
+
+    def _save_timings(self):
+        tmp_path = self.timings_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.timings, f, indent=1)
+        os.replace(tmp_path, self.timings_path)
+
+    def evaluate(self, size: str, backend: str, half: bool, imgsz: int, tile_size: int,
+                 confidences: list) -> list:
+        """Đánh giá một cấu hình inference với nhiều ngưỡng confidence"""
+        detector = self._detector(size, backend, half)
+        timing_key = f"{detector.model_name}|{'fp16' if half else 'fp32'}|{imgsz}|{tile_size}"
+
+        # Lần chạy đầu (ngưỡng thấp nhất) đi qua model và ghi cache -> dùng để đo tốc độ
+        hits_before = self.cache.hits
+        start = time.perf_counter()
+        first = self._run(detector, min(confidences), imgsz, tile_size)
+        elapsed = time.perf_counter() - start
+        if self.cache.hits == hits_before:
+            # Toàn bộ đi qua model: số đo chính xác nhất
+            self.timings[timing_key] = elapsed / len(self.paths)
+            self._save_timings()
+        elif timing_key not in self.timings:
+            self.timings[timing_key] = self._measure(detector, min(confidences), imgsz, tile_size)
+            self._save_timings()
+        throughput = 1.0 / max(1e-9, self.timings[timing_key])
+
+        rows = []
+        for confidence in sorted(confidences):
+            predictions = first if confidence == min(confidences) else \
+                self._run(detector, confidence, imgsz, tile_size)
+            errors = [len(pred) - self.labels[path]['count'] for path, pred in zip(self.paths, predictions)]
+            boxed = [(pred, self.labels[path]['boxes']) for path, pred in zip(self.paths, predictions)
+                     if self.labels[path]['boxes'] is not None]
+            ap = average_precision([p for p, _ in boxed], [g for _, g in boxed]) if boxed else float('nan')
+            rows.append({
+                'model': size, 'backend': backend, 'precision': 'fp16' if half else 'fp32',
+                'imgsz': imgsz, 'tiling': tile_size or 'none', 'confidence': confidence,
+                'mae': float(np.mean(np.abs(errors))), 'bias': float(np.mean(errors)),
+                'ap50': ap, 'throughput': throughput,
+            })
+        return rows
+
+
+def plot_pareto(rows: list, front: list, path: str) -> bool:
+    """Vẽ sai số đếm theo tốc độ, tô đậm đường Pareto (cần matplotlib)"""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return False
+    fig, ax = plt.subplots(figsize=(8, 5))
+    ax.scatter([r['throughput'] for r in rows], [r['mae'] for r in rows], c='#999', s=18, label='Cấu hình')
+    ax.plot([r['throughput'] for r in front], [r['mae'] for r in front], 'o-', c='#e94560', label='Pareto')
+    for r in front:
+        ax.annotate(f"{r['model']}/{r['imgsz']}/{r['tiling']}/{r['confidence']}",
+                    (r['throughput'], r['mae']), fontsize=7, xytext=(4, 4), textcoords='offset points')
+    ax.set_xlabel('Ảnh/giây')
+    ax.set_ylabel('MAE số khuôn mặt')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+    return True
+
+
+def _split(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đánh giá độ chính xác/tốc độ các cấu hình")
+    parser.add_argument("--labels", help="CSV image,count")
+    parser.add_argument("--coco", help="COCO JSON có box")
+    parser.add_argument("--images", default=None, help="Thư mục ảnh cho COCO (mặc định: thư mục của file JSON)")
+    parser.add_argument("--models", default="n", help="Kích thước model, vd: n,s,m")
+    parser.add_argument("--imgsz", default="640", help="Độ phân giải, vd: 640,960")
+    parser.add_argument("--tiling", default="none", help="Kích thước tile hoặc none, vd: none,640")
+    parser.add_argument("--confidence", default="0.2,0.3,0.4", help="Các ngưỡng confidence")
+    parser.add_argument("--backend", default="pt", help="pt,onnx")
+    parser.add_argument("--precision", default="fp32", help="fp32,fp16 (fp16 cần GPU)")
+    parser.add_argument("--mode", default=None, help="Chế độ PersonDetector (auto, face, person, two_stage)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="File cache output thô")
+    parser.add_argument("-o", "--output", default="eval_out", help="Thư mục kết quả")
+    args = parser.parse_args()
+
+    if not args.labels and not args.coco:
+        parser.error("Cần --labels hoặc --coco")
+    labels = load_coco_labels(args.coco, args.images) if args.coco else load_count_labels(args.labels)
+    if not labels:
+        print("Tập nhãn rỗng")
+        sys.exit(1)
+
+    evaluator = Evaluator(labels, args.cache, args.mode)
+    confidences = [float(c) for c in _split(args.confidence)]
+    tilings = [None if t == 'none' else int(t) for t in _split(args.tiling)]
+    rows = []
+    for size, backend, precision, imgsz, tile_size in itertools.product(
+            _split(args.models), _split(args.backend), _split(args.precision),
+            [int(v) for v in _split(args.imgsz)], tilings):
+        print(f"Đang đánh giá {size}/{backend}/{precision} imgsz={imgsz} tiling={tile_size or 'none'}...")
+        rows.extend(evaluator.evaluate(size, backend, precision == 'fp16', imgsz, tile_size, confidences))
+    evaluator.cache.close()
+
+    os.makedirs(args.output, exist_ok=True)
+    fields = ['model', 'backend', 'precision', 'imgsz', 'tiling', 'confidence', 'mae', 'bias', 'ap50', 'throughput']
+    with open(os.path.join(args.output, 'results.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    front = pareto_front(rows)
+    print(f"\n{'model':<6}{'backend':<8}{'prec':<6}{'imgsz':>6}{'tiling':>8}{'conf':>6}"
+          f"{'MAE':>8}{'AP50':>7}{'ảnh/s':>8}")
+    for r in sorted(rows, key=lambda r: -r['throughput']):
+        mark = " *" if r in front else ""
+        print(f"{r['model']:<6}{r['backend']:<8}{r['precision']:<6}{r['imgsz']:>6}{str(r['tiling']):>8}"
+              f"{r['confidence']:>6.2f}{r['mae']:>8.2f}{r['ap50']:>7.3f}{r['throughput']:>8.1f}{mark}")
+    print("(* = trên đường Pareto)")
+    if plot_pareto(rows, front, os.path.join(args.output, 'pareto.png')):
+        print(f"Đã vẽ {os.path.join(args.output, 'pareto.png')}")
+    else:
+        print("Không có matplotlib - bỏ qua biểu đồ")
+
+
+if __name__ == "__main__":
+    main()
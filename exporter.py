@@ -0,0 +1,313 @@
+"""
+Exporter Module
+Xuất ảnh đã vẽ annotation (JPEG/WebP/PNG) song song, kèm file kết quả
+dạng COCO JSON, CSV và YOLO txt được ghi dần (không giữ toàn bộ trong bộ nhớ)
+
+Cách sử dụng:
+    python exporter.py <ảnh hoặc thư mục> ... -o output --format webp --quality 85
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from annotator import default_annotator
+from memory_budget import get_budget
+
+FORMATS = {
+    'jpg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+    'png': ('.png', None),
+}
+SIDECARS = ('coco', 'csv', 'yolo')
+
+# Mức nén PNG: 1-3 nhanh hơn nhiều so với 9 mà file chỉ lớn hơn chút ít
+PNG_COMPRESSION = 3
+
+
+def write_atomic(path: str, data: bytes):
+    """Ghi file qua file tạm cùng thư mục + os.replace (không để lại file dở dang)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class CocoWriter:
+    """
+    Ghi COCO JSON theo luồng
+
+    'images' được ghi thẳng vào file tạm, 'annotations' vào một file tạm
+    thứ hai; close() nối hai phần lại và đổi tên thành file đích.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = f"{path}.{os.getpid()}.tmp"
+        self._images = open(self._tmp_path, 'w', encoding='utf-8')
+        self._annotations = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self._images.write('{"info": {"description": "FaceCounter export"}, '
+                           '"categories": [{"id": 1, "name": "face"}],\n"images": [')
+        self._image_count = 0
+        self._annotation_count = 0
+
+    def add(self, file_name: str, width: int, height: int, detections: list):
+        self._image_count += 1
+        image_id = self._image_count
+        entry = {'id': image_id, 'file_name': file_name, 'width': width, 'height': height}
+        self._images.write((",\n" if image_id > 1 else "\n") + json.dumps(entry, ensure_ascii=False))
+
+        for det in detections:
+            x1, y1, x2, y2 = det['bbox']
+            self._annotation_count += 1
+            ann = {
+                'id': self._annotation_count, 'image_id': image_id, 'category_id': 1,
+                'bbox': [x1, y1, x2 - x1, y2 - y1], 'area': (x2 - x1) * (y2 - y1),
+                'iscrowd': 0, 'score': round(det['confidence'], 4),
+            }
+            self._annotations.write((",\n" if self._annotation_count > 1 else "\n") + json.dumps(ann))
+
+    def close(self):
+        self._images.write('\n],\n"annotations": [')
+        self._annotations.seek(0)
+        shutil.copyfileobj(self._annotations, self._images)
+        self._annotations.close()
+        self._images.write('\n]}\n')
+        self._images.close()
+        os.replace(self._tmp_path, self.path)
+
+
+class AnnotatedExporter:
+    """
+    Xuất ảnh annotation ra thư mục
+
+    Vẽ + encode chạy trên thread pool (cv2.imencode nhả GIL); số ảnh đang
+    encode bị giới hạn nên bộ nhớ không tăng theo số ảnh. File kết quả
+    (COCO/CSV) được ghi theo đúng thứ tự đầu vào từ thread gọi submit().
+
+    Ví dụ:
+        with AnnotatedExporter("output", fmt='webp') as exporter:
+            for result in pipeline.run(paths):
+                exporter.submit(result['path'], result['frame'], result['detections'])
+    """
+
+    def __init__(self, output_dir: str, fmt: str = 'jpg', quality: int = 90,
+                 max_size: int = None, workers: int = 4, sidecars: tuple = SIDECARS,
+                 max_pending: int = None):
+        """
+        Args:
+            output_dir: Thư mục đích
+            fmt: 'jpg', 'webp' hoặc 'png'
+            quality: Chất lượng JPEG/WebP (1-100)
+            max_size: Thu nhỏ ảnh xuất sao cho cạnh dài <= max_size (None: giữ nguyên)
+            workers: Số thread encode
+            sidecars: Các file kết quả cần ghi: 'coco', 'csv', 'yolo'
+            max_pending: Số ảnh tối đa đang chờ encode (mặc định: 2 x workers)
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+        unknown = set(sidecars) - set(SIDECARS)
+        if unknown:
+            raise ValueError(f"Loại file kết quả không hỗ trợ: {', '.join(sorted(unknown))}")
+
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.quality = quality
+        self.max_size = max_size
+        self.workers = max(1, workers)
+        self.sidecars = tuple(sidecars)
+        self.max_pending = max_pending or self.workers * 2
+
+        self.exported = 0
+        self.errors = 0
+        self._names = set()
+        self._pending = deque()
+        self.budget = get_budget()
+        self._pool = None
+        self._coco = None
+        self._csv_file = None
+        self._csv = None
+
+    # ------------------------------------------------------------------
+    # Vòng đời
+    # ------------------------------------------------------------------
+    def open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if 'yolo' in self.sidecars:
+            os.makedirs(os.path.join(self.output_dir, 'labels'), exist_ok=True)
+        if 'coco' in self.sidecars:
+            self._coco = CocoWriter(os.path.join(self.output_dir, 'annotations.json'))
+        if 'csv' in self.sidecars:
+            self._csv_path = os.path.join(self.output_dir, 'detections.csv')
+            self._csv_file = open(f"{self._csv_path}.{os.getpid()}.tmp", 'w', newline='', encoding='utf-8')
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(['image', 'source', 'count', 'number', 'x1', 'y1', 'x2', 'y2', 'confidence'])
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        return self
+
+    def close(self):
+        """Chờ encode xong và hoàn tất các file kết quả"""
+        while self._pending:
+            self._finish_one()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._coco is not None:
+            self._coco.close()
+            self._coco = None
+        if self._csv_file is not None:
+            tmp_path = self._csv_file.name
+            self._csv_file.close()
+            os.replace(tmp_path, self._csv_path)
+            self._csv_file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Xử lý
+    # ------------------------------------------------------------------
+    def _output_name(self, source: str) -> str:
+        """Tên file đích theo tên ảnh gốc, thêm hậu tố khi trùng"""
+        stem = os.path.splitext(os.path.basename(source))[0]
+        name = stem
+        index = 1
+        while name in self._names:
+            name = f"{stem}_{index}"
+            index += 1
+        self._names.add(name)
+        return name
+
+    def _encode(self, name: str, frame, detections: list) -> tuple:
+        """
+        Chạy trong thread pool: vẽ, encode và ghi ảnh (+ YOLO txt)
+
+        Returns:
+            (width, height, scale): kích thước ảnh đã xuất và hệ số thu nhỏ so với ảnh gốc
+        """
+        height, width = frame.shape[:2]
+        scale = 1.0
+        if self.max_size and max(width, height) > self.max_size:
+            # Cùng hệ số với Annotator.annotate
+            scale = self.max_size / max(width, height)
+        annotated = default_annotator.annotate(frame, detections, self.max_size, bgr=True)
+        ext, quality_flag = FORMATS[self.fmt]
+        params = [quality_flag, int(self.quality)] if quality_flag is not None \
+            else [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+        ok, encoded = cv2.imencode(ext, annotated, params)
+        if not ok:
+            raise ValueError(f"Không thể encode ảnh {name}{ext}")
+        write_atomic(os.path.join(self.output_dir, name + ext), encoded.tobytes())
+
+        if 'yolo' in self.sidecars:
+            lines = []
+            for det in detections:
+                x1, y1, x2, y2 = det['bbox']
+                lines.append(f"0 {(x1 + x2) / 2 / width:.6f} {(y1 + y2) / 2 / height:.6f} "
+                             f"{(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}")
+            text = "\n".join(lines) + ("\n" if lines else "")
+            write_atomic(os.path.join(self.output_dir, 'labels', name + '.txt'), text.encode())
+        out_height, out_width = annotated.shape[:2]
+        return out_width, out_height, scale
+
+    def _finish_one(self):
+        """Lấy kết quả encode cũ nhất và ghi các file kết quả theo thứ tự"""
+        name, source, detections, future, size = self._pending.popleft()
+        try:
+            width, height, scale = future.result()
+        except Exception as e:
+            self.budget.add('export', -size)
+            self.errors += 1
+            print(f"Không thể xuất {source}: {e}")
+            return
+        self.budget.add('export', -size)
+        self.exported += 1
+        file_name = name + FORMATS[self.fmt][0]
+        if scale != 1.0:
+            # COCO/CSV theo toạ độ của ảnh đã xuất (YOLO đã chuẩn hoá nên không đổi)
+            detections = [dict(det, bbox=[round(v * scale, 2) for v in det['bbox']]) for det in detections]
+        if self._coco is not None:
+            self._coco.add(file_name, width, height, detections)
+        if self._csv is not None:
+            if not detections:
+                self._csv.writerow([file_name, source, 0, '', '', '', '', '', ''])
+            for det in detections:
+                self._csv.writerow([file_name, source, len(detections), det['number'],
+                                    *det['bbox'], f"{det['confidence']:.4f}"])
+
+    def submit(self, source: str, frame, detections: list):
+        """
+        Đưa một ảnh vào hàng đợi xuất (chặn khi đã đủ max_pending ảnh đang encode
+        hoặc ảnh đang chờ làm vượt ngân sách bộ nhớ)
+
+        Args:
+            source: Đường dẫn ảnh gốc (dùng để đặt tên file)
+            frame: Ảnh BGR đã decode
+            detections: Kết quả detect() theo toạ độ ảnh gốc
+        """
+        if self._pool is None:
+            raise RuntimeError("Exporter chưa được open()")
+        while len(self._pending) >= self.max_pending:
+            self._finish_one()
+        # Ảnh gốc + bản annotation đang encode
+        size = frame.nbytes * 2
+        while self._pending and self.budget.used + size > self.budget.limit:
+            self._finish_one()
+        self.budget.add('export', size)
+        name = self._output_name(source)
+        future = self._pool.submit(self._encode, name, frame, detections)
+        self._pending.append((name, source, detections, future, size))
+
+
+def main():
+    """Detect và xuất ảnh annotation cho cả thư mục"""
+    from pipeline import DetectionPipeline, _expand_paths
+    from person_detector import PersonDetector
+
+    parser = argparse.ArgumentParser(description="Xuất ảnh đã đánh số khuôn mặt")
+    parser.add_argument("inputs", nargs="+", help="Ảnh hoặc thư mục ảnh")
+    parser.add_argument("-o", "--output", required=True, help="Thư mục xuất")
+    parser.add_argument("--format", default="jpg", choices=list(FORMATS), help="Định dạng ảnh xuất")
+    parser.add_argument("--quality", type=int, default=90, help="Chất lượng JPEG/WebP (1-100)")
+    parser.add_argument("--max-size", type=int, default=None, help="Cạnh dài tối đa của ảnh xuất")
+    parser.add_argument("--workers", type=int, default=4, help="Số thread encode")
+    parser.add_argument("--sidecars", default=",".join(SIDECARS),
+                        help="File kết quả kèm theo, vd: coco,csv,yolo (rỗng: không ghi)")
+    parser.add_argument("--confidence", type=float, default=0.3, help="Ngưỡng confidence")
+    args = parser.parse_args()
+
+    paths = _expand_paths(args.inputs)
+    if not paths:
+        print("Không tìm thấy ảnh nào")
+        sys.exit(1)
+
+    sidecars = tuple(s for s in args.sidecars.split(",") if s)
+    pipeline = DetectionPipeline(PersonDetector(), confidence=args.confidence, draw=False, keep_frames=True)
+    start = time.perf_counter()
+    with AnnotatedExporter(args.output, args.format, args.quality, args.max_size,
+                           args.workers, sidecars) as exporter:
+        for result in pipeline.run(paths):
+            if result['error']:
+                print(f"  LỖI  {result['path']}: {result['error']}")
+                continue
+            exporter.submit(result['path'], result['frame'], result['detections'])
+    elapsed = time.perf_counter() - start
+    print(f"Đã xuất {exporter.exported} ảnh vào {args.output} trong {elapsed:.1f}s "
+          f"({exporter.errors} lỗi)")
+    print(exporter.budget.format_report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+"""
+Folder Watcher Module
+Theo dõi thư mục (hot-folder) và tự động đếm khuôn mặt cho ảnh mới
+
+Cách sử dụng:
+    python folder_watcher.py <thư mục> -o results.jsonl --workers 2
+"""
+
+import os
+import sys
+import time
+import json
+import queue
+import argparse
+import threading
+
+from results_store import ResultsStore, SqliteSink, hash_file
+
+# Định dạng ảnh được hỗ trợ (giống dialog chọn ảnh trong app)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+
+# Số lần thử một ảnh lỗi (cùng mtime/size) trước khi bỏ qua cho tới khi file thay đổi
+MAX_ATTEMPTS = 3
+# Gộp lại checkpoint khi số dòng vượt quá số file đã xử lý bấy nhiêu lần
+COMPACT_RATIO = 2
+
+
+def _file_signature(path: str):
+    """Trả về (mtime_ns, size) của file, None nếu file không còn tồn tại"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def scan_images(root_dir: str) -> dict:
+    """
+    Quét đệ quy thư mục và lấy chữ ký của tất cả ảnh
+
+    Args:
+        root_dir: Thư mục gốc
+
+    Returns:
+        Dict {đường dẫn: (mtime_ns, size)}
+    """
+    found = {}
+    stack = [root_dir]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                            st = entry.stat()
+                            found[os.path.abspath(entry.path)] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return found
+
+
+class JsonlSink:
+    """Ghi kết quả nối tiếp vào file JSON Lines"""
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self._file = open(output_path, 'a', encoding='utf-8')
+
+    def write(self, records: list):
+        """Ghi một nhóm kết quả và flush xuống đĩa"""
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class FolderWatcher:
+    """
+    Theo dõi một cây thư mục và đưa ảnh mới/thay đổi vào worker pool
+
+    - Dùng inotify/FSEvents/ReadDirectoryChanges qua thư viện watchdog nếu có,
+      nếu không thì quét định kỳ (polling)
+    - Chỉ xử lý file khi kích thước và mtime không đổi trong `settle_time` giây
+      (tránh đọc file đang được copy/upload dở)
+    - Trạng thái đã xử lý được checkpoint bằng cách ghi nối (JSON Lines, mỗi nhóm
+      kết quả chỉ ghi thêm các dòng mới), khởi động lại không xử lý lại
+    - Ảnh lỗi được thử lại tối đa MAX_ATTEMPTS lần rồi mới đánh dấu bỏ qua
+    """
+
+    def __init__(self, watch_dir: str, sink, state_path: str = None,
+                 workers: int = 2, confidence: float = 0.3,
+                 poll_interval: float = 1.0, settle_time: float = 2.0,
+                 detector_factory=None, use_native_events: bool = True,
+                 hash_content: bool = False):
+        """
+        Args:
+            watch_dir: Thư mục cần theo dõi
+            sink: Đối tượng có write(records) và close() để lưu kết quả
+            state_path: File checkpoint (mặc định: .face_counter_state.jsonl trong watch_dir)
+            workers: Số worker, mỗi worker có một PersonDetector riêng
+            confidence: Ngưỡng confidence truyền cho detect()
+            poll_interval: Chu kỳ kiểm tra (giây)
+            settle_time: Thời gian file phải đứng yên trước khi xử lý (giây)
+            detector_factory: Hàm tạo detector (mặc định: PersonDetector)
+            use_native_events: Dùng watchdog nếu đã cài đặt
+            hash_content: Tính hash nội dung ảnh trong worker (cho ResultsStore)
+        """
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.sink = sink
+        self.state_path = state_path or os.path.join(self.watch_dir, ".face_counter_state.jsonl")
+        self.num_workers = max(1, workers)
+        self.confidence = confidence
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.detector_factory = detector_factory
+        self.use_native_events = use_native_events
+        self.hash_content = hash_content
+
+        # Trạng thái: các file đã xử lý {path: (mtime_ns, size)}
+        self.processed = self._load_state()
+        self._state_file = None
+        # Ảnh lỗi chưa hết lượt thử {path: (signature, số lần đã thử)}
+        self._attempts = {}
+
+        # File đang chờ ổn định {path: (signature, thời điểm thấy signature này)}
+        self._pending = {}
+        # File đã đưa vào hàng đợi nhưng chưa có kết quả
+        self._inflight = set()
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+
+        self._work_queue = queue.Queue(maxsize=self.num_workers * 4)
+        self._result_queue = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+        self._observer = None
+
+        # Thống kê
+        self.processed_count = 0
+        self.error_count = 0
+
+    # ------------------------------------------------------------------
+    # Checkpoint
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _read_legacy_state(path: str) -> dict:
+        """Checkpoint kiểu cũ: một object JSON {'processed': {path: [mtime_ns, size]}}"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or 'processed' not in data:
+            return None
+        return {p: tuple(sig) for p, sig in data['processed'].items()}
+
+    def _load_state(self) -> dict:
+        """Đọc checkpoint từ lần chạy trước (phát lại các dòng, dòng sau ghi đè dòng trước)"""
+        legacy_path = None
+        processed = self._read_legacy_state(self.state_path)
+        if processed is None and not os.path.exists(self.state_path):
+            legacy_path = os.path.splitext(self.state_path)[0] + ".json"
+            processed = self._read_legacy_state(legacy_path)
+        if processed is not None:
+            # Chuyển sang dạng ghi nối
+            self._compact_state(processed)
+            if legacy_path is not None:
+                try:
+                    os.remove(legacy_path)
+                except OSError:
+                    pass
+            return processed
+
+        processed = {}
+        lines = 0
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Dòng cuối ghi dở khi bị tắt đột ngột
+                        continue
+                    processed[entry['path']] = tuple(entry['sig'])
+                    lines += 1
+        except OSError:
+            return {}
+        if lines > COMPACT_RATIO * len(processed):
+            self._compact_state(processed)
+        return processed
+
+    def _compact_state(self, processed: dict):
+        """Ghi lại checkpoint mỗi file một dòng (ghi file tạm rồi replace)"""
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for path, sig in processed.items():
+                f.write(json.dumps({'path': path, 'sig': list(sig)}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def _append_state(self, entries: list):
+        """Ghi nối các file vừa xử lý vào checkpoint (chỉ phần mới, không ghi lại cả map)"""
+        if not entries:
+            return
+        if self._state_file is None:
+            self._state_file = open(self.state_path, 'a', encoding='utf-8')
+        for path, sig, failed in entries:
+            entry = {'path': path, 'sig': list(sig)}
+            if failed:
+                entry['failed'] = True
+            self._state_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._state_file.flush()
+        os.fsync(self._state_file.fileno())
+
+    # ------------------------------------------------------------------
+    # Phát hiện thay đổi
+    # ------------------------------------------------------------------
+    def _start_native_observer(self) -> bool:
+        """Bật theo dõi sự kiện hệ điều hành qua watchdog (nếu có)"""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return False
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+                    if path and path.lower().endswith(IMAGE_EXTENSIONS):
+                        with watcher._dirty_lock:
+                            watcher._dirty.add(os.path.abspath(path))
+
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), self.watch_dir, recursive=True)
+        self._observer.start()
+        return True
+
+    def _collect_candidates(self, full_scan: bool) -> dict:
+        """Lấy danh sách file cần kiểm tra trong vòng này"""
+        if full_scan:
+            with self._dirty_lock:
+                self._dirty.clear()
+            return scan_images(self.watch_dir)
+
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        candidates = {}
+        for path in dirty | set(self._pending):
+            sig = _file_signature(path)
+            if sig is not None:
+                candidates[path] = sig
+        return candidates
+
+    def _check_candidates(self, candidates: dict, now: float):
+        """Debounce và đưa các file đã ổn định vào hàng đợi"""
+        for path, sig in candidates.items():
+            if self.processed.get(path) == sig or path in self._inflight:
+                self._pending.pop(path, None)
+                continue
+
+            previous = self._pending.get(path)
+            if previous is None or previous[0] != sig:
+                # File mới hoặc vẫn đang được ghi -> bắt đầu đếm lại thời gian
+                self._pending[path] = (sig, now)
+                continue
+
+            if now - previous[1] >= self.settle_time:
+                del self._pending[path]
+                self._inflight.add(path)
+                # put() chặn khi hàng đợi đầy -> backpressure cho vòng quét
+                if not self._put_work((path, sig)):
+                    return
+
+        # Bỏ các file đã bị xóa trong lúc chờ
+        for path in list(self._pending):
+            if path not in candidates and _file_signature(path) is None:
+                del self._pending[path]
+
+    # ------------------------------------------------------------------
+    # Worker và writer
+    # ------------------------------------------------------------------
+    def _create_detector(self):
+        if self.detector_factory is not None:
+            return self.detector_factory()
+        from person_detector import PersonDetector
+        return PersonDetector()
+
+    def _worker(self, detector):
+        """Worker: mỗi thread giữ một detector riêng"""
+        while True:
+            item = self._work_queue.get()
+            if item is None:
+                break
+            path, sig = item
+            record = {
+                'path': path,
+                'mtime_ns': sig[0],
+                'size': sig[1],
+                'processed_at': time.time(),
+                'confidence': self.confidence,
+                'model': getattr(detector, 'model_name', None),
+            }
+            try:
+                if self.hash_content:
+                    record['content_hash'] = hash_file(path)
+                detections = detector.detect(path, confidence=self.confidence)
+                record['count'] = len(detections)
+                record['detections'] = detections
+            except Exception as e:
+                record['error'] = str(e)
+            self._result_queue.put((path, sig, record))
+
+    def _writer(self):
+        """Ghi kết quả theo nhóm rồi mới checkpoint (at-least-once)"""
+        while True:
+            item = self._result_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stop = False
+            while True:
+                try:
+                    nxt = self._result_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+
+            records = []
+            done = []
+            for path, sig, record in batch:
+                if 'error' in record:
+                    previous = self._attempts.get(path)
+                    attempts = previous[1] + 1 if previous and previous[0] == sig else 1
+                    if attempts < MAX_ATTEMPTS:
+                        # Chưa ghi vào processed -> lần quét sau đưa vào hàng đợi lại
+                        self._attempts[path] = (sig, attempts)
+                        continue
+                    record['attempts'] = attempts
+                records.append(record)
+                done.append((path, sig, 'error' in record))
+
+            self.sink.write(records)
+            for path, sig, failed in done:
+                self.processed[path] = sig
+                self._attempts.pop(path, None)
+                if failed:
+                    self.error_count += 1
+                else:
+                    self.processed_count += 1
+            self._append_state(done)
+            # Sau khi đã checkpoint mới cho phép quét lại các file này
+            for path, _, _ in batch:
+                self._inflight.discard(path)
+
+            if stop:
+                break
+
+    # ------------------------------------------------------------------
+    # Điều khiển
+    # ------------------------------------------------------------------
+    def _put_work(self, item) -> bool:
+        """Đưa item vào hàng đợi, chờ khi đầy nhưng không chặn mãi nếu worker đã dừng"""
+        while True:
+            try:
+                self._work_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                if not any(t.is_alive() for t in self._threads):
+                    return False
+                if item is not None and self._stop.is_set():
+                    return False
+
+    def start(self):
+        """
+        Khởi động worker pool và writer
+
+        Raises:
+            Exception: Lỗi tạo detector (thiếu model, không có mạng...) - chưa thread nào được chạy
+        """
+        # Các worker dùng chung thread pool của torch trong process: chia đều core
+        from cpu_scheduler import apply_thread_limits, threads_per_worker
+        apply_thread_limits(threads_per_worker(self.num_workers))
+        # Tạo detector trước khi chạy thread để lỗi load model báo thẳng cho người gọi
+        detectors = [self._create_detector() for _ in range(self.num_workers)]
+        for detector in detectors:
+            t = threading.Thread(target=self._worker, args=(detector,), daemon=True)
+            t.start()
+            self._threads.append(t)
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True)
+        self._writer_thread.start()
+
+    def run(self, once: bool = False, rescan_interval: float = 60.0):
+        """
+        Vòng lặp theo dõi chính (chặn cho tới khi stop() hoặc Ctrl+C)
+
+        Args:
+            once: Chỉ xử lý các ảnh đang có rồi thoát
+            rescan_interval: Khi dùng watchdog, chu kỳ quét toàn bộ để bắt sự kiện bị lỡ
+        """
+        try:
+            self.start()
+        except Exception:
+            self.sink.close()
+            raise
+        native = (not once) and self.use_native_events and self._start_native_observer()
+        last_full_scan = 0.0
+
+        try:
+            while not self._stop.is_set():
+                if not any(t.is_alive() for t in self._threads):
+                    raise RuntimeError("Tất cả worker đã dừng")
+                now = time.monotonic()
+                full_scan = (not native) or (now - last_full_scan >= rescan_interval)
+                if full_scan:
+                    last_full_scan = now
+                self._check_candidates(self._collect_candidates(full_scan), now)
+
+                # Chế độ once: chờ cả các ảnh đang xử lý (ảnh lỗi có thể quay lại để thử lại)
+                if once and not self._pending and not self._inflight:
+                    break
+                self._stop.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """Dừng theo dõi, chờ xử lý xong các ảnh đã vào hàng đợi"""
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if not self._threads:
+            return
+        for _ in self._threads:
+            if not self._put_work(None):
+                break
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        self._result_queue.put(None)
+        self._writer_thread.join()
+        if self._state_file is not None:
+            self._state_file.close()
+            self._state_file = None
+        self.sink.close()
+
+
+def main():
+    """Entry point cho chế độ theo dõi thư mục"""
+    parser = argparse.ArgumentParser(description="Theo dõi thư mục và đếm khuôn mặt cho ảnh mới")
+    parser.add_argument("watch_dir", help="Thư mục cần theo dõi")
+    parser.add_argument("-o", "--output", default="face_counts.jsonl", help="File kết quả (JSON Lines)")
+    parser.add_argument("--db", default=None, help="Ghi kết quả vào SQLite thay vì JSON Lines")
+    parser.add_argument("--state", default=None, help="File checkpoint trạng thái")
+    parser.add_argument("--workers", type=int, default=2, help="Số worker song song")
+    parser.add_argument("--confidence", type=float, default=0.3, help="Ngưỡng confidence")
+    parser.add_argument("--interval", type=float, default=1.0, help="Chu kỳ kiểm tra (giây)")
+    parser.add_argument("--settle", type=float, default=2.0, help="Thời gian chờ file ghi xong (giây)")
+    parser.add_argument("--polling", action="store_true", help="Bắt buộc dùng polling thay vì watchdog")
+    parser.add_argument("--once", action="store_true", help="Xử lý ảnh hiện có rồi thoát")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.watch_dir):
+        print(f"Không tìm thấy thư mục: {args.watch_dir}")
+        sys.exit(1)
+
+    if args.db:
+        sink = SqliteSink(ResultsStore(args.db))
+    else:
+        sink = JsonlSink(args.output)
+
+    watcher = FolderWatcher(
+        args.watch_dir,
+        sink,
+        state_path=args.state,
+        workers=args.workers,
+        confidence=args.confidence,
+        poll_interval=args.interval,
+        settle_time=args.settle,
+        use_native_events=not args.polling,
+        hash_content=bool(args.db),
+    )
+    print(f"Đang theo dõi: {watcher.watch_dir}")
+    try:
+        watcher.run(once=args.once)
+    except Exception as e:
+        print(f"Lỗi: {e}")
+        sys.exit(1)
+    print(f"Đã xử lý {watcher.processed_count} ảnh, {watcher.error_count} lỗi")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Frame Source Module
+Đọc ảnh động (GIF/WebP) và chuỗi ảnh đánh số trên đĩa thành các khung hình,
+lấy mẫu khung theo chính sách và chạy detect theo batch
+
+Cách sử dụng:
+    python frame_source.py clip.gif --policy nth --step 5
+    python frame_source.py frames/ --policy keyframes
+"""
+
+import os
+import re
+import sys
+import argparse
+
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+
+POLICY_ALL = "all"              # Mọi khung hình
+POLICY_NTH = "nth"              # Mỗi N khung lấy một
+POLICY_KEYFRAMES = "keyframes"  # Chỉ khung thay đổi đáng kể so với khung đã lấy trước đó
+POLICIES = (POLICY_ALL, POLICY_NTH, POLICY_KEYFRAMES)
+
+# Chênh lệch trung bình (0-255) trên ảnh xám thu nhỏ để coi là khung mới
+KEYFRAME_THRESHOLD = 12.0
+_THUMB_SIZE = (64, 64)
+
+# Tên file dạng <tiền tố><số><đuôi>, vd: frame_0001.jpg
+_NUMBERED = re.compile(r'^(.*?)(\d+)(\.[^.]+)$')
+
+
+class FrameSampler:
+    """Quyết định khung nào được đưa vào model"""
+
+    def __init__(self, policy: str = POLICY_ALL, step: int = 1,
+                 threshold: float = KEYFRAME_THRESHOLD):
+        """
+        Args:
+            policy: 'all', 'nth' hoặc 'keyframes'
+            step: Khoảng cách khung với policy 'nth'
+            threshold: Ngưỡng thay đổi với policy 'keyframes'
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Chính sách lấy mẫu không hợp lệ: {policy}")
+        self.policy = policy
+        self.step = max(1, step)
+        self.threshold = threshold
+        self._last_thumb = None
+
+    def accept(self, index: int, frame: np.ndarray) -> bool:
+        if self.policy == POLICY_ALL:
+            return True
+        if self.policy == POLICY_NTH:
+            return index % self.step == 0
+
+        # GIF/WebP không có keyframe thật -> dùng phát hiện thay đổi cảnh
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, _THUMB_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+        if self._last_thumb is not None:
+            if np.abs(thumb - self._last_thumb).mean() < self.threshold:
+                return False
+        self._last_thumb = thumb
+        return True
+
+
+def is_animated(path: str) -> bool:
+    """Ảnh có nhiều hơn một khung hình (GIF/WebP động)"""
+    try:
+        with Image.open(path) as img:
+            return getattr(img, 'n_frames', 1) > 1
+    except OSError:
+        return False
+
+
+def frame_count(path: str) -> int:
+    with Image.open(path) as img:
+        return getattr(img, 'n_frames', 1)
+
+
+def iter_animation(path: str):
+    """
+    Đọc lần lượt các khung của ảnh động (PIL xử lý disposal/blending giữa các khung)
+
+    Yields:
+        (index, timestamp_ms, ảnh BGR)
+    """
+    timestamp = 0
+    with Image.open(path) as img:
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            bgr = cv2.cvtColor(np.asarray(frame.convert('RGB')), cv2.COLOR_RGB2BGR)
+            yield index, timestamp, bgr
+            timestamp += frame.info.get('duration', 0) or 0
+
+
+def find_sequences(paths: list, min_length: int = 3) -> tuple:
+    """
+    Gom các file đánh số liên tiếp (cùng thư mục, tiền tố và đuôi) thành chuỗi
+
+    Returns:
+        (list chuỗi - mỗi chuỗi là list path đã sắp theo số, list ảnh lẻ còn lại)
+    """
+    groups = {}
+    singles = []
+    for path in paths:
+        match = _NUMBERED.match(os.path.basename(path))
+        if not match:
+            singles.append(path)
+            continue
+        prefix, number, ext = match.groups()
+        key = (os.path.dirname(path), prefix, ext.lower())
+        groups.setdefault(key, []).append((int(number), path))
+
+    sequences = []
+    for members in groups.values():
+        if len(members) >= min_length:
+            sequences.append([path for _, path in sorted(members)])
+        else:
+            singles.extend(path for _, path in members)
+    return sequences, singles
+
+
+def iter_sequence(paths: list, fps: float = None):
+    """
+    Đọc chuỗi ảnh đánh số
+
+    Yields:
+        (index, timestamp_ms hoặc None nếu không biết fps, ảnh BGR)
+    """
+    for index, path in enumerate(paths):
+        frame = cv2.imread(path)
+        if frame is None:
+            raise ValueError(f"Không thể đọc ảnh: {path}")
+        yield index, (index * 1000.0 / fps) if fps else None, frame
+
+
+def detect_frames(detector, frames, sampler: FrameSampler = None, confidence: float = 0.3,
+                  batch_size: int = 8, keep_frames: bool = False):
+    """
+    Detect trên các khung được lấy mẫu, gom batch để gọi model
+
+    Args:
+        detector: PersonDetector (hoặc đối tượng có detect_batch)
+        frames: Iterable (index, timestamp_ms, ảnh BGR) từ iter_animation/iter_sequence
+        sampler: FrameSampler (mặc định: mọi khung)
+        confidence: Ngưỡng confidence
+        batch_size: Số khung mỗi lần gọi model
+        keep_frames: Trả kèm ảnh của khung (key 'frame')
+
+    Yields:
+        Dict cho mỗi khung được xử lý (theo thứ tự): index, timestamp_ms, count, detections
+    """
+    sampler = sampler or FrameSampler()
+    batch = []
+
+    def flush():
+        results = detector.detect_batch([frame for _, _, frame in batch], confidence)
+        for (index, timestamp, frame), detections in zip(batch, results):
+            item = {'index': index, 'timestamp_ms': timestamp,
+                    'count': len(detections), 'detections': detections}
+            if keep_frames:
+                item['frame'] = frame
+            yield item
+        batch.clear()
+
+    for index, timestamp, frame in frames:
+        if not sampler.accept(index, frame):
+            continue
+        batch.append((index, timestamp, frame))
+        if len(batch) >= batch_size:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+def summarize(results: list) -> dict:
+    """Thống kê số khuôn mặt theo khung: max, trung bình và khung có nhiều mặt nhất"""
+    if not results:
+        return {'frames': 0, 'max': 0, 'mean': 0.0, 'peak_index': None}
+    peak = max(results, key=lambda r: r['count'])
+    return {
+        'frames': len(results),
+        'max': peak['count'],
+        'mean': sum(r['count'] for r in results) / len(results),
+        'peak_index': peak['index'],
+    }
+
+
+def main():
+    """In số khuôn mặt theo từng khung của ảnh động hoặc chuỗi ảnh"""
+    from pipeline import _expand_paths
+    from person_detector import PersonDetector
+
+    parser = argparse.ArgumentParser(description="Đếm khuôn mặt theo khung hình")
+    parser.add_argument("inputs", nargs="+", help="Ảnh động, chuỗi ảnh hoặc thư mục")
+    parser.add_argument("--policy", default=POLICY_ALL, choices=POLICIES, help="Chính sách lấy mẫu khung")
+    parser.add_argument("--step", type=int, default=5, help="Khoảng cách khung với --policy nth")
+    parser.add_argument("--threshold", type=float, default=KEYFRAME_THRESHOLD,
+                        help="Ngưỡng thay đổi với --policy keyframes")
+    parser.add_argument("--fps", type=float, default=None, help="Tốc độ khung của chuỗi ảnh")
+    parser.add_argument("--batch-size", type=int, default=8, help="Số khung mỗi batch inference")
+    parser.add_argument("--confidence", type=float, default=0.3, help="Ngưỡng confidence")
+    args = parser.parse_args()
+
+    paths = _expand_paths(args.inputs)
+    sequences, singles = find_sequences(paths)
+    sources = [(seq[0], iter_sequence(seq, args.fps)) for seq in sequences]
+    sources += [(path, iter_animation(path)) for path in singles if is_animated(path)]
+    if not sources:
+        print("Không tìm thấy ảnh động hoặc chuỗi ảnh nào")
+        sys.exit(1)
+
+    detector = PersonDetector()
+    for name, frames in sources:
+        sampler = FrameSampler(args.policy, args.step, args.threshold)
+        results = []
+        for result in detect_frames(detector, frames, sampler, args.confidence, args.batch_size):
+            results.append({'index': result['index'], 'count': result['count']})
+            timestamp = result['timestamp_ms']
+            when = f"{timestamp / 1000:7.2f}s" if timestamp is not None else ""
+            print(f"  khung {result['index']:>5} {when}  {result['count']:>4} khuôn mặt")
+        stats = summarize(results)
+        print(f"{name}: {stats['frames']} khung, tối đa {stats['max']} "
+              f"(khung {stats['peak_index']}), trung bình {stats['mean']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,18 +8,25 @@ sau đó tải về, giải nén và chạy main app.
 
 import tkinter as tk
 import threading
-import zipfile
 import os
 import sys
 import subprocess
-import math
 import shutil
-import urllib.request
 import tempfile
 
+from downloader import download_and_extract, fetch_checksum
+from updater import DeltaUpdater, write_install_manifest
+from spinner import Spinner
+
 # Cấu hình
 APP_NAME = "FaceCounter"
 APP_URL = "https://epllivescore.com/FaceCounterData.zip"
+APP_SHA256_URL = APP_URL + ".sha256"
+MANIFEST_URL = "https://epllivescore.com/FaceCounter/manifest.json"
+DOWNLOAD_CONNECTIONS = 4
+EXTRACT_WORKERS = 4
+FRAME_MS = 50
+PROGRESS_WIDTH = 350
 INSTALL_DIR = os.path.join(os.environ.get('LOCALAPPDATA', os.path.expanduser('~')), APP_NAME)
 MAIN_EXE = os.path.join(INSTALL_DIR, "FaceCounter", "FaceCounter.exe")
 
@@ -48,11 +55,12 @@ class LauncherSplash:
         self.root.configure(bg=self.bg_color)
         
         # Animation
-        self.angle = 0
         self.running = True
         self.progress = 0
         self.status_text = "Đang khởi động..."
         self.sub_status = ""
+        # Giá trị đang hiển thị: chỉ cập nhật widget khi khác giá trị mới
+        self._shown = {}
         
         self._create_widgets()
         self._animate()
@@ -101,6 +109,7 @@ class LauncherSplash:
             highlightthickness=0
         )
         self.canvas.pack(pady=10)
+        self.spinner = Spinner(self.canvas)
         
         # Progress bar
         progress_frame = tk.Frame(container, bg=self.bg_color)
@@ -108,12 +117,15 @@ class LauncherSplash:
         
         self.progress_bg = tk.Canvas(
             progress_frame,
-            width=350,
+            width=PROGRESS_WIDTH,
             height=10,
             bg="#333",
             highlightthickness=0
         )
         self.progress_bg.pack()
+        self.progress_bar = self.progress_bg.create_rectangle(
+            0, 0, 0, 10, fill=self.accent_color, outline="", state='hidden'
+        )
         
         # Status text chính
         self.status_label = tk.Label(
@@ -144,40 +156,35 @@ class LauncherSplash:
             bg=self.bg_color
         ).pack(pady=(10, 5))
         
-    def _draw_spinner(self):
-        """Vẽ spinner"""
-        self.canvas.delete("all")
-        cx, cy, radius, num_dots = 30, 30, 20, 8
+    def _changed(self, name, value) -> bool:
+        """Ghi nhận giá trị mới, True nếu khác giá trị đang hiển thị"""
+        if self._shown.get(name) == value:
+            return False
+        self._shown[name] = value
+        return True
         
-        for i in range(num_dots):
-            angle_rad = math.radians(self.angle + i * 45)
-            x = cx + radius * math.cos(angle_rad)
-            y = cy + radius * math.sin(angle_rad)
-            size = 6 - (i * 0.5)
-            opacity = 255 - (i * 25)
-            color = f"#{opacity:02x}{69:02x}{96:02x}"
-            
-            if size > 0:
-                self.canvas.create_oval(x-size, y-size, x+size, y+size, fill=color, outline="")
-                
     def _draw_progress(self):
-        """Vẽ progress bar"""
-        self.progress_bg.delete("all")
-        self.progress_bg.create_rectangle(0, 0, 350, 10, fill="#333", outline="")
-        if self.progress > 0:
-            width = int(350 * self.progress / 100)
-            self.progress_bg.create_rectangle(0, 0, width, 10, fill=self.accent_color, outline="")
+        """Cập nhật độ dài progress bar (một rectangle có sẵn)"""
+        width = int(PROGRESS_WIDTH * self.progress / 100)
+        if not self._changed('progress', width):
+            return
+        if width > 0:
+            self.progress_bg.coords(self.progress_bar, 0, 0, width, 10)
+            self.progress_bg.itemconfig(self.progress_bar, state='normal')
+        else:
+            self.progress_bg.itemconfig(self.progress_bar, state='hidden')
             
     def _animate(self):
-        """Animation loop"""
+        """Animation loop: spinner mỗi nhịp, progress/label chỉ khi giá trị đổi"""
         if not self.running:
             return
-        self.angle -= 15
-        self._draw_spinner()
+        self.spinner.advance()
         self._draw_progress()
-        self.status_label.config(text=self.status_text)
-        self.sub_status_label.config(text=self.sub_status)
-        self.root.after(50, self._animate)
+        if self._changed('status', self.status_text):
+            self.status_label.config(text=self.status_text)
+        if self._changed('sub_status', self.sub_status):
+            self.sub_status_label.config(text=self.sub_status)
+        self.root.after(FRAME_MS, self._animate)
         
     def _update_status(self, text, progress=None, sub=""):
         """Cập nhật status"""
@@ -201,73 +208,90 @@ class LauncherSplash:
             try:
                 # Kiểm tra app đã được cài đặt chưa
                 if os.path.exists(MAIN_EXE):
+                    self._check_update()
                     self._update_status("Đang khởi động ứng dụng...", 100)
                     self.root.after(500, lambda: self._launch_app())
                     return
                 
-                # Tạo thư mục tạm để download
+                # Tạo thư mục tạm để download (giữ cố định để có thể resume)
                 temp_dir = tempfile.gettempdir()
                 zip_path = os.path.join(temp_dir, "FaceCounterData.zip")
                 
-                # Download file
+                # Download + giải nén đồng thời vào thư mục staging
+                staging_dir = INSTALL_DIR + ".staging"
+                if os.path.exists(staging_dir):
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+                    
                 self._update_status("Đang tải ứng dụng...", 5, "Đang kết nối...")
+                progress_state = {'downloaded': 0, 'total': 0, 'extracted': 0, 'extract_total': 0}
                 
-                try:
-                    # Lấy thông tin file
-                    req = urllib.request.Request(APP_URL, headers={'User-Agent': 'FaceCounter/1.0'})
-                    response = urllib.request.urlopen(req, timeout=30)
-                    total_size = int(response.headers.get('Content-Length', 0))
-                    
-                    # Download với progress
-                    downloaded = 0
-                    chunk_size = 1024 * 64  # 64KB chunks
+                def show_progress():
+                    total_size = progress_state['total']
+                    downloaded = progress_state['downloaded']
+                    extract_text = ""
+                    if progress_state['extract_total']:
+                        extract_percent = int(100 * progress_state['extracted'] / progress_state['extract_total'])
+                        extract_text = f" · Giải nén {extract_percent}%"
+                    if total_size > 0:
+                        percent = int(100 * downloaded / total_size)
+                        self._update_status(
+                            f"Đang tải... {percent}%",
+                            5 + int(80 * downloaded / total_size),
+                            f"{self._format_size(downloaded)} / {self._format_size(total_size)}{extract_text}"
+                        )
+                    else:
+                        self._update_status(
+                            "Đang tải...",
+                            30,
+                            f"Đã tải: {self._format_size(downloaded)}{extract_text}"
+                        )
+                        
+                def on_download(downloaded, total_size):
+                    progress_state['downloaded'] = downloaded
+                    progress_state['total'] = total_size
+                    show_progress()
                     
-                    with open(zip_path, 'wb') as f:
-                        while True:
-                            chunk = response.read(chunk_size)
-                            if not chunk:
-                                break
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            
-                            if total_size > 0:
-                                progress = 5 + int(45 * downloaded / total_size)
-                                percent = int(100 * downloaded / total_size)
-                                self._update_status(
-                                    f"Đang tải... {percent}%",
-                                    progress,
-                                    f"{self._format_size(downloaded)} / {self._format_size(total_size)}"
-                                )
-                            else:
-                                self._update_status(
-                                    "Đang tải...",
-                                    30,
-                                    f"Đã tải: {self._format_size(downloaded)}"
-                                )
-                                
+                def on_extract(extracted_bytes, total_bytes, extracted, files):
+                    progress_state['extracted'] = extracted_bytes
+                    progress_state['extract_total'] = total_bytes
+                    show_progress()
+                
+                try:
+                    expected_sha256 = fetch_checksum(APP_SHA256_URL)
+                    if expected_sha256 is None:
+                        print(f"⚠️ CẢNH BÁO: không tải được {APP_SHA256_URL}, "
+                              f"bản cài sẽ KHÔNG được kiểm tra SHA-256")
+                        self._update_status("Đang tải ứng dụng...", 5,
+                                            "⚠️ Không có checksum - không kiểm tra được file tải về")
+                    # File giải nén nằm trong staging cho tới khi hash khớp (lỗi -> không cài)
+                    download_and_extract(
+                        APP_URL,
+                        zip_path,
+                        staging_dir,
+                        connections=DOWNLOAD_CONNECTIONS,
+                        extract_workers=EXTRACT_WORKERS,
+                        expected_sha256=expected_sha256,
+                        on_download=on_download,
+                        on_extract=on_extract
+                    )
                 except Exception as e:
-                    self._update_status(f"❌ Lỗi tải: {str(e)}", 0)
+                    self._update_status(f"❌ Lỗi tải: {str(e)}", 0, "Chạy lại để tiếp tục tải")
                     self.root.after(5000, self.root.destroy)
                     return
                 
-                # Tạo thư mục cài đặt
+                # Chuyển từ staging sang thư mục cài đặt
+                self._update_status("Đang cài đặt...", 95, "")
                 os.makedirs(INSTALL_DIR, exist_ok=True)
-                
-                # Giải nén
-                self._update_status("Đang giải nén...", 55, "Vui lòng đợi...")
-                
-                with zipfile.ZipFile(zip_path, 'r') as zf:
-                    files = zf.namelist()
-                    total = len(files)
-                    
-                    for i, file in enumerate(files):
-                        zf.extract(file, INSTALL_DIR)
-                        progress = 55 + int(40 * (i + 1) / total)
-                        self._update_status(
-                            f"Đang giải nén... {int((i+1)*100/total)}%",
-                            progress,
-                            f"{i+1}/{total} files"
-                        )
+                # Manifest của bản cài: lần cập nhật delta sau chỉ xoá file có trong manifest này
+                write_install_manifest(staging_dir, INSTALL_DIR)
+                for name in os.listdir(staging_dir):
+                    target = os.path.join(INSTALL_DIR, name)
+                    if os.path.isdir(target):
+                        shutil.rmtree(target)
+                    elif os.path.exists(target):
+                        os.remove(target)
+                    os.replace(os.path.join(staging_dir, name), target)
+                shutil.rmtree(staging_dir, ignore_errors=True)
                 
                 # Xóa file zip tạm
                 try:
@@ -284,6 +308,31 @@ class LauncherSplash:
                 
         threading.Thread(target=process, daemon=True).start()
         
+    def _check_update(self):
+        """Cập nhật delta nếu server có phiên bản mới (lỗi mạng thì bỏ qua)"""
+        self._update_status("Đang kiểm tra cập nhật...", 10)
+        
+        def on_progress(done, total):
+            percent = int(100 * done / total) if total else 100
+            self._update_status(
+                f"Đang cập nhật... {percent}%",
+                10 + int(80 * done / total) if total else 90,
+                f"{self._format_size(done)} / {self._format_size(total)}"
+            )
+            
+        try:
+            updater = DeltaUpdater(INSTALL_DIR, MANIFEST_URL, on_progress=on_progress)
+            size = updater.check()
+            if updater.changed or updater.removed:
+                self._update_status(
+                    "Đang cập nhật...", 10,
+                    f"{len(updater.changed)} files, {self._format_size(size)}"
+                )
+                updater.apply()
+        except Exception as e:
+            # Không chặn việc mở app khi offline hoặc server lỗi
+            print(f"Không thể cập nhật: {e}")
+            
     def _launch_app(self):
         """Chạy main app"""
         self.running = False
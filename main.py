@@ -17,11 +17,12 @@ import tkinter as tk
 import threading
 import sys
 import os
-import math
 
-# Thêm thư mục hiện tại vào path (cho PyInstaller)
-if getattr(sys, 'frozen', False):
-    os.chdir(os.path.dirname(sys.executable))
+from spinner import Spinner
+
+# Nhịp animation (ms) và số nhịp giữa hai lần đổi dấu "..."
+FRAME_MS = 50
+DOTS_EVERY = 6
 
 
 class SplashAndApp:
@@ -51,8 +52,7 @@ class SplashAndApp:
         self.root.configure(bg=self.bg_color)
         
         # Animation variables
-        self.angle = 0
-        self.dots = 0
+        self.ticks = 0
         self.loading = True
         
         # Tạo splash UI
@@ -108,6 +108,7 @@ class SplashAndApp:
             highlightthickness=0
         )
         self.canvas.pack(pady=10)
+        self.spinner = Spinner(self.canvas)
         
         # Loading text
         self.loading_label = tk.Label(
@@ -128,44 +129,19 @@ class SplashAndApp:
             bg=self.bg_color
         ).pack(pady=(10, 5))
         
-    def _draw_spinner(self):
-        """Vẽ spinner animation"""
-        self.canvas.delete("all")
-        
-        cx, cy = 30, 30
-        radius = 20
-        num_dots = 8
-        
-        for i in range(num_dots):
-            angle_rad = math.radians(self.angle + i * (360 / num_dots))
-            x = cx + radius * math.cos(angle_rad)
-            y = cy + radius * math.sin(angle_rad)
-            
-            size = 6 - (i * 0.5)
-            opacity = 255 - (i * 25)
-            color = f"#{opacity:02x}{69:02x}{96:02x}"
-            
-            if size > 0:
-                self.canvas.create_oval(
-                    x - size, y - size,
-                    x + size, y + size,
-                    fill=color,
-                    outline=""
-                )
-        
     def _animate(self):
-        """Animation loop"""
+        """Animation loop: chỉ dời các chấm có sẵn, đổi chữ khi số dấu chấm thay đổi"""
         if not self.loading:
             return
             
-        self.angle -= 15
-        self._draw_spinner()
+        self.spinner.advance()
         
-        dots_text = "." * (self.dots % 4)
-        self.loading_label.config(text=f"Đang khởi động{dots_text}")
-        self.dots += 1
+        if self.ticks % DOTS_EVERY == 0:
+            dots_text = "." * (self.ticks // DOTS_EVERY % 4)
+            self.loading_label.config(text=f"Đang khởi động{dots_text}")
+        self.ticks += 1
         
-        self.root.after(50, self._animate)
+        self.root.after(FRAME_MS, self._animate)
         
     def _start_loading(self):
         """Bắt đầu load app trong background"""
@@ -207,8 +183,15 @@ class SplashAndApp:
         self.root.mainloop()
 
 
+# File dữ liệu bản cũ ghi cạnh exe (thư mục làm việc khi còn os.chdir)
+LEGACY_DATA_FILES = ("face_counter_results.db", "face_counter_raw.db", "roi_profiles.json", "cpu_plan.json")
+
+
 def main():
     """Entry point"""
+    if getattr(sys, 'frozen', False):
+        from model_registry import migrate_legacy_data
+        migrate_legacy_data(os.path.dirname(sys.executable), LEGACY_DATA_FILES)
     app = SplashAndApp()
     app.run()
 
@@ -0,0 +1,306 @@
+"""
+Memory Budget Module
+Ngân sách RAM dùng chung cho cả process: quyết định tỉ lệ decode ảnh để xem,
+kích thước batch, giải phóng cache (tile, pyramid, output thô) và chặn stage phía trước
+khi pipeline giữ quá nhiều ảnh; ghi lại mức dùng cao nhất theo từng stage
+
+Ngân sách mặc định: biến môi trường FACE_COUNTER_MEMORY_MB, nếu không có thì
+một nửa RAM vật lý.
+
+Cách sử dụng:
+    python memory_budget.py                 # Xem ngân sách và RAM của máy
+    FACE_COUNTER_MEMORY_MB=3000 python main.py
+"""
+
+import os
+import sys
+import gc
+import time
+import threading
+
+BUDGET_ENV = "FACE_COUNTER_MEMORY_MB"
+DEFAULT_FRACTION = 0.5               # Phần RAM vật lý dùng làm ngân sách mặc định
+FALLBACK_TOTAL = 4 * 1024 ** 3       # Khi không đọc được RAM vật lý
+
+# Ước lượng bộ nhớ inference cho mỗi ảnh trong batch (tensor đầu vào + activation YOLOv8 ở 640)
+INFERENCE_ITEM_BYTES = 96 * 1024 ** 2
+
+# Phần ngân sách tối đa cho một ảnh đang xem (pyramid); lớn hơn thì decode thu nhỏ
+VIEW_SHARE = 0.25
+DECODE_SCALES = (1, 2, 4, 8)
+
+
+def physical_memory() -> int:
+    """Tổng RAM vật lý (bytes)"""
+    try:
+        import psutil
+        return psutil.virtual_memory().total
+    except Exception:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return FALLBACK_TOTAL
+
+
+def peak_rss() -> int:
+    """Mức RSS cao nhất của process (bytes), 0 nếu không đọc được"""
+    if sys.platform == 'win32':
+        # Windows không có module resource; psutil có peak working set
+        try:
+            import psutil
+            return getattr(psutil.Process().memory_info(), 'peak_wset', 0)
+        except Exception:
+            return 0
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def trim_allocators():
+    """Trả bộ nhớ đã giải phóng về hệ điều hành (GC, cache CUDA của torch, malloc_trim của glibc)"""
+    gc.collect()
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        try:
+            if torch.cuda.is_available() and torch.cuda.is_initialized():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+    if sys.platform.startswith('linux'):
+        try:
+            import ctypes
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def format_bytes(size: int) -> str:
+    return f"{size / 1024 ** 2:.0f} MB"
+
+
+class MemoryBudget:
+    """
+    Bộ đếm bytes theo stage với giới hạn chung
+
+    - acquire/release: phần bộ nhớ của một ảnh đang đi qua pipeline; acquire chặn
+      (backpressure) khi vượt ngân sách, sau khi đã thử giải phóng các cache đăng ký
+    - add: ghi nhận bộ nhớ không chặn (cache, ảnh đang xem)
+    - move: chuyển phần đã ghi nhận sang stage tiếp theo (để báo cáo theo stage)
+    """
+
+    def __init__(self, limit: int = None):
+        """
+        Args:
+            limit: Ngân sách (bytes); None: theo biến môi trường hoặc nửa RAM vật lý
+        """
+        if limit is None:
+            env = os.environ.get(BUDGET_ENV)
+            limit = int(float(env) * 1024 ** 2) if env else int(physical_memory() * DEFAULT_FRACTION)
+        self.limit = max(64 * 1024 ** 2, int(limit))
+        self._usage = {}
+        self._peaks = {}
+        self._total = 0
+        self._peak_total = 0
+        self._reserved = 0               # Phần đã acquire chưa release (ảnh đang trong pipeline)
+        self._caches = {}
+        self._cond = threading.Condition()
+
+    # ------------------------------------------------------------------
+    # Ghi nhận
+    # ------------------------------------------------------------------
+    def _record(self, stage: str, delta: int):
+        """Cập nhật bộ đếm (gọi khi đang giữ lock)"""
+        current = max(0, self._usage.get(stage, 0) + delta)
+        self._usage[stage] = current
+        self._peaks[stage] = max(self._peaks.get(stage, 0), current)
+        self._total = max(0, self._total + delta)
+        self._peak_total = max(self._peak_total, self._total)
+
+    def add(self, stage: str, nbytes: int):
+        """Ghi nhận thêm (hoặc bớt nếu âm) bộ nhớ cho stage, không chặn"""
+        with self._cond:
+            self._record(stage, nbytes)
+            if nbytes < 0:
+                self._cond.notify_all()
+        if nbytes > 0 and self.over_budget():
+            self.evict(self._total - self.limit)
+
+    def acquire(self, nbytes: int, stage: str, timeout: float = None) -> bool:
+        """
+        Giữ nbytes cho stage, chờ đến khi còn đủ ngân sách
+
+        Chỉ chờ khi còn phần đã acquire (ảnh khác đang trong pipeline) chưa release:
+        bộ nhớ ghi nhận bằng add (ảnh đang xem, tile, model) không tự giảm theo pipeline,
+        nên yêu cầu lớn hơn phần còn trống vẫn được cấp khi không còn ảnh nào khác
+        đang được giữ (để không kẹt vĩnh viễn). Mỗi vòng chờ đều thử giải phóng cache
+        (có cache chỉ giải phóng trễ, vd: tile trên thread Tk).
+
+        Returns:
+            False nếu hết timeout mà vẫn không đủ chỗ
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._total + nbytes > self.limit:
+                self._cond.release()
+                try:
+                    self.evict(self._total + nbytes - self.limit)
+                finally:
+                    self._cond.acquire()
+                if self._total + nbytes <= self.limit or self._reserved == 0:
+                    break
+                wait = None if deadline is None else deadline - time.monotonic()
+                if wait is not None and wait <= 0:
+                    return False
+                self._cond.wait(min(wait, 0.5) if wait is not None else 0.5)
+            self._record(stage, nbytes)
+            self._reserved += nbytes
+            return True
+
+    def release(self, nbytes: int, stage: str):
+        """Trả lại phần đã acquire"""
+        with self._cond:
+            self._record(stage, -nbytes)
+            self._reserved = max(0, self._reserved - nbytes)
+            self._cond.notify_all()
+
+    def move(self, nbytes: int, from_stage: str, to_stage: str):
+        """Chuyển bộ nhớ đã giữ sang stage khác (tổng không đổi)"""
+        with self._cond:
+            self._record(from_stage, -nbytes)
+            self._record(to_stage, nbytes)
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+    def register_cache(self, name: str, evict_fn):
+        """
+        Đăng ký cache có thể giải phóng khi thiếu bộ nhớ
+
+        Args:
+            name: Tên cache (đăng ký lại cùng tên sẽ thay thế)
+            evict_fn: Hàm(bytes cần giải phóng) -> số bytes đã giải phóng (ước lượng)
+        """
+        with self._cond:
+            self._caches[name] = evict_fn
+
+    def unregister_cache(self, name: str):
+        with self._cond:
+            self._caches.pop(name, None)
+
+    def evict(self, nbytes: int) -> int:
+        """Giải phóng cache đã đăng ký cho tới khi đủ nbytes; trả về số bytes giải phóng được"""
+        with self._cond:
+            caches = list(self._caches.values())
+        freed = 0
+        for evict_fn in caches:
+            if freed >= nbytes:
+                break
+            try:
+                freed += evict_fn(nbytes - freed) or 0
+            except Exception as e:
+                print(f"Không thể giải phóng cache: {e}")
+        if freed:
+            trim_allocators()
+        return freed
+
+    # ------------------------------------------------------------------
+    # Quyết định theo ngân sách
+    # ------------------------------------------------------------------
+    @property
+    def used(self) -> int:
+        return self._total
+
+    @property
+    def available(self) -> int:
+        return max(0, self.limit - self._total)
+
+    def over_budget(self) -> bool:
+        return self._total > self.limit
+
+    def decode_scale(self, width: int, height: int, channels: int = 3, share: float = VIEW_SHARE) -> int:
+        """
+        Hệ số thu nhỏ khi decode ảnh để xem (1, 2, 4, 8) sao cho ảnh cùng pyramid
+        (thêm khoảng 1/3) nằm trong share ngân sách
+        """
+        allowed = self.limit * share
+        for scale in DECODE_SCALES:
+            if width * height * channels * 4 / 3 / (scale * scale) <= allowed:
+                return scale
+        return DECODE_SCALES[-1]
+
+    def batch_size(self, requested: int, item_bytes: int = INFERENCE_ITEM_BYTES) -> int:
+        """Số ảnh mỗi batch inference vừa với phần ngân sách còn trống (tối thiểu 1)"""
+        return max(1, min(requested, self.available // max(1, item_bytes)))
+
+    def report(self) -> dict:
+        """
+        Returns:
+            Dict: limit, used, peak (tổng đã ghi nhận), rss_peak (cả process),
+            stages: {stage: {'current', 'peak'}}
+        """
+        with self._cond:
+            stages = {
+                stage: {'current': self._usage.get(stage, 0), 'peak': peak}
+                for stage, peak in self._peaks.items()
+            }
+            return {
+                'limit': self.limit,
+                'used': self._total,
+                'peak': self._peak_total,
+                'rss_peak': peak_rss(),
+                'stages': stages,
+            }
+
+    def format_report(self) -> str:
+        report = self.report()
+        lines = [
+            f"Bộ nhớ: ngân sách {format_bytes(report['limit'])}, cao nhất {format_bytes(report['peak'])} "
+            f"(RSS cao nhất {format_bytes(report['rss_peak'])})"
+        ]
+        for stage, usage in sorted(report['stages'].items(), key=lambda item: -item[1]['peak']):
+            lines.append(f"  {stage:<12} cao nhất {format_bytes(usage['peak']):>8}, "
+                         f"hiện tại {format_bytes(usage['current']):>8}")
+        return "\n".join(lines)
+
+
+_default_budget = None
+_default_lock = threading.Lock()
+
+
+def get_budget() -> MemoryBudget:
+    """Ngân sách dùng chung của process (tạo lần đầu khi cần)"""
+    global _default_budget
+    with _default_lock:
+        if _default_budget is None:
+            _default_budget = MemoryBudget()
+        return _default_budget
+
+
+def set_budget(limit_mb: float) -> MemoryBudget:
+    """Đặt lại ngân sách dùng chung (MB), giữ các cache đã đăng ký"""
+    budget = get_budget()
+    with budget._cond:
+        budget.limit = max(64 * 1024 ** 2, int(limit_mb * 1024 ** 2))
+        budget._cond.notify_all()
+    return budget
+
+
+def main():
+    budget = get_budget()
+    print(f"RAM vật lý: {format_bytes(physical_memory())}")
+    print(f"Ngân sách:  {format_bytes(budget.limit)} "
+          f"({'đặt bởi ' + BUDGET_ENV if os.environ.get(BUDGET_ENV) else 'mặc định'})")
+    print(f"Batch inference tối đa: {budget.batch_size(1 << 16)} ảnh")
+    for megapixels in (12, 50, 100, 300):
+        pixels = megapixels * 1_000_000
+        width = int((pixels * 2) ** 0.5)
+        print(f"Ảnh {megapixels:>3} MP xem với tỉ lệ 1/{budget.decode_scale(width, pixels // width)}")
+
+
+if __name__ == "__main__":
+    main()
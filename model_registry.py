@@ -0,0 +1,358 @@
+"""
+Model Registry Module
+Quản lý model weights: tìm theo tên, tải về cache dùng chung, kiểm tra hash
+
+Cách sử dụng (lúc cài đặt):
+    python model_registry.py preload yolov8n yolov8s
+    python model_registry.py import yolov8n-face path/to/yolov8n-face.pt
+    python model_registry.py list
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import shutil
+import hashlib
+import argparse
+import urllib.request
+
+ULTRALYTICS_ASSETS = "https://github.com/ultralytics/assets/releases/download/v8.2.0/"
+
+# Các model đã biết. sha256 = None: ghi nhận hash ở lần tải đầu tiên (trust on first use)
+# và kiểm tra lại ở các lần sau. Face model không có nguồn chính thức -> phải import.
+MODEL_SPECS = {
+    'yolov8n': {'url': ULTRALYTICS_ASSETS + "yolov8n.pt", 'task': 'detect', 'sha256': None},
+    'yolov8s': {'url': ULTRALYTICS_ASSETS + "yolov8s.pt", 'task': 'detect', 'sha256': None},
+    'yolov8m': {'url': ULTRALYTICS_ASSETS + "yolov8m.pt", 'task': 'detect', 'sha256': None},
+    'yolov8n-face': {'url': None, 'task': 'pose', 'sha256': None},
+    'yolov8s-face': {'url': None, 'task': 'pose', 'sha256': None},
+    'yolov8m-face': {'url': None, 'task': 'pose', 'sha256': None},
+}
+
+MODEL_SIZES = ('n', 's', 'm')
+MODEL_FORMATS = ('pt', 'onnx')
+LOCK_TIMEOUT = 600  # Lock cũ hơn 10 phút coi như bị bỏ lại
+
+
+def model_name(size: str = 'n', face: bool = False) -> str:
+    """Tên model theo kích thước và loại, vd: yolov8s-face"""
+    if size not in MODEL_SIZES:
+        raise ValueError(f"Kích thước model không hợp lệ: {size}")
+    return f"yolov8{size}" + ("-face" if face else "")
+
+
+def _user_base() -> str:
+    return os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+
+
+def default_cache_dir() -> str:
+    """Thư mục cache dùng chung cho mọi process của người dùng"""
+    env = os.environ.get('FACE_COUNTER_MODEL_DIR')
+    if env:
+        return env
+    return os.path.join(_user_base(), 'FaceCounter', 'models')
+
+
+def default_data_dir() -> str:
+    """
+    Thư mục dữ liệu của người dùng (lịch sử kết quả, cache output thô, ROI, plan CPU)
+
+    Nằm ngoài thư mục cài đặt (%LOCALAPPDATA%/FaceCounter) để bản cập nhật không đụng tới.
+    """
+    env = os.environ.get('FACE_COUNTER_DATA_DIR')
+    if env:
+        return env
+    return os.path.join(_user_base(), 'FaceCounterData')
+
+
+def data_path(name: str) -> str:
+    """Đường dẫn file trong thư mục dữ liệu của người dùng (tạo thư mục nếu chưa có)"""
+    data_dir = default_data_dir()
+    try:
+        os.makedirs(data_dir, exist_ok=True)
+    except OSError:
+        pass
+    return os.path.join(data_dir, name)
+
+
+def migrate_legacy_data(old_dir: str, names: tuple) -> list:
+    """
+    Chuyển file dữ liệu của bản cũ (ghi cạnh exe) sang thư mục dữ liệu
+
+    Chỉ chuyển khi thư mục dữ liệu chưa có file cùng tên; file SQLite được chuyển
+    cùng -wal/-shm để không mất phần chưa checkpoint.
+
+    Returns:
+        Danh sách file đã chuyển
+    """
+    moved = []
+    for name in names:
+        source = os.path.join(old_dir, name)
+        target = data_path(name)
+        if not os.path.exists(source) or os.path.exists(target):
+            continue
+        for suffix in ('-wal', '-shm', ''):
+            if os.path.exists(source + suffix):
+                try:
+                    shutil.move(source + suffix, target + suffix)
+                    moved.append(target + suffix)
+                except OSError as e:
+                    print(f"Không thể chuyển {source + suffix}: {e}")
+    return moved
+
+
+def _bundled_dirs() -> list:
+    """Các thư mục có thể chứa model đi kèm bản build (cạnh exe/module, thư mục hiện tại)"""
+    dirs = []
+    if getattr(sys, 'frozen', False):
+        dirs.append(os.path.dirname(sys.executable))
+    dirs.append(os.path.dirname(os.path.abspath(__file__)))
+    dirs.append(os.getcwd())
+    return dirs
+
+
+def _sha256(path: str) -> str:
+    """Hash file qua mmap (không copy toàn bộ file vào bộ nhớ process)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            for start in range(0, len(view), 1024 * 1024):
+                h.update(view[start:start + 1024 * 1024])
+            view.release()
+    return h.hexdigest()
+
+
+class _FileLock:
+    """Lock liên process đơn giản bằng file tạo với O_EXCL"""
+
+    def __init__(self, path: str, timeout: float = LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def __enter__(self):
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.timeout:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.2)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class ModelRegistry:
+    """
+    Resolve tên model (n/s/m, person/face, pt/onnx) thành file trong cache dùng chung
+
+    - Tải từ URL hoặc lấy bản đi kèm, đặt vào cache bằng file tạm + os.replace
+    - Kiểm tra sha256 (so với spec, hoặc hash đã ghi nhận lần đầu)
+    - Nhiều process dùng chung một bản weights trên đĩa (chung page cache của OS)
+    """
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+
+    # ------------------------------------------------------------------
+    # Index (hash đã kiểm tra của từng file)
+    # ------------------------------------------------------------------
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index: dict):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def _record(self, filename: str, sha: str):
+        """Ghi nhận hash đã kiểm tra (kèm size/mtime để lần sau không phải hash lại)"""
+        path = os.path.join(self.cache_dir, filename)
+        st = os.stat(path)
+        with _FileLock(self.index_path + ".lock"):
+            index = self._load_index()
+            index[filename] = {'sha256': sha, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+            self._save_index(index)
+
+    def _expected_hash(self, name: str, fmt: str):
+        spec = MODEL_SPECS.get(name, {})
+        return spec.get('sha256') if fmt == 'pt' else None
+
+    def verify(self, name: str, fmt: str = 'pt') -> bool:
+        """Kiểm tra file trong cache còn nguyên vẹn"""
+        filename = f"{name}.{fmt}"
+        path = os.path.join(self.cache_dir, filename)
+        if not os.path.exists(path):
+            return False
+        entry = self._load_index().get(filename)
+        st = os.stat(path)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return True
+        sha = _sha256(path)
+        expected = self._expected_hash(name, fmt) or (entry or {}).get('sha256')
+        if expected and sha != expected:
+            return False
+        self._record(filename, sha)
+        return True
+
+    # ------------------------------------------------------------------
+    # Đặt file vào cache
+    # ------------------------------------------------------------------
+    def _place(self, name: str, fmt: str, fill):
+        """Tạo file tạm trong cache bằng fill(tmp_path), kiểm tra hash rồi os.replace"""
+        filename = f"{name}.{fmt}"
+        target = os.path.join(self.cache_dir, filename)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        try:
+            fill(tmp_path)
+            sha = _sha256(tmp_path)
+            expected = self._expected_hash(name, fmt)
+            if expected and sha != expected:
+                raise ValueError(f"Hash của {filename} không khớp")
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._record(filename, sha)
+        return target
+
+    def import_file(self, name: str, source: str, fmt: str = None) -> str:
+        """Đưa một file weights có sẵn vào cache (dùng cho face model hoặc bản đi kèm)"""
+        fmt = fmt or os.path.splitext(source)[1].lstrip('.') or 'pt'
+        with _FileLock(os.path.join(self.cache_dir, f"{name}.{fmt}.lock")):
+            return self._place(name, fmt, lambda tmp: shutil.copyfile(source, tmp))
+
+    def _download(self, url: str, tmp_path: str):
+        req = urllib.request.Request(url, headers={'User-Agent': 'FaceCounter/1.0'})
+        with urllib.request.urlopen(req, timeout=60) as response, open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(response, f, 1024 * 1024)
+
+    def _export_onnx(self, name: str, tmp_path: str):
+        """Chuyển .pt sang .onnx bằng ultralytics"""
+        from ultralytics import YOLO
+        pt_path = self.resolve(name, 'pt')
+        exported = YOLO(pt_path).export(format='onnx')
+        shutil.move(exported, tmp_path)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def is_available(self, name: str, fmt: str = 'pt') -> bool:
+        """Model có thể dùng được mà không cần mạng"""
+        if os.path.exists(os.path.join(self.cache_dir, f"{name}.{fmt}")):
+            return True
+        if any(os.path.exists(os.path.join(d, f"{name}.{fmt}")) for d in _bundled_dirs()):
+            return True
+        return fmt == 'onnx' and self.is_available(name, 'pt')
+
+    def resolve(self, name: str, fmt: str = 'pt') -> str:
+        """
+        Lấy đường dẫn file weights trong cache (tải/import/export nếu chưa có)
+
+        Args:
+            name: Tên model, vd: yolov8n, yolov8s-face
+            fmt: 'pt' hoặc 'onnx'
+
+        Returns:
+            Đường dẫn tuyệt đối tới file trong cache
+
+        Raises:
+            FileNotFoundError: Không có bản đi kèm và không có URL để tải
+        """
+        if fmt not in MODEL_FORMATS:
+            raise ValueError(f"Định dạng model không hợp lệ: {fmt}")
+        filename = f"{name}.{fmt}"
+        target = os.path.join(self.cache_dir, filename)
+        if self.verify(name, fmt):
+            return target
+
+        with _FileLock(target + ".lock"):
+            # Process khác có thể vừa đặt file xong trong lúc chờ lock
+            if self.verify(name, fmt):
+                return target
+            if os.path.exists(target):
+                os.remove(target)
+
+            for directory in _bundled_dirs():
+                bundled = os.path.join(directory, filename)
+                if os.path.exists(bundled):
+                    return self._place(name, fmt, lambda tmp: shutil.copyfile(bundled, tmp))
+
+            if fmt == 'onnx':
+                return self._place(name, fmt, lambda tmp: self._export_onnx(name, tmp))
+
+            url = MODEL_SPECS.get(name, {}).get('url')
+            if not url:
+                raise FileNotFoundError(
+                    f"Không tìm thấy model {filename}, hãy import bằng: "
+                    f"python model_registry.py import {name} <file>"
+                )
+            print(f"Đang tải {filename}...")
+            return self._place(name, fmt, lambda tmp: self._download(url, tmp))
+
+    def task(self, name: str) -> str:
+        """Loại task của model (detect/pose) - cần khi load file .onnx"""
+        return MODEL_SPECS.get(name, {}).get('task', 'detect')
+
+    def list_cached(self) -> list:
+        """Các model đang có trong cache: [(filename, size)]"""
+        return [
+            (name, os.path.getsize(os.path.join(self.cache_dir, name)))
+            for name in sorted(os.listdir(self.cache_dir))
+            if name.endswith(tuple(f".{fmt}" for fmt in MODEL_FORMATS))
+        ]
+
+
+def main():
+    """CLI quản lý cache model"""
+    parser = argparse.ArgumentParser(description="Quản lý model weights")
+    parser.add_argument("--cache-dir", default=None, help="Thư mục cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    preload = sub.add_parser("preload", help="Tải trước model vào cache")
+    preload.add_argument("names", nargs="+", help="Tên model, vd: yolov8n yolov8s")
+    preload.add_argument("--format", default="pt", choices=MODEL_FORMATS)
+
+    imp = sub.add_parser("import", help="Đưa file weights có sẵn vào cache")
+    imp.add_argument("name", help="Tên model, vd: yolov8n-face")
+    imp.add_argument("source", help="Đường dẫn file weights")
+
+    sub.add_parser("list", help="Liệt kê model trong cache")
+
+    args = parser.parse_args()
+    registry = ModelRegistry(args.cache_dir)
+
+    if args.command == "preload":
+        for name in args.names:
+            print(f"{name}: {registry.resolve(name, args.format)}")
+    elif args.command == "import":
+        print(registry.import_file(args.name, args.source))
+    else:
+        for name, size in registry.list_cached():
+            print(f"{size / (1024 * 1024):>8.1f} MB  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,184 +6,583 @@ Sử dụng YOLOv8-face để phát hiện và đếm khuôn mặt trong ảnh
 import cv2
 import numpy as np
 from ultralytics import YOLO
-from PIL import Image, ImageDraw, ImageFont
-import os
+from PIL import Image
+
+from model_registry import ModelRegistry, model_name
+from annotator import default_annotator
+from roi import to_polygon, crop_region, inside
+from raw_cache import image_key, path_key, RAW_FLOOR_CONFIDENCE, RAW_MAX_DET
+from spatial_index import GridIndex
+
+
+# Các chế độ phát hiện
+MODE_AUTO = "auto"            # Dùng face model nếu có, nếu không thì ước lượng từ person
+MODE_FACE = "face"            # Face model trên toàn ảnh
+MODE_PERSON = "person"        # Person model + ước lượng vùng đầu
+MODE_TWO_STAGE = "two_stage"  # Person model, sau đó face model trên các crop vùng đầu
+
+# Kích thước inference cho các crop vùng đầu ở chế độ two-stage
+FACE_CROP_SIZE = 160
+
+# Từ số box này NMS dùng chỉ mục lưới (chỉ so sánh box lân cận) thay vì so với cả mảng
+GRID_NMS_MIN_BOXES = 512
+
+# Chế độ trả lời sớm ("có ai không?", "có ít nhất N người?")
+EARLY_EXIT_IMGSZ = 320     # Lượt probe độ phân giải thấp
+EARLY_EXIT_WEAK = 0.5      # Ứng viên yếu: confidence >= ngưỡng x hệ số này
+FULL_PASS_MAX_SIDE = 1280  # Ảnh lớn hơn thì lượt cuối chạy tiling
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: float = 0.2) -> list:
+    """Chia ảnh thành các tile chồng lấp, trả về list (x1, y1, x2, y2)"""
+    step = max(1, int(tile_size * (1 - overlap)))
+    
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+    
+    return [
+        (x, y, min(width, x + tile_size), min(height, y + tile_size))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.5) -> list:
+    """Non-maximum suppression, trả về index các box được giữ (theo score giảm dần)"""
+    if len(boxes) >= GRID_NMS_MIN_BOXES:
+        return GridIndex(boxes).suppress(scores, iou_threshold)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        overlap = inter / np.maximum(1e-6, areas[i] + areas[rest] - inter)
+        order = rest[overlap <= iou_threshold]
+    return keep
 
 
 class PersonDetector:
     """Class để phát hiện khuôn mặt trong ảnh sử dụng YOLOv8-face"""
     
-    def __init__(self):
+    # Tỉ lệ ước lượng vùng đầu/mặt từ person bounding box
+    HEAD_HEIGHT_RATIO = 0.35  # 35% chiều cao person là vùng đầu/mặt
+    HEAD_WIDTH_RATIO = 0.7    # Tối đa 70% chiều rộng person
+    HEAD_ASPECT = 1.2         # Rộng tối đa 1.2 lần chiều cao vùng đầu
+    
+    def __init__(self, mode: str = MODE_AUTO, model_size: str = 'n',
+                 backend: str = 'pt', registry: ModelRegistry = None):
         """
         Khởi tạo detector với YOLOv8-face model
+        
+        Args:
+            mode: Chế độ phát hiện (auto, face, person, two_stage)
+            model_size: Kích thước model: 'n' (nhanh nhất), 's', 'm' (chính xác hơn)
+            backend: Định dạng weights: 'pt' hoặc 'onnx'
+            registry: ModelRegistry dùng chung (mặc định: cache của người dùng)
         """
-        # Sử dụng yolov8n-face model - chuyên biệt cho face detection
-        # Model này được train đặc biệt để detect faces
-        model_path = "yolov8n-face.pt"
+        self.registry = registry or ModelRegistry()
+        self.model_size = model_size
+        self.backend = backend
+        person_name = model_name(model_size)
+        face_name = model_name(model_size, face=True)
+        has_face_model = self.registry.is_available(face_name, backend)
+        
+        if mode == MODE_AUTO:
+            mode = MODE_FACE if has_face_model else MODE_PERSON
+        if mode in (MODE_FACE, MODE_TWO_STAGE) and not has_face_model:
+            # Không có face model -> fallback: dùng person model và crop head region
+            print(f"Không tìm thấy {face_name}.{backend}, dùng chế độ ước lượng từ person")
+            mode = MODE_PERSON
+        self.mode = mode
+        
+        self.person_model = None
+        self.face_model = None
         
-        # Kiểm tra và download model nếu chưa có
-        if not os.path.exists(model_path):
-            # Download từ Hugging Face hoặc sử dụng model chuẩn với cấu hình đặc biệt
-            # Fallback: dùng yolov8n.pt và chỉ detect class 0 (person) nhưng crop head region
+        if mode in (MODE_PERSON, MODE_TWO_STAGE):
             print("Đang tải YOLOv8 model...")
-            self.model = YOLO("yolov8n.pt")
-            self.use_face_model = False
+            self.person_model = self._load_model(person_name)
+        if mode in (MODE_FACE, MODE_TWO_STAGE):
+            # Model này được train đặc biệt để detect faces
+            self.face_model = self._load_model(face_name)
+        
+        # Giữ tương thích: model chính và cờ use_face_model
+        self.use_face_model = mode == MODE_FACE
+        self.model = self.face_model if self.use_face_model else self.person_model
+        if mode == MODE_TWO_STAGE:
+            self.model_name = f"{person_name}.{backend}+{face_name}.{backend}"
         else:
-            self.model = YOLO(model_path)
-            self.use_face_model = True
+            self.model_name = f"{face_name if self.use_face_model else person_name}.{backend}"
             
         # Class ID 0 trong COCO dataset là "person"
         self.person_class_id = 0
+        # Các class được tính là người (đổi được mà không cần chạy lại model khi có raw_cache)
+        self.class_ids = (self.person_class_id,)
+        
+        # RawOutputCache: đổi tham số hậu xử lý thì chỉ tính lại từ output thô
+        self.raw_cache = None
+        # Ảnh đã decode không có key từ người gọi: hash toàn bộ pixel để dùng cache
+        # (tắt mặc định - tốn một lượt đọc cả ảnh mỗi lần detect, kể cả khi không thể trúng cache)
+        self.hash_frames = False
+        
+        # Inference FP16 (chỉ có tác dụng trên GPU)
+        self.half = False
+        
+    def _load_model(self, name: str) -> YOLO:
+        """Load model từ cache dùng chung (file .onnx cần khai báo task)"""
+        path = self.registry.resolve(name, self.backend)
+        if self.backend == 'onnx':
+            return YOLO(path, task=self.registry.task(name))
+        return YOLO(path)
+        
+    def _load_image(self, image) -> np.ndarray:
+        """Đọc ảnh (BGR) từ đường dẫn, hoặc trả về nguyên nếu đã là array"""
+        if isinstance(image, np.ndarray):
+            return image
+        data = cv2.imread(image)
+        if data is None:
+            raise ValueError(f"Không thể đọc ảnh: {image}")
+        return data
+        
+    def _predict(self, model, images, confidence: float, imgsz: int = None,
+                 max_det: int = None) -> tuple:
+        """
+        Chạy model trên một ảnh hoặc một batch ảnh
+        
+        Returns:
+            (list boxes (N, 6): x1, y1, x2, y2, conf, cls cho mỗi ảnh, list Results gốc)
+        """
+        kwargs = {'verbose': False, 'conf': confidence}
+        if imgsz is not None:
+            kwargs['imgsz'] = imgsz
+        if max_det is not None:
+            kwargs['max_det'] = max_det
+        if self.half:
+            kwargs['half'] = True
+        results = model(images, **kwargs)
+        return [result.boxes.data.cpu().numpy() for result in results], results
+        
+    def _raw_boxes(self, model, role: str, images: list, keys: list,
+                   confidence: float, imgsz: int = None) -> list:
+        """
+        Box của model cho mỗi ảnh, lấy từ raw_cache khi có
         
-    def detect(self, image_path: str, confidence: float = 0.3) -> list:
+        Cache lưu output ở RAW_FLOOR_CONFIDENCE; NMS của YOLO lọc theo confidence
+        trước khi gộp nên lọc lại output thô cho kết quả giống hệt chạy ở ngưỡng cao hơn.
+        """
+        if keys is None or self.raw_cache is None or confidence < RAW_FLOOR_CONFIDENCE \
+                or not any(keys):
+            return self._predict(model, images, confidence, imgsz)[0]
+        
+        precision = 'fp16' if self.half else 'fp32'
+        keys = [f"{self.model_name}|{precision}|{role}|{imgsz or 'default'}|{key}" if key else None
+                for key in keys]
+        cached = self.raw_cache.get_many([key for key in keys if key])
+        results = [None] * len(images)
+        # Ảnh không có key chạy thẳng ở ngưỡng yêu cầu, không ghi cache
+        uncached = [i for i, key in enumerate(keys) if not key]
+        if uncached:
+            fresh, _ = self._predict(model, [images[i] for i in uncached], confidence, imgsz)
+            for i, boxes in zip(uncached, fresh):
+                results[i] = boxes
+        missing = [i for i, key in enumerate(keys) if key and key not in cached]
+        if missing:
+            fresh, _ = self._predict(model, [images[i] for i in missing], RAW_FLOOR_CONFIDENCE,
+                                     imgsz, max_det=RAW_MAX_DET)
+            computed = {keys[i]: boxes for i, boxes in zip(missing, fresh)}
+            self.raw_cache.put_many(computed)
+            cached.update(computed)
+        for i, key in enumerate(keys):
+            if key:
+                results[i] = cached[key][cached[key][:, 4] > confidence]
+        return results
+        
+    def detect(self, image, confidence: float = 0.3, landmarks: bool = False,
+               imgsz: int = None) -> list:
         """
         Phát hiện khuôn mặt trong ảnh
         
         Args:
-            image_path: Đường dẫn tới ảnh
+            image: Đường dẫn tới ảnh hoặc ảnh BGR (numpy array)
             confidence: Ngưỡng confidence tối thiểu (0-1)
+            landmarks: Trả về thêm 5 điểm landmark (chỉ với face model có keypoints)
+            imgsz: Kích thước ảnh đưa vào model (mặc định của model: 640)
             
         Returns:
             List các detection, mỗi detection là dict chứa:
             - bbox: [x1, y1, x2, y2]
             - confidence: độ tin cậy
             - number: số thứ tự
+            - landmarks: [[x, y], ...] (nếu được yêu cầu và model hỗ trợ)
         """
-        # Đọc ảnh để lấy kích thước
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Không thể đọc ảnh: {image_path}")
+        return self.detect_batch([image], confidence, landmarks, imgsz)[0]
         
-        img_height, img_width = image.shape[:2]
+    def detect_batch(self, images: list, confidence: float = 0.3, landmarks: bool = False,
+                     imgsz: int = None, keys: list = None) -> list:
+        """
+        Phát hiện khuôn mặt cho nhiều ảnh trong một lần gọi model
+        
+        Args:
+            images: List đường dẫn hoặc ảnh BGR (numpy array)
+            confidence: Ngưỡng confidence tối thiểu (0-1)
+            landmarks: Trả về thêm landmark (xem detect())
+            imgsz: Kích thước ảnh đưa vào model (xem detect())
+            keys: Key raw_cache cho từng ảnh (vd: path_key của file đã decode thành array);
+                  None: đường dẫn dùng path_key, array chỉ được hash khi bật hash_frames
+            
+        Returns:
+            List kết quả, mỗi phần tử giống kết quả của detect()
+        """
+        # Landmark không có trong output thô -> không dùng cache
+        if self.raw_cache is None or landmarks:
+            keys = None
+        else:
+            keys = [self._cache_key(image, key) for image, key in
+                    zip(images, keys if keys is not None else [None] * len(images))]
+        images = [self._load_image(image) for image in images]
+        if not images:
+            return []
         
-        # Chạy detection
-        results = self.model(image_path, verbose=False, conf=confidence)
+        if self.mode == MODE_FACE:
+            batch = self._detect_faces(images, confidence, landmarks, imgsz, keys)
+        elif self.mode == MODE_TWO_STAGE:
+            batch = self._detect_two_stage(images, confidence, landmarks, imgsz, keys)
+        else:
+            batch = self._detect_heads_from_persons(images, confidence, imgsz, keys)
         
-        detections = []
-        face_count = 0
+        for detections in batch:
+            for i, det in enumerate(detections):
+                det['number'] = i + 1
+        return batch
+        
+    def count_at_least_batch(self, images: list, threshold: int, confidence: float = 0.3) -> list:
+        """
+        Trả lời "có ít nhất threshold khuôn mặt không?" với ít tính toán nhất
+        
+        1. Probe 320px cho cả batch: đủ threshold detection chắc chắn -> True ngay
+           (độ phân giải cao hơn chỉ tìm thêm mặt); không có cả ứng viên yếu
+           trên ảnh không quá lớn -> False ngay
+        2. Còn lại: chạy độ phân giải đầy đủ (tối đa FULL_PASS_MAX_SIDE) theo batch
+        3. Ảnh lớn vẫn chưa đủ: tiling trên ảnh gốc
+        
+        Args:
+            images: List đường dẫn hoặc ảnh BGR (numpy array)
+            threshold: Số khuôn mặt cần đạt (1: "có ai không?")
+            confidence: Ngưỡng confidence tối thiểu (0-1)
+            
+        Returns:
+            List dict cho từng ảnh:
+            - answer: True nếu có ít nhất threshold khuôn mặt
+            - count: số khuôn mặt đã thấy (chỉ là cận dưới nếu exact=False)
+            - exact: count là kết quả đầy đủ
+            - stage: 'probe', 'full' hoặc 'tiled' - lượt đã quyết định kết quả
+            - detections: các detection đã thấy
+        """
+        images = [self._load_image(image) for image in images]
+        threshold = max(1, threshold)
+        results = [None] * len(images)
+        
+        def settle(index, detections, stage, exact):
+            results[index] = {
+                'answer': len(detections) >= threshold,
+                'count': len(detections),
+                'exact': exact,
+                'stage': stage,
+                'detections': detections,
+            }
+        
+        # Lượt 1: probe với ngưỡng thấp để thấy cả ứng viên yếu
+        probes = self.detect_batch(images, confidence * EARLY_EXIT_WEAK, imgsz=EARLY_EXIT_IMGSZ)
+        pending = []
+        for index, (image, weak) in enumerate(zip(images, probes)):
+            strong = [det for det in weak if det['confidence'] >= confidence]
+            long_side = max(image.shape[:2])
+            if len(strong) >= threshold:
+                settle(index, strong, 'probe', False)
+            elif not weak and long_side <= FULL_PASS_MAX_SIDE:
+                settle(index, [], 'probe', True)
+            else:
+                pending.append(index)
+        
+        # Lượt 2: độ phân giải đầy đủ (giới hạn FULL_PASS_MAX_SIDE), chung một batch
+        if pending:
+            imgsz = min(FULL_PASS_MAX_SIDE, max(max(images[i].shape[:2]) for i in pending))
+            imgsz = max(EARLY_EXIT_IMGSZ, (imgsz + 31) // 32 * 32)
+            full = self.detect_batch([images[i] for i in pending], confidence, imgsz=imgsz)
+            still_pending = []
+            for index, detections in zip(pending, full):
+                if len(detections) >= threshold or max(images[index].shape[:2]) <= FULL_PASS_MAX_SIDE:
+                    settle(index, detections, 'full', max(images[index].shape[:2]) <= imgsz)
+                else:
+                    still_pending.append(index)
+            pending = still_pending
+        
+        # Lượt 3: tiling cho ảnh lớn còn chưa đủ
+        for index in pending:
+            settle(index, self.detect_tiled(images[index], confidence), 'tiled', True)
         
         for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                # Chỉ lấy class "person" (class_id = 0)
-                if int(box.cls[0]) == self.person_class_id:
-                    conf = float(box.conf[0])
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    
-                    # Tính toán vùng đầu/mặt từ person bounding box
-                    # Giả định khuôn mặt nằm ở 1/4 - 1/3 phía trên của body
-                    person_height = y2 - y1
-                    person_width = x2 - x1
-                    
-                    # Estimate face region (top portion of person bbox)
-                    face_height = person_height * 0.35  # 35% chiều cao person là vùng đầu/mặt
-                    
-                    # Center the face box horizontally, make it more square-ish
-                    face_width = min(person_width * 0.7, face_height * 1.2)
-                    center_x = (x1 + x2) / 2
-                    
-                    face_x1 = center_x - face_width / 2
-                    face_y1 = y1
-                    face_x2 = center_x + face_width / 2
-                    face_y2 = y1 + face_height
-                    
-                    # Clamp to image bounds
-                    face_x1 = max(0, face_x1)
-                    face_y1 = max(0, face_y1)
-                    face_x2 = min(img_width, face_x2)
-                    face_y2 = min(img_height, face_y2)
-                    
-                    face_count += 1
-                    detections.append({
-                        'bbox': [int(face_x1), int(face_y1), int(face_x2), int(face_y2)],
-                        'confidence': conf,
-                        'number': face_count
-                    })
+            for i, det in enumerate(result['detections']):
+                det['number'] = i + 1
+        return results
         
-        return detections
-    
-    def draw_results(self, image_path: str, detections: list) -> Image.Image:
+    def count_at_least(self, image, threshold: int, confidence: float = 0.3) -> dict:
+        """Xem count_at_least_batch()"""
+        return self.count_at_least_batch([image], threshold, confidence)[0]
+        
+    def has_faces(self, image, confidence: float = 0.3) -> bool:
+        """Ảnh có ít nhất một khuôn mặt (dừng ngay khi đã chắc chắn)"""
+        return self.count_at_least(image, 1, confidence)['answer']
+        
+    def detect_tiled(self, image, confidence: float = 0.3, tile_size: int = 640,
+                     overlap: float = 0.2, imgsz: int = None, iou: float = 0.5) -> list:
         """
-        Vẽ bounding box và số thứ tự lên ảnh
+        Phát hiện trên các tile chồng lấp của ảnh lớn (giữ độ phân giải gốc
+        cho khuôn mặt nhỏ), các tile chạy chung một batch
         
         Args:
-            image_path: Đường dẫn tới ảnh gốc
-            detections: Kết quả từ hàm detect()
+            image: Đường dẫn tới ảnh hoặc ảnh BGR (numpy array)
+            confidence: Ngưỡng confidence tối thiểu (0-1)
+            tile_size: Kích thước tile trên ảnh gốc (pixel)
+            overlap: Tỉ lệ chồng lấp giữa hai tile liền kề
+            imgsz: Kích thước đưa vào model cho mỗi tile (mặc định: tile_size)
+            iou: Ngưỡng IoU để gộp box trùng ở vùng chồng lấp
             
         Returns:
-            PIL Image với các annotation
+            List detection giống detect()
         """
-        # Đọc ảnh bằng PIL
-        image = Image.open(image_path).convert('RGB')
-        draw = ImageDraw.Draw(image)
-        
-        # Tính font size dựa trên kích thước ảnh
-        img_width, img_height = image.size
-        font_size = max(20, min(img_width, img_height) // 30)
-        
-        # Cố gắng load font đẹp hơn, fallback về default
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            try:
-                font = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-        
-        # Màu sắc cho bounding box
-        colors = [
-            '#FF6B6B',  # Đỏ
-            '#4ECDC4',  # Xanh ngọc
-            '#45B7D1',  # Xanh dương
-            '#96CEB4',  # Xanh lá nhạt
-            '#FFEAA7',  # Vàng
-            '#DDA0DD',  # Tím nhạt
-            '#98D8C8',  # Mint
-            '#F7DC6F',  # Gold
-            '#BB8FCE',  # Lavender
-            '#85C1E9',  # Sky blue
+        image = self._load_image(image)
+        img_height, img_width = image.shape[:2]
+        tiles = tile_grid(img_width, img_height, tile_size, overlap)
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+        batch = self.detect_batch(crops, confidence, imgsz=imgsz or tile_size)
+        
+        boxes, scores = [], []
+        for (ox, oy, _, _), detections in zip(tiles, batch):
+            for det in detections:
+                x1, y1, x2, y2 = det['bbox']
+                boxes.append([x1 + ox, y1 + oy, x2 + ox, y2 + oy])
+                scores.append(det['confidence'])
+        if not boxes:
+            return []
+        
+        keep = nms(np.array(boxes, dtype=np.float32), np.array(scores, dtype=np.float32), iou)
+        return [
+            {'bbox': [int(v) for v in boxes[i]], 'confidence': float(scores[i]), 'number': n + 1}
+            for n, i in enumerate(keep)
         ]
         
-        for det in detections:
-            x1, y1, x2, y2 = det['bbox']
-            number = det['number']
-            
-            # Chọn màu theo số thứ tự
-            color = colors[(number - 1) % len(colors)]
+    def _cache_key(self, image, key: str = None):
+        """Key raw_cache của một ảnh: key người gọi đưa, path_key với đường dẫn, hash pixel nếu bật"""
+        if key is not None:
+            return key
+        if not isinstance(image, np.ndarray):
+            return path_key(image)
+        return image_key(image) if self.hash_frames else None
+        
+    def detect_regions(self, images: list, regions: list, confidence: float = 0.3,
+                       imgsz: int = None, iou: float = 0.5, keys: list = None) -> list:
+        """
+        Chỉ detect bên trong các vùng quan tâm (ROI); crop của mọi ảnh chạy chung một batch
+        
+        Args:
+            images: List đường dẫn hoặc ảnh BGR (numpy array)
+            regions: List ROI cho từng ảnh (xem roi.py); None: cả ảnh
+            confidence: Ngưỡng confidence tối thiểu (0-1)
+            imgsz: Kích thước đưa vào model cho mỗi crop
+            iou: Ngưỡng IoU để gộp box trùng khi các ROI chồng lấp
+            keys: Key raw_cache cho từng ảnh (xem detect_batch)
             
-            # Vẽ bounding box
-            box_width = max(2, min(img_width, img_height) // 200)
-            draw.rectangle([x1, y1, x2, y2], outline=color, width=box_width)
+        Returns:
+            List kết quả cho từng ảnh, chỉ gồm khuôn mặt có tâm nằm trong ROI
+        """
+        if self.raw_cache is not None:
+            keys = [self._cache_key(image, key) for image, key in
+                    zip(images, keys if keys is not None else [None] * len(images))]
+        else:
+            keys = [None] * len(images)
+        images = [self._load_image(image) for image in images]
+        crops, owners, crop_keys = [], [], []
+        polygons = []
+        for index, (image, rois) in enumerate(zip(images, regions)):
+            height, width = image.shape[:2]
+            rois = rois or [[0, 0, width, height]]
+            image_polygons = [to_polygon(roi, width, height) for roi in rois]
+            polygons.append(image_polygons)
+            for polygon in image_polygons:
+                crop, offset = crop_region(image, polygon)
+                if crop is not None:
+                    crops.append(crop)
+                    owners.append((index, offset, polygon))
+                    # Crop xác định bởi ảnh gốc + đa giác (không hash pixel của crop)
+                    crop_keys.append(f"{keys[index]}|roi:{np.asarray(polygon).round(1).tolist()}"
+                                     if keys[index] else None)
+        
+        batch = self.detect_batch(crops, confidence, imgsz=imgsz, keys=crop_keys) if crops else []
+        boxes = [[] for _ in images]
+        scores = [[] for _ in images]
+        for (index, (ox, oy), polygon), detections in zip(owners, batch):
+            for det in detections:
+                x1, y1, x2, y2 = det['bbox']
+                bbox = [x1 + ox, y1 + oy, x2 + ox, y2 + oy]
+                if inside(polygon, bbox):
+                    boxes[index].append(bbox)
+                    scores[index].append(det['confidence'])
+        
+        results = []
+        for image_boxes, image_scores, image_polygons in zip(boxes, scores, polygons):
+            if not image_boxes:
+                results.append([])
+                continue
+            keep = range(len(image_boxes))
+            if len(image_polygons) > 1:
+                keep = nms(np.array(image_boxes, dtype=np.float32),
+                           np.array(image_scores, dtype=np.float32), iou)
+            results.append([
+                {'bbox': [int(v) for v in image_boxes[i]], 'confidence': float(image_scores[i]), 'number': n + 1}
+                for n, i in enumerate(keep)
+            ])
+        return results
+        
+    def _detect_faces(self, images: list, confidence: float, landmarks: bool,
+                      imgsz: int = None, keys: list = None) -> list:
+        """Dùng trực tiếp face box của face model, không ước lượng"""
+        if landmarks:
+            all_boxes, results = self._predict(self.face_model, images, confidence, imgsz)
+        else:
+            all_boxes = self._raw_boxes(self.face_model, 'face', images, keys, confidence, imgsz)
+            results = [None] * len(all_boxes)
+        
+        batch = []
+        for boxes, result in zip(all_boxes, results):
+            keypoints = self._keypoints(result) if landmarks else None
+            detections = []
+            for i, (x1, y1, x2, y2, conf, _) in enumerate(boxes):
+                det = {
+                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                    'confidence': float(conf),
+                }
+                if keypoints is not None:
+                    det['landmarks'] = keypoints[i]
+                detections.append(det)
+            batch.append(detections)
+        return batch
+        
+    def _keypoints(self, result):
+        """Lấy landmark từ kết quả model (None nếu model không có keypoints)"""
+        kpts = getattr(result, 'keypoints', None)
+        if kpts is None or kpts.xy is None:
+            return None
+        return [[[float(x), float(y)] for x, y in points] for points in kpts.xy.cpu().numpy()]
+        
+    def _person_boxes(self, images: list, confidence: float, imgsz: int = None,
+                      keys: list = None) -> list:
+        """Chạy person model và chỉ giữ các class trong class_ids (mặc định "person")"""
+        all_boxes = self._raw_boxes(self.person_model, 'person', images, keys, confidence, imgsz)
+        return [boxes[np.isin(boxes[:, 5].astype(int), self.class_ids)] for boxes in all_boxes]
+        
+    def _heads_from_persons(self, persons: np.ndarray, img_width: int, img_height: int) -> list:
+        """Ước lượng vùng đầu/mặt từ person bounding box"""
+        detections = []
+        for x1, y1, x2, y2, conf, _ in persons:
+            # Giả định khuôn mặt nằm ở 1/4 - 1/3 phía trên của body
+            person_height = y2 - y1
+            person_width = x2 - x1
             
-            # Vẽ label background
-            label = f"{number}"
+            # Estimate face region (top portion of person bbox)
+            face_height = person_height * self.HEAD_HEIGHT_RATIO
             
-            # Tính kích thước text
-            bbox_text = draw.textbbox((0, 0), label, font=font)
-            text_width = bbox_text[2] - bbox_text[0]
-            text_height = bbox_text[3] - bbox_text[1]
+            # Center the face box horizontally, make it more square-ish
+            face_width = min(person_width * self.HEAD_WIDTH_RATIO, face_height * self.HEAD_ASPECT)
+            center_x = (x1 + x2) / 2
             
-            padding = 5
-            label_x1 = x1
-            label_y1 = y1 - text_height - padding * 2
-            if label_y1 < 0:
-                label_y1 = y1
-            label_x2 = label_x1 + text_width + padding * 2
-            label_y2 = label_y1 + text_height + padding * 2
+            # Clamp to image bounds
+            face_x1 = max(0, center_x - face_width / 2)
+            face_y1 = max(0, y1)
+            face_x2 = min(img_width, center_x + face_width / 2)
+            face_y2 = min(img_height, y1 + face_height)
             
-            # Vẽ background cho label
-            draw.rectangle([label_x1, label_y1, label_x2, label_y2], fill=color)
+            detections.append({
+                'bbox': [int(face_x1), int(face_y1), int(face_x2), int(face_y2)],
+                'confidence': float(conf)
+            })
+        return detections
+        
+    def _detect_heads_from_persons(self, images: list, confidence: float, imgsz: int = None,
+                                   keys: list = None) -> list:
+        """Person model + ước lượng vùng đầu cho từng ảnh"""
+        return [
+            self._heads_from_persons(persons, image.shape[1], image.shape[0])
+            for image, persons in zip(images, self._person_boxes(images, confidence, imgsz, keys))
+        ]
+        
+    def _detect_two_stage(self, images: list, confidence: float, landmarks: bool,
+                          imgsz: int = None, keys: list = None) -> list:
+        """
+        Two-stage: tìm người trên ảnh gốc, sau đó tinh chỉnh bằng face model
+        trên các crop vùng nửa trên của từng người (mọi crop chạy chung một batch)
+        """
+        crops, owners = [], []
+        persons_batch = self._person_boxes(images, confidence, imgsz, keys)
+        for index, (image, persons) in enumerate(zip(images, persons_batch)):
+            img_height, img_width = image.shape[:2]
+            for x1, y1, x2, y2, _, _ in persons:
+                # Nửa trên của person box, nới thêm 10% mỗi bên
+                pad_x = (x2 - x1) * 0.1
+                cx1 = int(max(0, x1 - pad_x))
+                cy1 = int(max(0, y1 - (y2 - y1) * 0.05))
+                cx2 = int(min(img_width, x2 + pad_x))
+                cy2 = int(min(img_height, y1 + (y2 - y1) * 0.5))
+                if cx2 - cx1 < 4 or cy2 - cy1 < 4:
+                    continue
+                crops.append(image[cy1:cy2, cx1:cx2])
+                owners.append((index, cx1, cy1))
+        
+        batch = [[] for _ in images]
+        if not crops:
+            return batch
+        
+        all_boxes, results = self._predict(self.face_model, crops, confidence, imgsz=FACE_CROP_SIZE)
+        
+        for boxes, result, (index, ox, oy) in zip(all_boxes, results, owners):
+            if len(boxes) == 0:
+                continue
+            # Mỗi người tối đa một khuôn mặt: lấy box có confidence cao nhất
+            best = int(np.argmax(boxes[:, 4]))
+            x1, y1, x2, y2, conf, _ = boxes[best]
+            det = {
+                'bbox': [int(x1 + ox), int(y1 + oy), int(x2 + ox), int(y2 + oy)],
+                'confidence': float(conf),
+            }
+            if landmarks:
+                keypoints = self._keypoints(result)
+                if keypoints is not None:
+                    det['landmarks'] = [[x + ox, y + oy] for x, y in keypoints[best]]
+            batch[index].append(det)
+        return batch
+    
+    def draw_results(self, image, detections: list, max_size: int = None) -> Image.Image:
+        """
+        Vẽ bounding box và số thứ tự lên ảnh
+        
+        Args:
+            image: Đường dẫn tới ảnh gốc, ảnh BGR (numpy array) hoặc PIL Image
+            detections: Kết quả từ hàm detect()
+            max_size: Vẽ trên bản thu nhỏ có cạnh dài tối đa max_size (preview)
             
-            # Vẽ số
-            draw.text(
-                (label_x1 + padding, label_y1 + padding),
-                label,
-                fill='white',
-                font=font
-            )
-        
-        return image
-
+        Returns:
+            PIL Image với các annotation
+        """
+        return default_annotator.render(image, detections, max_size)
 
 if __name__ == "__main__":
     # Test module
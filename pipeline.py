@@ -0,0 +1,468 @@
+"""
+Pipeline Module
+Pipeline nhiều stage chạy chồng lấp: đọc file -> decode -> inference (batch) -> vẽ kết quả
+
+Cách sử dụng:
+    python pipeline.py <ảnh hoặc thư mục> ... --batch-size 8 --decode-workers 4
+"""
+
+import io
+import os
+import sys
+import time
+import queue
+import argparse
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from memory_budget import get_budget, set_budget, INFERENCE_ITEM_BYTES
+
+# Sentinel báo hiệu stage phía trước đã kết thúc
+_DONE = object()
+
+
+class _Reservations:
+    """
+    Phần ngân sách bộ nhớ của các ảnh đang trong pipeline: seq -> [bytes, stage hiện tại]
+
+    Mọi thay đổi đi qua một lock nên khi consumer dừng sớm, release_all() trả lại
+    đúng stage đang giữ của từng ảnh, kể cả khi các stage khác vẫn đang chuyển ảnh đi tiếp.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self._items = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def acquire(self, seq: int, nbytes: int, stage: str, timeout: float) -> bool:
+        """Giữ ngân sách cho ảnh seq (chặn tối đa timeout giây); False nếu chưa đủ chỗ"""
+        if not self.budget.acquire(nbytes, stage, timeout=timeout):
+            return False
+        with self._lock:
+            if not self._closed:
+                self._items[seq] = [nbytes, stage]
+                return True
+        # Pipeline đã đóng trong lúc chờ: trả lại ngay
+        self.budget.release(nbytes, stage)
+        return True
+
+    def move(self, seq: int, stage: str):
+        with self._lock:
+            entry = self._items.get(seq)
+            if entry is not None and entry[1] != stage:
+                self.budget.move(entry[0], entry[1], stage)
+                entry[1] = stage
+
+    def release(self, seq: int):
+        with self._lock:
+            entry = self._items.pop(seq, None)
+            if entry is not None:
+                self.budget.release(*entry)
+
+    def release_all(self):
+        with self._lock:
+            self._closed = True
+            for nbytes, stage in self._items.values():
+                self.budget.release(nbytes, stage)
+            self._items.clear()
+
+
+def _path_key(path: str):
+    """Key raw_cache theo đường dẫn, None nếu file không còn (khi đó không dùng cache)"""
+    from raw_cache import path_key
+    try:
+        return path_key(path)
+    except OSError:
+        return None
+
+
+def _expand_paths(inputs: list) -> list:
+    """Mở rộng thư mục thành danh sách ảnh (giữ thứ tự)"""
+    from folder_watcher import IMAGE_EXTENSIONS
+
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        paths.append(os.path.join(root, name))
+        else:
+            paths.append(item)
+    return paths
+
+
+class DetectionPipeline:
+    """
+    Pipeline producer/consumer cho detect -> draw_results
+
+    Các stage nối với nhau bằng queue có giới hạn (backpressure):
+        reader (1 thread) -> decode pool -> inference (batch, 1 thread) -> draw pool
+
+    Kết quả luôn trả về đúng thứ tự đầu vào. Throughput tiến tới tốc độ
+    của stage chậm nhất thay vì tổng thời gian các stage.
+
+    Ngoài số ảnh tối đa, mỗi ảnh giữ phần ngân sách bộ nhớ (bytes file + ảnh decode
+    ước lượng từ header) từ lúc đọc tới lúc trả kết quả: ảnh lớn làm reader chờ sớm hơn.
+    """
+
+    def __init__(self, detector, confidence: float = 0.3,
+                 decode_workers: int = 2, draw_workers: int = 2,
+                 batch_size: int = 4, batch_timeout: float = 0.02,
+                 queue_size: int = 8, max_in_flight: int = 32,
+                 draw: bool = True, preview_size: int = None, keep_frames: bool = False,
+                 budget=None, regions_for=None):
+        """
+        Args:
+            detector: PersonDetector (hoặc đối tượng có detect_batch/draw_results)
+            confidence: Ngưỡng confidence
+            decode_workers: Số thread decode ảnh
+            draw_workers: Số thread vẽ annotation
+            batch_size: Số ảnh tối đa mỗi lần gọi model
+            batch_timeout: Thời gian chờ gom đủ batch (giây)
+            queue_size: Kích thước mỗi queue giữa các stage
+            max_in_flight: Số ảnh tối đa đang nằm trong pipeline (giới hạn RAM)
+            draw: Có chạy stage vẽ annotation hay không
+            preview_size: Vẽ trên bản thu nhỏ có cạnh dài tối đa preview_size (chỉ để hiển thị)
+            keep_frames: Trả kèm ảnh BGR đã decode trong kết quả (key 'frame')
+            budget: MemoryBudget (mặc định: ngân sách dùng chung của process)
+            regions_for: Hàm(path) -> ROI của ảnh hoặc None (vd: RoiConfig.rois_for);
+                         ảnh có ROI được detect bằng detector.detect_regions
+        """
+        self.detector = detector
+        self.confidence = confidence
+        self.decode_workers = max(1, decode_workers)
+        self.draw_workers = max(1, draw_workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_timeout = batch_timeout
+        self.queue_size = max(1, queue_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.draw = draw
+        self.preview_size = preview_size
+        self.keep_frames = keep_frames
+        self.budget = budget or get_budget()
+        self.regions_for = regions_for
+
+        # Thời gian xử lý cộng dồn của mỗi stage (giây)
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _add_stat(self, stage: str, seconds: float):
+        with self._stats_lock:
+            self.stats[stage] = self.stats.get(stage, 0.0) + seconds
+
+    def _estimate_bytes(self, data: bytes) -> int:
+        """Bộ nhớ một ảnh chiếm trong pipeline: bytes file + ảnh BGR decode (+ bản vẽ preview)"""
+        try:
+            width, height = Image.open(io.BytesIO(data)).size
+        except Exception:
+            # Không đọc được header: ước lượng theo tỉ lệ nén JPEG thông thường
+            width, height = len(data) * 4, 1
+        size = len(data) + width * height * 3
+        if self.draw:
+            scale = 1.0
+            if self.preview_size and max(width, height) > self.preview_size:
+                scale = self.preview_size / max(width, height)
+            size += int(width * height * 3 * scale * scale)
+        return size
+
+    # ------------------------------------------------------------------
+    # Các stage
+    # ------------------------------------------------------------------
+    def _reader(self, paths, out_q, in_flight, stop, reservations):
+        """Đọc bytes từ đĩa (I/O) theo thứ tự"""
+        try:
+            for seq, path in enumerate(paths):
+                in_flight.acquire()
+                if stop.is_set():
+                    break
+                item = {'seq': seq, 'path': path, 'detections': None, 'image': None, 'error': None}
+                start = time.perf_counter()
+                try:
+                    with open(path, 'rb') as f:
+                        item['data'] = f.read()
+                except OSError as e:
+                    item['error'] = str(e)
+                self._add_stat('read', time.perf_counter() - start)
+                if item['error'] is None:
+                    # Chờ tới khi ngân sách bộ nhớ đủ cho ảnh này (backpressure theo bytes)
+                    start = time.perf_counter()
+                    size = self._estimate_bytes(item['data'])
+                    while not reservations.acquire(seq, size, 'decode', timeout=0.5):
+                        if stop.is_set():
+                            return
+                    self._add_stat('memory_wait', time.perf_counter() - start)
+                out_q.put(item)
+        finally:
+            for _ in range(self.decode_workers):
+                out_q.put(_DONE)
+
+    def _decoder(self, in_q, out_q, reservations):
+        """Decode bytes thành ảnh BGR"""
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                out_q.put(_DONE)
+                return
+            data = item.pop('data', None)
+            if item['error'] is None:
+                start = time.perf_counter()
+                frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                self._add_stat('decode', time.perf_counter() - start)
+                if frame is None:
+                    item['error'] = f"Không thể đọc ảnh: {item['path']}"
+                else:
+                    item['frame'] = frame
+                reservations.move(item['seq'], 'inference')
+            out_q.put(item)
+
+    def _inference(self, in_q, out_q, reservations):
+        """Gom batch và chạy model"""
+        remaining = self.decode_workers
+        while remaining:
+            batch = []
+            item = in_q.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            batch.append(item)
+
+            # Gom thêm ảnh trong batch_timeout để tận dụng batch inference
+            # (batch nhỏ lại khi ngân sách bộ nhớ còn ít)
+            batch_size = self.budget.batch_size(self.batch_size)
+            deadline = time.perf_counter() + self.batch_timeout
+            while len(batch) < batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    nxt = in_q.get(timeout=max(0.0, timeout))
+                except queue.Empty:
+                    break
+                if nxt is _DONE:
+                    remaining -= 1
+                    if not remaining:
+                        break
+                    continue
+                batch.append(nxt)
+
+            ready = [it for it in batch if it['error'] is None]
+            if ready:
+                start = time.perf_counter()
+                scratch = INFERENCE_ITEM_BYTES * len(ready)
+                self.budget.add('model', scratch)
+                try:
+                    frames = [it['frame'] for it in ready]
+                    regions = [self.regions_for(it['path']) for it in ready] if self.regions_for else []
+                    kwargs = {}
+                    if getattr(self.detector, 'raw_cache', None) is not None:
+                        # Key cache theo file (không phải hash pixel của ảnh vừa decode)
+                        kwargs['keys'] = [_path_key(it['path']) for it in ready]
+                    if any(regions):
+                        results = self.detector.detect_regions(frames, regions, self.confidence, **kwargs)
+                    else:
+                        results = self.detector.detect_batch(frames, self.confidence, **kwargs)
+                    del frames
+                    for it, detections in zip(ready, results):
+                        it['detections'] = detections
+                except Exception as e:
+                    for it in ready:
+                        it['error'] = str(e)
+                finally:
+                    self.budget.add('model', -scratch)
+                self._add_stat('inference', time.perf_counter() - start)
+
+            for it in batch:
+                reservations.move(it['seq'], 'draw')
+                out_q.put(it)
+
+        for _ in range(self.draw_workers):
+            out_q.put(_DONE)
+
+    def _drawer(self, in_q, out_q):
+        """Vẽ annotation (hoặc chỉ chuyển tiếp nếu draw=False)"""
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                out_q.put(_DONE)
+                return
+            frame = item.pop('frame', None)
+            if self.keep_frames:
+                item['frame'] = frame
+            if self.draw and item['error'] is None:
+                start = time.perf_counter()
+                try:
+                    item['image'] = self.detector.draw_results(frame, item['detections'], self.preview_size)
+                except Exception as e:
+                    item['error'] = str(e)
+                self._add_stat('draw', time.perf_counter() - start)
+            out_q.put(item)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def run(self, paths):
+        """
+        Chạy pipeline trên danh sách ảnh
+
+        Args:
+            paths: Iterable các đường dẫn ảnh
+
+        Yields:
+            Dict cho mỗi ảnh (đúng thứ tự đầu vào):
+            - path: đường dẫn
+            - detections: kết quả detect (None nếu lỗi)
+            - image: PIL Image đã vẽ annotation (None nếu draw=False hoặc lỗi)
+            - error: thông báo lỗi hoặc None
+            - frame: ảnh BGR đã decode (chỉ khi keep_frames=True)
+        """
+        read_q = queue.Queue(self.queue_size)
+        decode_q = queue.Queue(self.queue_size)
+        draw_q = queue.Queue(self.queue_size)
+        out_q = queue.Queue()
+        in_flight = threading.Semaphore(self.max_in_flight)
+        stop = threading.Event()
+        reservations = _Reservations(self.budget)
+
+        threads = [threading.Thread(target=self._reader, args=(paths, read_q, in_flight, stop, reservations),
+                                    daemon=True)]
+        threads += [
+            threading.Thread(target=self._decoder, args=(read_q, decode_q, reservations), daemon=True)
+            for _ in range(self.decode_workers)
+        ]
+        threads.append(threading.Thread(target=self._inference, args=(decode_q, draw_q, reservations),
+                                        daemon=True))
+        threads += [
+            threading.Thread(target=self._drawer, args=(draw_q, out_q), daemon=True)
+            for _ in range(self.draw_workers)
+        ]
+        for t in threads:
+            t.start()
+
+        # Sắp xếp lại kết quả theo seq
+        pending = {}
+        next_seq = 0
+        remaining = self.draw_workers
+        try:
+            while remaining:
+                item = out_q.get()
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                reservations.move(item['seq'], 'output')
+                pending[item['seq']] = item
+                while next_seq in pending:
+                    result = pending.pop(next_seq)
+                    del result['seq']
+                    next_seq += 1
+                    in_flight.release()
+                    # Kết quả đã giao cho consumer -> trả lại ngân sách
+                    reservations.release(next_seq - 1)
+                    yield result
+        finally:
+            # Consumer dừng sớm -> cho reader thoát
+            stop.set()
+            in_flight.release()
+            # Ảnh còn kẹt trong các stage: trả lại ngân sách theo stage đang giữ
+            # (các stage chạy tiếp sau đó không còn gì để chuyển)
+            reservations.release_all()
+
+    def run_in_background(self, paths, on_result, on_done=None) -> threading.Thread:
+        """
+        Chạy pipeline trong thread nền (dùng cho GUI)
+
+        Args:
+            paths: Danh sách ảnh
+            on_result: Callback(result) cho mỗi ảnh, gọi từ thread nền
+            on_done: Callback() khi xử lý xong
+        """
+        def worker():
+            for result in self.run(paths):
+                on_result(result)
+            if on_done is not None:
+                on_done()
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    """Chạy pipeline headless và in số khuôn mặt mỗi ảnh"""
+    parser = argparse.ArgumentParser(description="Đếm khuôn mặt cho nhiều ảnh bằng pipeline song song")
+    parser.add_argument("inputs", nargs="+", help="Ảnh hoặc thư mục ảnh")
+    parser.add_argument("--confidence", type=float, default=0.3, help="Ngưỡng confidence")
+    parser.add_argument("--batch-size", type=int, default=4, help="Số ảnh mỗi batch inference")
+    parser.add_argument("--decode-workers", type=int, default=2, help="Số thread decode")
+    parser.add_argument("--draw-workers", type=int, default=2, help="Số thread vẽ annotation")
+    parser.add_argument("--queue-size", type=int, default=8, help="Kích thước queue giữa các stage")
+    parser.add_argument("--memory-mb", type=float, default=None,
+                        help="Ngân sách RAM (MB), mặc định một nửa RAM máy")
+    parser.add_argument("--latency-budget", type=float, default=None,
+                        help="Ngân sách ms mỗi ảnh: tự chọn model/độ phân giải theo từng ảnh")
+    parser.add_argument("--quality", default="balanced", choices=["fast", "balanced", "accurate"],
+                        help="Mục tiêu chất lượng khi dùng --latency-budget")
+    parser.add_argument("--at-least", type=int, default=None,
+                        help="Chỉ trả lời có >= N khuôn mặt hay không (dừng sớm khi đã chắc chắn)")
+    parser.add_argument("--any", action="store_true", help="Chỉ trả lời ảnh có khuôn mặt nào không")
+    args = parser.parse_args()
+
+    paths = _expand_paths(args.inputs)
+    if not paths:
+        print("Không tìm thấy ảnh nào")
+        sys.exit(1)
+
+    if args.memory_mb:
+        set_budget(args.memory_mb)
+
+    if args.any or args.at_least is not None:
+        from person_detector import PersonDetector
+        threshold = 1 if args.any else args.at_least
+        detector = PersonDetector()
+        start = time.perf_counter()
+        stages = {}
+        for offset in range(0, len(paths), args.batch_size):
+            chunk = paths[offset:offset + args.batch_size]
+            for path, result in zip(chunk, detector.count_at_least_batch(chunk, threshold, args.confidence)):
+                stages[result['stage']] = stages.get(result['stage'], 0) + 1
+                count = f"{result['count']}" if result['exact'] else f">={result['count']}"
+                print(f"{'CÓ ' if result['answer'] else 'KHÔNG'}  {count:>6}  {path}")
+        elapsed = time.perf_counter() - start
+        print(f"Đã xử lý {len(paths)} ảnh trong {elapsed:.1f}s; quyết định ở lượt: "
+              + ", ".join(f"{stage} {n}" for stage, n in stages.items()))
+        return
+
+    if args.latency_budget is not None:
+        from adaptive_detector import AdaptiveDetector
+        detector = AdaptiveDetector(args.latency_budget, quality=args.quality)
+    else:
+        from person_detector import PersonDetector
+        detector = PersonDetector()
+    pipeline = DetectionPipeline(
+        detector,
+        confidence=args.confidence,
+        decode_workers=args.decode_workers,
+        draw_workers=args.draw_workers,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        draw=False,
+    )
+
+    start = time.perf_counter()
+    for result in pipeline.run(paths):
+        if result['error']:
+            print(f"  LỖI  {result['path']}: {result['error']}")
+        else:
+            print(f"{len(result['detections']):>5}  {result['path']}")
+    elapsed = time.perf_counter() - start
+
+    print(f"Đã xử lý {len(paths)} ảnh trong {elapsed:.1f}s ({len(paths) / elapsed:.1f} ảnh/s)")
+    for stage, seconds in pipeline.stats.items():
+        print(f"  {stage:<10} {seconds:.2f}s")
+    print(pipeline.budget.format_report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Raw Cache Module
+Lưu output thô của model (mọi box, score, class ở ngưỡng rất thấp) theo từng ảnh,
+để khi chỉ đổi tham số hậu xử lý (ngưỡng confidence, tỉ lệ vùng đầu, lọc class)
+thì tính lại kết quả mà không phải chạy model
+
+Cách sử dụng:
+    python raw_cache.py <ảnh hoặc thư mục> ... --confidence 0.4 --head-height 0.3
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from model_registry import data_path
+
+# Model chạy ở ngưỡng này khi ghi cache; ngưỡng thấp hơn không dùng được cache
+RAW_FLOOR_CONFIDENCE = 0.05
+# Số box tối đa giữ lại mỗi ảnh (mặc định 300 của ultralytics quá ít với ảnh đông ở ngưỡng thấp)
+RAW_MAX_DET = 1000
+
+DEFAULT_CACHE_PATH = data_path("face_counter_raw.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS raw_outputs (
+    key TEXT PRIMARY KEY,
+    boxes BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def path_key(path: str) -> str:
+    """Định danh file ảnh: đường dẫn tuyệt đối + mtime + size (không phải đọc file)"""
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def image_key(image) -> str:
+    """
+    Định danh nội dung ảnh cho cache
+
+    Đường dẫn: xem path_key; ảnh đã decode: hash BLAKE2 của toàn bộ pixel
+    (tốn một lượt đọc cả ảnh - chỉ dùng khi người gọi không biết đường dẫn và chấp nhận chi phí này).
+    """
+    if isinstance(image, np.ndarray):
+        digest = hashlib.blake2b(np.ascontiguousarray(image).data, digest_size=16).hexdigest()
+        return f"{digest}:{'x'.join(map(str, image.shape))}"
+    return path_key(image)
+
+
+class RawOutputCache:
+    """
+    Cache output thô: LRU trong bộ nhớ, tuỳ chọn thêm SQLite trên đĩa
+
+    Mỗi phần tử là mảng float32 (N, 6): x1, y1, x2, y2, conf, cls - 24 bytes mỗi box.
+    """
+
+    def __init__(self, db_path: str = None, memory_items: int = 2048):
+        """
+        Args:
+            db_path: File SQLite (None: chỉ giữ trong bộ nhớ)
+            memory_items: Số ảnh tối đa giữ trong bộ nhớ
+        """
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, boxes: np.ndarray):
+        self._memory[key] = boxes
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list) -> dict:
+        """Trả về {key: mảng (N, 6)} cho các key có trong cache"""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                boxes = self._memory.get(key)
+                if boxes is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = boxes
+                else:
+                    missing.append(key)
+            if missing and self._conn is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, boxes FROM raw_outputs WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        boxes = np.frombuffer(blob, dtype=np.float32).reshape(-1, 6)
+                        self._remember(key, boxes)
+                        found[key] = boxes
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict):
+        """Lưu {key: mảng (N, 6)}"""
+        items = {key: np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 6) for key, boxes in items.items()}
+        with self._lock:
+            for key, boxes in items.items():
+                self._remember(key, boxes)
+            if self._conn is not None:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO raw_outputs (key, boxes, created_at) VALUES (?, ?, ?)",
+                        [(key, boxes.tobytes(), now) for key, boxes in items.items()]
+                    )
+
+    def trim(self, nbytes: int) -> int:
+        """Bỏ các ảnh ít dùng nhất khỏi bộ nhớ (vẫn còn trên đĩa nếu có SQLite) tới khi đủ nbytes"""
+        freed = 0
+        with self._lock:
+            while self._memory and freed < nbytes:
+                _, boxes = self._memory.popitem(last=False)
+                freed += boxes.nbytes
+        return freed
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def main():
+    """Đếm lại cả thư mục với tham số mới; lần đầu chạy model, các lần sau chỉ hậu xử lý"""
+    from pipeline import _expand_paths
+    from person_detector import PersonDetector
+
+    parser = argparse.ArgumentParser(description="Đếm lại với tham số hậu xử lý mới (dùng cache output thô)")
+    parser.add_argument("inputs", nargs="+", help="Ảnh hoặc thư mục ảnh")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="File cache output thô")
+    parser.add_argument("--confidence", type=float, default=0.3, help="Ngưỡng confidence")
+    parser.add_argument("--head-height", type=float, default=None, help="Tỉ lệ chiều cao vùng đầu (0.35)")
+    parser.add_argument("--head-width", type=float, default=None, help="Tỉ lệ chiều rộng vùng đầu (0.7)")
+    parser.add_argument("--head-aspect", type=float, default=None, help="Tỉ lệ rộng/cao vùng đầu (1.2)")
+    parser.add_argument("--classes", default=None, help="Class ID giữ lại, vd: 0 hoặc 0,1")
+    parser.add_argument("--batch-size", type=int, default=16, help="Số ảnh mỗi batch khi phải chạy model")
+    args = parser.parse_args()
+
+    paths = _expand_paths(args.inputs)
+    if not paths:
+        print("Không tìm thấy ảnh nào")
+        sys.exit(1)
+
+    detector = PersonDetector()
+    detector.raw_cache = RawOutputCache(args.cache)
+    if args.head_height is not None:
+        detector.HEAD_HEIGHT_RATIO = args.head_height
+    if args.head_width is not None:
+        detector.HEAD_WIDTH_RATIO = args.head_width
+    if args.head_aspect is not None:
+        detector.HEAD_ASPECT = args.head_aspect
+    if args.classes:
+        detector.class_ids = tuple(int(c) for c in args.classes.split(","))
+
+    start = time.perf_counter()
+    total = 0
+    for offset in range(0, len(paths), args.batch_size):
+        chunk = paths[offset:offset + args.batch_size]
+        for path, detections in zip(chunk, detector.detect_batch(chunk, args.confidence)):
+            total += len(detections)
+            print(f"{len(detections):>5}  {path}")
+    elapsed = time.perf_counter() - start
+    cache = detector.raw_cache
+    print(f"{len(paths)} ảnh, {total} khuôn mặt trong {elapsed:.1f}s "
+          f"(cache: {cache.hits} trúng, {cache.misses} phải chạy model)")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
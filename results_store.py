@@ -0,0 +1,281 @@
+"""
+Results Store Module
+Lưu trữ lịch sử kết quả đếm khuôn mặt vào SQLite để truy vấn lại
+
+Cách sử dụng:
+    python results_store.py --db face_counter_results.db --min-count 50 --since 7d
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+
+from model_registry import data_path
+
+DEFAULT_DB_PATH = data_path("face_counter_results.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    content_hash TEXT,
+    model TEXT,
+    confidence REAL,
+    count INTEGER NOT NULL,
+    boxes TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_path ON results(path);
+CREATE INDEX IF NOT EXISTS idx_results_hash ON results(content_hash);
+CREATE INDEX IF NOT EXISTS idx_results_created ON results(created_at);
+"""
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Tính SHA-256 nội dung file (đọc theo chunk để không tốn RAM)"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _encode_boxes(detections: list) -> str:
+    """Nén detections thành JSON gọn: [[x1, y1, x2, y2, conf], ...]"""
+    return json.dumps(
+        [list(det['bbox']) + [round(float(det['confidence']), 4)] for det in detections],
+        separators=(',', ':')
+    )
+
+
+def _decode_boxes(boxes: str) -> list:
+    """Khôi phục danh sách detections (cùng format với PersonDetector.detect)"""
+    return [
+        {'bbox': row[:4], 'confidence': row[4], 'number': i + 1}
+        for i, row in enumerate(json.loads(boxes))
+    ]
+
+
+def parse_time(value: str) -> float:
+    """
+    Chuyển chuỗi thời gian thành timestamp
+
+    Hỗ trợ: "7d", "12h", "30m" (tương đối so với hiện tại),
+    "2024-05-01" hoặc "2024-05-01T08:00" (ISO)
+    """
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw])", value.strip())
+    if match:
+        units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+        return time.time() - float(match.group(1)) * units[match.group(2)]
+    return datetime.fromisoformat(value).timestamp()
+
+
+class ResultsStore:
+    """Kho kết quả SQLite (WAL mode), an toàn khi dùng từ nhiều thread"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL cho phép đọc song song trong khi batch đang ghi
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def add(self, path: str, detections: list, model: str = None,
+            confidence: float = None, content_hash: str = None,
+            created_at: float = None) -> int:
+        """
+        Lưu kết quả của một ảnh
+
+        Returns:
+            id của bản ghi vừa thêm
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO results (path, content_hash, model, confidence, count, boxes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), content_hash, model, confidence,
+                 len(detections), _encode_boxes(detections), created_at or time.time())
+            )
+            return cursor.lastrowid
+
+    def add_many(self, records: list):
+        """
+        Lưu nhiều kết quả trong một transaction (dùng cho batch)
+
+        Args:
+            records: List dict có các key path, detections và tuỳ chọn
+                     model, confidence, content_hash, created_at
+        """
+        now = time.time()
+        rows = [
+            (os.path.abspath(r['path']), r.get('content_hash'), r.get('model'),
+             r.get('confidence'), len(r['detections']), _encode_boxes(r['detections']),
+             r.get('created_at') or now)
+            for r in records
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO results (path, content_hash, model, confidence, count, boxes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def find_by_hash(self, content_hash: str, model: str = None, confidence: float = None):
+        """Tìm kết quả mới nhất cho cùng nội dung ảnh (tránh chạy lại inference)"""
+        sql = "SELECT * FROM results WHERE content_hash = ?"
+        params = [content_hash]
+        if model is not None:
+            sql += " AND model = ?"
+            params.append(model)
+        if confidence is not None:
+            sql += " AND confidence = ?"
+            params.append(confidence)
+        sql += " ORDER BY created_at DESC LIMIT 1"
+        rows = self._fetch(sql, params)
+        return rows[0] if rows else None
+
+    def history(self, path: str) -> list:
+        """Lịch sử kết quả của một file, mới nhất trước"""
+        return self._fetch(
+            "SELECT * FROM results WHERE path = ? ORDER BY created_at DESC",
+            [os.path.abspath(path)]
+        )
+
+    def query(self, min_count: int = None, max_count: int = None,
+              since: float = None, until: float = None,
+              path_prefix: str = None, model: str = None,
+              limit: int = None, with_boxes: bool = False) -> list:
+        """
+        Truy vấn kết quả theo điều kiện
+
+        Args:
+            min_count / max_count: Giới hạn số khuôn mặt
+            since / until: Khoảng thời gian (timestamp)
+            path_prefix: Chỉ lấy ảnh trong thư mục này
+            model: Lọc theo model
+            limit: Số bản ghi tối đa
+            with_boxes: Trả về cả danh sách detections
+
+        Returns:
+            List dict, mới nhất trước
+        """
+        clauses, params = [], []
+        if min_count is not None:
+            clauses.append("count >= ?")
+            params.append(min_count)
+        if max_count is not None:
+            clauses.append("count <= ?")
+            params.append(max_count)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at <= ?")
+            params.append(until)
+        if path_prefix is not None:
+            # Dùng khoảng [thư mục + sep, thư mục + sep + max char) để tận dụng index trên path;
+            # thêm sep để /photos/a không khớp /photos/ab/...
+            directory = os.path.abspath(path_prefix)
+            prefix = directory if directory.endswith(os.sep) else directory + os.sep
+            clauses.append("(path = ? OR (path >= ? AND path < ?))")
+            params.extend([directory, prefix, prefix + "\U0010ffff"])
+        if model is not None:
+            clauses.append("model = ?")
+            params.append(model)
+
+        sql = "SELECT * FROM results"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._fetch(sql, params, with_boxes)
+
+    def _fetch(self, sql: str, params: list, with_boxes: bool = True) -> list:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            item = dict(row)
+            boxes = item.pop('boxes')
+            if with_boxes:
+                item['detections'] = _decode_boxes(boxes)
+            results.append(item)
+        return results
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SqliteSink:
+    """Sink cho FolderWatcher: ghi kết quả vào ResultsStore"""
+
+    def __init__(self, store: ResultsStore, model: str = None):
+        self.store = store
+        self.model = model
+
+    def write(self, records: list):
+        ok = [r for r in records if 'error' not in r]
+        for r in ok:
+            r.setdefault('model', self.model)
+            r.setdefault('created_at', r.get('processed_at'))
+        if ok:
+            self.store.add_many(ok)
+
+    def close(self):
+        self.store.close()
+
+
+def main():
+    """CLI truy vấn lịch sử kết quả"""
+    parser = argparse.ArgumentParser(description="Truy vấn lịch sử đếm khuôn mặt")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="File SQLite")
+    parser.add_argument("--min-count", type=int, help="Số khuôn mặt tối thiểu")
+    parser.add_argument("--max-count", type=int, help="Số khuôn mặt tối đa")
+    parser.add_argument("--since", help="Từ thời điểm (vd: 7d, 12h, 2024-05-01)")
+    parser.add_argument("--until", help="Đến thời điểm")
+    parser.add_argument("--path", help="Chỉ lấy ảnh trong thư mục này")
+    parser.add_argument("--model", help="Lọc theo model")
+    parser.add_argument("--limit", type=int, help="Số kết quả tối đa")
+    parser.add_argument("--boxes", action="store_true", help="In kèm bounding box")
+    parser.add_argument("--json", action="store_true", help="Xuất JSON Lines")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+    rows = store.query(
+        min_count=args.min_count,
+        max_count=args.max_count,
+        since=parse_time(args.since) if args.since else None,
+        until=parse_time(args.until) if args.until else None,
+        path_prefix=args.path,
+        model=args.model,
+        limit=args.limit,
+        with_boxes=args.boxes,
+    )
+    for row in rows:
+        if args.json:
+            print(json.dumps(row, ensure_ascii=False))
+        else:
+            when = datetime.fromtimestamp(row['created_at']).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"{when}  {row['count']:>5}  {row['path']}")
+    if not args.json:
+        print(f"Tổng: {len(rows)} kết quả")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+ROI Module
+Vùng đếm (region of interest): hình chữ nhật hoặc đa giác cho từng ảnh,
+hoặc theo profile (camera/thư mục) trong file cấu hình
+
+Một ROI là:
+    - [x1, y1, x2, y2]: hình chữ nhật
+    - {'points': [[x, y], ...], 'name': '...'}: đa giác
+Toạ độ <= 1.0 được hiểu là tỉ lệ theo kích thước ảnh (dùng chung cho nhiều độ phân giải).
+
+File cấu hình (roi_profiles.json):
+    {
+        "images": {"D:/anh/san_khau.jpg": [[0.1, 0.4, 0.9, 1.0]]},
+        "profiles": {
+            "camera_1": {"match": "*/camera_1/*", "rois": [{"points": [[0.05, 0.5], [0.95, 0.5], [1, 1], [0, 1]]}]}
+        }
+    }
+
+Cách sử dụng:
+    python roi.py <ảnh hoặc thư mục> ... --config roi_profiles.json
+"""
+
+import os
+import sys
+import json
+import fnmatch
+import argparse
+
+import cv2
+import numpy as np
+
+from model_registry import data_path
+
+ROI_CONFIG_PATH = data_path("roi_profiles.json")
+
+# Màu nền YOLO letterbox - vùng ngoài đa giác được tô màu này trước khi detect
+MASK_VALUE = 114
+
+
+def to_polygon(roi, width: int, height: int) -> np.ndarray:
+    """
+    Chuyển một ROI (hình chữ nhật/đa giác, tuyệt đối/tỉ lệ) thành đa giác pixel
+
+    Returns:
+        Mảng int32 (N, 2) đã cắt trong phạm vi ảnh
+    """
+    if isinstance(roi, dict):
+        points = np.asarray(roi['points'], dtype=np.float64)
+    else:
+        x1, y1, x2, y2 = roi
+        points = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float64)
+    if len(points) < 3:
+        raise ValueError("ROI cần ít nhất 3 điểm")
+    if points.max() <= 1.0:
+        points = points * [width, height]
+    points[:, 0] = points[:, 0].clip(0, width)
+    points[:, 1] = points[:, 1].clip(0, height)
+    return np.round(points).astype(np.int32)
+
+
+def is_rectangle(polygon: np.ndarray) -> bool:
+    """Đa giác là hình chữ nhật song song trục (không cần mask)"""
+    if len(polygon) != 4:
+        return False
+    xs, ys = set(polygon[:, 0].tolist()), set(polygon[:, 1].tolist())
+    return len(xs) <= 2 and len(ys) <= 2
+
+
+def crop_region(image: np.ndarray, polygon: np.ndarray) -> tuple:
+    """
+    Cắt vùng bao của đa giác; phần ngoài đa giác được tô MASK_VALUE
+
+    Returns:
+        (crop, (offset_x, offset_y)) hoặc (None, None) nếu vùng rỗng
+    """
+    x, y, w, h = cv2.boundingRect(polygon)
+    if w < 2 or h < 2:
+        return None, None
+    crop = image[y:y + h, x:x + w]
+    if is_rectangle(polygon):
+        # View không copy; detect chỉ đọc
+        return crop, (x, y)
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.fillPoly(mask, [polygon - [x, y]], 255)
+    crop = crop.copy()
+    crop[mask == 0] = MASK_VALUE
+    return crop, (x, y)
+
+
+def inside(polygon: np.ndarray, bbox: list) -> bool:
+    """Tâm bounding box nằm trong đa giác"""
+    cx = (bbox[0] + bbox[2]) / 2
+    cy = (bbox[1] + bbox[3]) / 2
+    return cv2.pointPolygonTest(polygon.reshape(-1, 1, 2), (float(cx), float(cy)), False) >= 0
+
+
+class RoiConfig:
+    """ROI theo ảnh cụ thể hoặc theo profile khớp đường dẫn"""
+
+    def __init__(self, images: dict = None, profiles: dict = None):
+        self.images = {os.path.normcase(os.path.abspath(p)): rois for p, rois in (images or {}).items()}
+        self.profiles = profiles or {}
+
+    @classmethod
+    def load(cls, path: str = ROI_CONFIG_PATH):
+        """Đọc file cấu hình (cấu hình rỗng nếu không có file)"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('images'), data.get('profiles'))
+
+    def save(self, path: str = ROI_CONFIG_PATH):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'images': self.images, 'profiles': self.profiles}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def rois_for(self, image_path: str):
+        """ROI của một ảnh: cấu hình riêng của ảnh trước, sau đó profile đầu tiên khớp"""
+        key = os.path.normcase(os.path.abspath(image_path))
+        if key in self.images:
+            return self.images[key]
+        normalized = key.replace('\\', '/')
+        for profile in self.profiles.values():
+            pattern = os.path.normcase(profile.get('match', '')).replace('\\', '/')
+            if pattern and fnmatch.fnmatch(normalized, pattern):
+                return profile['rois']
+        return None
+
+
+class RoiDetector:
+    """
+    Bọc PersonDetector để mọi ảnh chỉ được detect trong ROI
+    (dùng được với DetectionPipeline: có detect/detect_batch/draw_results)
+    """
+
+    def __init__(self, detector, rois: list):
+        self.detector = detector
+        self.rois = rois
+        self.model_name = getattr(detector, 'model_name', None)
+
+    def detect(self, image, confidence: float = 0.3) -> list:
+        return self.detector.detect_regions([image], [self.rois], confidence)[0]
+
+    def detect_batch(self, images: list, confidence: float = 0.3) -> list:
+        return self.detector.detect_regions(images, [self.rois] * len(images), confidence)
+
+    def draw_results(self, image, detections: list, max_size: int = None):
+        return self.detector.draw_results(image, detections, max_size)
+
+
+def main():
+    """Đếm khuôn mặt chỉ trong ROI theo file cấu hình"""
+    from pipeline import _expand_paths
+    from person_detector import PersonDetector
+
+    parser = argparse.ArgumentParser(description="Đếm khuôn mặt trong vùng quan tâm")
+    parser.add_argument("inputs", nargs="+", help="Ảnh hoặc thư mục ảnh")
+    parser.add_argument("--config", default=ROI_CONFIG_PATH, help="File cấu hình ROI")
+    parser.add_argument("--confidence", type=float, default=0.3, help="Ngưỡng confidence")
+    parser.add_argument("--batch-size", type=int, default=8, help="Số ảnh mỗi batch inference")
+    args = parser.parse_args()
+
+    paths = _expand_paths(args.inputs)
+    if not paths:
+        print("Không tìm thấy ảnh nào")
+        sys.exit(1)
+
+    config = RoiConfig.load(args.config)
+    detector = PersonDetector()
+    for start in range(0, len(paths), args.batch_size):
+        chunk = paths[start:start + args.batch_size]
+        results = detector.detect_regions(chunk, [config.rois_for(p) for p in chunk], args.confidence)
+        for path, detections in zip(chunk, results):
+            print(f"{len(detections):>5}  {path}")
+
+
+if __name__ == "__main__":
+    main()
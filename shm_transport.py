@@ -0,0 +1,342 @@
+"""
+Shared Memory Transport Module
+Trao đổi ảnh đã decode và kết quả detection giữa các worker process qua
+multiprocessing.shared_memory, không cần pickle mảng ảnh lớn
+"""
+
+import multiprocessing as mp
+from collections import deque
+from multiprocessing import connection
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# Record detection có layout cố định: bbox (4 x int32) + confidence (float32) = 20 bytes
+DETECTION_DTYPE = np.dtype([('bbox', '<i4', (4,)), ('confidence', '<f4')])
+
+
+class SlotLayout:
+    """
+    Bố cục vùng shared memory: `slots` ô, mỗi ô gồm vùng ảnh (uint8)
+    và vùng kết quả (mảng DETECTION_DTYPE)
+    """
+
+    def __init__(self, slots: int, max_frame_bytes: int, max_detections: int):
+        self.slots = slots
+        self.max_frame_bytes = max_frame_bytes
+        self.max_detections = max_detections
+        self.result_bytes = max_detections * DETECTION_DTYPE.itemsize
+        self.slot_bytes = max_frame_bytes + self.result_bytes
+
+    @property
+    def total_bytes(self) -> int:
+        return self.slots * self.slot_bytes
+
+    def frame_view(self, buf, slot: int, shape: tuple) -> np.ndarray:
+        """View (không copy) vào vùng ảnh của một ô"""
+        offset = slot * self.slot_bytes
+        return np.ndarray(shape, dtype=np.uint8, buffer=buf, offset=offset)
+
+    def result_view(self, buf, slot: int, count: int) -> np.ndarray:
+        """View (không copy) vào vùng kết quả của một ô"""
+        offset = slot * self.slot_bytes + self.max_frame_bytes
+        return np.ndarray((count,), dtype=DETECTION_DTYPE, buffer=buf, offset=offset)
+
+    def to_args(self) -> tuple:
+        return (self.slots, self.max_frame_bytes, self.max_detections)
+
+
+def _worker_main(shm_name: str, layout_args: tuple, task_q, result_conn,
+                 detector_kwargs: dict, confidence: float, worker_plan: dict = None):
+    """
+    Vòng lặp của worker process
+
+    Nhận (seq, slot, shape) hoặc (seq, None, frame) khi ảnh quá lớn,
+    trả (seq, slot, count, overflow, error) qua pipe riêng của worker - overflow là
+    list detection khi số lượng vượt quá sức chứa của ô.
+    """
+    if worker_plan is not None:
+        # Đặt trước khi import torch để OpenMP/MKL đọc đúng số thread
+        from cpu_scheduler import apply_worker_plan
+        apply_worker_plan(worker_plan)
+    from person_detector import PersonDetector
+
+    layout = SlotLayout(*layout_args)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    detector = PersonDetector(**detector_kwargs)
+    try:
+        while True:
+            task = task_q.get()
+            if task is None:
+                break
+            seq, slot, payload = task
+            try:
+                frame = layout.frame_view(shm.buf, slot, payload) if slot is not None else payload
+                detections = detector.detect(frame, confidence)
+                del frame
+                count = len(detections)
+                overflow = None
+                if slot is not None and count <= layout.max_detections:
+                    records = layout.result_view(shm.buf, slot, count)
+                    for i, det in enumerate(detections):
+                        records[i] = (det['bbox'], det['confidence'])
+                    del records
+                else:
+                    overflow = detections
+                result_conn.send((seq, slot, count, overflow, None))
+            except Exception as e:
+                result_conn.send((seq, slot, 0, None, str(e)))
+    finally:
+        result_conn.close()
+        shm.close()
+
+
+class SharedMemoryDetectorPool:
+    """
+    Pool worker process dùng chung một ring buffer shared memory
+
+    Process chính decode ảnh, copy thẳng vào một ô trống của ring buffer và
+    chỉ gửi chỉ số ô qua queue. Worker đọc ảnh bằng view không copy, ghi kết
+    quả vào vùng record cố định của cùng ô. Ô được giải phóng khi process
+    chính đã đọc kết quả, nên số ảnh đang xử lý luôn bị giới hạn bởi số ô.
+
+    Mỗi worker có hàng đợi task và pipe kết quả riêng (worker chết giữa lúc gửi chỉ
+    làm hỏng pipe của chính nó) để biết ảnh nào đang ở worker nào: worker
+    chết giữa chừng (crash, bị kill do hết RAM) thì ảnh của nó được trả về lỗi
+    (detections None), ô được thu hồi và các worker còn lại xử lý tiếp.
+
+    Ví dụ:
+        with SharedMemoryDetectorPool(workers=4) as pool:
+            for path, detections in pool.map(paths):
+                ...
+    """
+
+    def __init__(self, workers: int = 2, slots: int = None,
+                 max_frame_shape: tuple = (4096, 4096, 3), max_detections: int = 2048,
+                 confidence: float = 0.3, decode_workers: int = 2,
+                 cpu_plan=True, **detector_kwargs):
+        """
+        Args:
+            workers: Số worker process (mỗi process một PersonDetector)
+            slots: Số ô trong ring buffer (mặc định: 2 ô mỗi worker)
+            max_frame_shape: Kích thước ảnh lớn nhất vừa một ô; ảnh lớn hơn được gửi qua pickle
+            max_detections: Số detection tối đa ghi vào một ô
+            confidence: Ngưỡng confidence
+            decode_workers: Số thread decode trong process chính
+            cpu_plan: List plan từ CpuScheduler.plan() (một phần tử mỗi worker),
+                      True: dùng plan đã autotune nếu khớp số worker, nếu không thì chia đều core;
+                      False/None: không gán core
+            **detector_kwargs: Tham số cho PersonDetector (mode, model_size, ...)
+        """
+        self.workers = max(1, workers)
+        max_frame_bytes = int(np.prod(max_frame_shape))
+        self.layout = SlotLayout(slots or self.workers * 2, max_frame_bytes, max_detections)
+        self.confidence = confidence
+        self.decode_workers = max(1, decode_workers)
+        self.detector_kwargs = detector_kwargs
+        if cpu_plan is True:
+            from cpu_scheduler import CpuScheduler
+            saved = CpuScheduler.load()
+            cpu_plan = saved if saved and len(saved) == self.workers else CpuScheduler().plan(self.workers)
+        self.cpu_plan = cpu_plan or None
+
+        self._shm = None
+        self._processes = []
+        self._task_qs = []
+        self._result_conns = []
+
+    def start(self):
+        """Cấp phát shared memory và khởi động worker"""
+        ctx = mp.get_context('spawn')
+        self._shm = shared_memory.SharedMemory(create=True, size=self.layout.total_bytes)
+        for i in range(self.workers):
+            worker_plan = self.cpu_plan[i % len(self.cpu_plan)] if self.cpu_plan else None
+            task_q = ctx.Queue()
+            reader, writer = ctx.Pipe(duplex=False)
+            p = ctx.Process(
+                target=_worker_main,
+                args=(self._shm.name, self.layout.to_args(), task_q, writer,
+                      self.detector_kwargs, self.confidence, worker_plan),
+                daemon=True
+            )
+            p.start()
+            # Chỉ worker giữ đầu ghi: worker thoát thì recv() báo EOF thay vì chờ mãi
+            writer.close()
+            self._processes.append(p)
+            self._task_qs.append(task_q)
+            self._result_conns.append(reader)
+        return self
+
+    def close(self):
+        """Dừng worker và giải phóng shared memory"""
+        for p, task_q in zip(self._processes, self._task_qs):
+            if p.exitcode is None:
+                task_q.put(None)
+        for p in self._processes:
+            p.join(timeout=30)
+            if p.is_alive():
+                p.terminate()
+        for conn in self._result_conns:
+            conn.close()
+        self._processes = []
+        self._task_qs = []
+        self._result_conns = []
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def _decode(path: str) -> np.ndarray:
+        frame = cv2.imread(path)
+        if frame is None:
+            raise ValueError(f"Không thể đọc ảnh: {path}")
+        return frame
+
+    def _submit(self, seq: int, frame: np.ndarray, free_slots: list, worker: int):
+        """
+        Copy ảnh vào một ô trống và gửi chỉ số ô cho worker
+
+        Returns:
+            Ô đã dùng (None nếu ảnh quá lớn, gửi qua pickle)
+        """
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.nbytes <= self.layout.max_frame_bytes:
+            slot = free_slots.pop()
+            view = self.layout.frame_view(self._shm.buf, slot, frame.shape)
+            view[...] = frame
+            del view
+            self._task_qs[worker].put((seq, slot, frame.shape))
+            return slot
+        self._task_qs[worker].put((seq, None, frame))
+        return None
+
+    def _reap(self, alive: set, owner: dict, pending: dict, free_slots: list):
+        """
+        Phát hiện worker đã thoát: ảnh đang giao cho nó trả về lỗi, thu hồi ô
+
+        Raises:
+            RuntimeError: Khi không còn worker nào chạy
+        """
+        for worker in list(alive):
+            exitcode = self._processes[worker].exitcode
+            if exitcode is None:
+                continue
+            alive.discard(worker)
+            lost = [seq for seq, (w, _) in owner.items() if w == worker]
+            print(f"Worker {worker} đã dừng (exitcode {exitcode}), {len(lost)} ảnh đang xử lý bị lỗi")
+            for seq in lost:
+                _, slot = owner.pop(seq)
+                pending[seq] = None
+                if slot is not None:
+                    free_slots.append(slot)
+        if not alive:
+            raise RuntimeError("Tất cả worker process đã dừng")
+
+    def _collect(self, result) -> list:
+        """Đọc kết quả từ ô (copy ra list dict) và trả ô về danh sách trống"""
+        seq, slot, count, overflow, error = result
+        if error is not None:
+            return None
+        if overflow is not None:
+            return overflow
+        records = self.layout.result_view(self._shm.buf, slot, count)
+        detections = [
+            {'bbox': [int(v) for v in rec['bbox']], 'confidence': float(rec['confidence']), 'number': i + 1}
+            for i, rec in enumerate(records)
+        ]
+        del records
+        return detections
+
+    def map(self, images):
+        """
+        Xử lý danh sách ảnh, trả kết quả đúng thứ tự đầu vào
+
+        Args:
+            images: Iterable đường dẫn ảnh hoặc ảnh BGR (numpy array)
+
+        Yields:
+            (image, detections) - detections là None nếu ảnh lỗi
+        """
+        if self._shm is None:
+            raise RuntimeError("Pool chưa được start()")
+
+        free_slots = list(range(self.layout.slots))
+        items = iter(enumerate(images))
+        decoding = deque()
+        inputs = {}
+        pending = {}
+        owner = {}  # seq -> (worker, ô) của ảnh đang xử lý
+        alive = set(range(len(self._processes)))
+        next_seq = 0
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as pool:
+            while True:
+                # Decode trước tối đa bằng số ô để ô trống luôn có ảnh sẵn
+                while not exhausted and len(decoding) < self.layout.slots:
+                    try:
+                        seq, image = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    inputs[seq] = image
+                    if isinstance(image, np.ndarray):
+                        decoding.append((seq, pool.submit(lambda img=image: img)))
+                    else:
+                        decoding.append((seq, pool.submit(self._decode, image)))
+
+                # Gửi ảnh đã decode vào các ô trống, cho worker còn sống đang ít việc nhất
+                self._reap(alive, owner, pending, free_slots)
+                while decoding and free_slots:
+                    seq, future = decoding.popleft()
+                    try:
+                        frame = future.result()
+                    except Exception:
+                        pending[seq] = None
+                        continue
+                    load = {worker: 0 for worker in alive}
+                    for worker, _ in owner.values():
+                        if worker in load:
+                            load[worker] += 1
+                    worker = min(load, key=load.get)
+                    owner[seq] = (worker, self._submit(seq, frame, free_slots, worker))
+                    del frame
+
+                # Trả kết quả theo thứ tự
+                while next_seq in pending:
+                    yield inputs.pop(next_seq), pending.pop(next_seq)
+                    next_seq += 1
+
+                if not owner:
+                    if exhausted and not decoding:
+                        break
+                    continue
+
+                conns = {self._result_conns[worker]: worker for worker in alive}
+                for conn in connection.wait(list(conns), timeout=1.0):
+                    try:
+                        result = conn.recv()
+                    except (EOFError, OSError):
+                        # Worker đã thoát (có thể giữa lúc gửi): chờ exitcode để _reap thu hồi ảnh của nó
+                        process = self._processes[conns[conn]]
+                        process.join(timeout=5)
+                        if process.is_alive():
+                            process.terminate()
+                            process.join()
+                        continue
+                    if result[0] not in owner:
+                        # Ảnh đã bị tính lỗi khi worker dừng (ô đã được thu hồi)
+                        continue
+                    del owner[result[0]]
+                    pending[result[0]] = self._collect(result)
+                    if result[1] is not None:
+                        free_slots.append(result[1])
@@ -0,0 +1,188 @@
+"""
+Spatial Index Module
+Chỉ mục lưới (uniform grid) trên bounding box của các detection:
+truy vấn theo điểm (hover/click), theo vùng (viewport, ROI) và tìm box chồng lấp theo IoU
+(loại trùng lặp) mà không phải duyệt cả danh sách
+
+Cách sử dụng:
+    detections = indexed(detector.detect(image))
+    hit = detections.index.query_point(x, y)
+    unique = suppress_duplicates(detections, iou_threshold=0.6)
+"""
+
+import numpy as np
+
+# Số box tối thiểu để dùng lưới thay cho so sánh cả mảng
+MIN_GRID_BOXES = 64
+
+
+class GridIndex:
+    """
+    Lưới ô vuông đều phủ các bounding box
+
+    Mỗi box được ghi vào mọi ô mà nó chạm; truy vấn chỉ duyệt các ô liên quan
+    rồi lọc lại bằng toạ độ thật. Index chỉ đọc sau khi tạo (dùng chung giữa các thread).
+    """
+
+    def __init__(self, boxes, cell_size: float = None):
+        """
+        Args:
+            boxes: Mảng (N, 4) x1, y1, x2, y2 hoặc list box
+            cell_size: Cạnh ô lưới (pixel ảnh gốc); None: khoảng 2 lần cạnh box trung vị
+        """
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.areas = np.maximum(0, self.boxes[:, 2] - self.boxes[:, 0]) * \
+            np.maximum(0, self.boxes[:, 3] - self.boxes[:, 1])
+        if cell_size is None:
+            if len(self.boxes):
+                sides = np.maximum(self.boxes[:, 2] - self.boxes[:, 0], self.boxes[:, 3] - self.boxes[:, 1])
+                cell_size = float(np.median(sides)) * 2
+            cell_size = max(cell_size or 0, 16.0)
+        self.cell_size = cell_size
+        self._cells = {}
+        for i, (x1, y1, x2, y2) in enumerate(self.boxes.tolist()):
+            for cell in self._cells_for(x1, y1, x2, y2):
+                self._cells.setdefault(cell, []).append(i)
+
+    @classmethod
+    def from_detections(cls, detections: list, cell_size: float = None):
+        """Index trên kết quả detect() (dict có 'bbox'), chỉ số trùng thứ tự danh sách"""
+        return cls([det['bbox'] for det in detections], cell_size)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _cells_for(self, x1, y1, x2, y2):
+        size = self.cell_size
+        for cy in range(int(y1 // size), int(y2 // size) + 1):
+            for cx in range(int(x1 // size), int(x2 // size) + 1):
+                yield cx, cy
+
+    def _candidates(self, x1, y1, x2, y2) -> np.ndarray:
+        """Chỉ số các box có thể giao vùng (chưa lọc), đã sắp xếp"""
+        size = self.cell_size
+        cell_count = (int(x2 // size) - int(x1 // size) + 1) * (int(y2 // size) - int(y1 // size) + 1)
+        if cell_count >= len(self.boxes) or len(self.boxes) < MIN_GRID_BOXES:
+            # Vùng rộng (vd: đã thu nhỏ cả ảnh) hoặc ít box: lọc vector hoá cả mảng nhanh hơn duyệt ô
+            return np.arange(len(self.boxes))
+        candidates = set()
+        for cell in self._cells_for(x1, y1, x2, y2):
+            members = self._cells.get(cell)
+            if members:
+                candidates.update(members)
+        ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        ids.sort()
+        return ids
+
+    def query_box(self, x1: float, y1: float, x2: float, y2: float) -> list:
+        """
+        Chỉ số các box giao với vùng (x1, y1, x2, y2), theo thứ tự trong danh sách
+
+        Returns:
+            List chỉ số vào danh sách box/detection
+        """
+        if not len(self.boxes):
+            return []
+        ids = self._candidates(x1, y1, x2, y2)
+        boxes = self.boxes[ids]
+        hit = (boxes[:, 0] <= x2) & (boxes[:, 2] >= x1) & (boxes[:, 1] <= y2) & (boxes[:, 3] >= y1)
+        return ids[hit].tolist()
+
+    def query_point(self, x: float, y: float) -> list:
+        """
+        Chỉ số các box chứa điểm (x, y), box nhỏ nhất trước
+        (box nằm trong box khác vẫn chọn được bằng click)
+        """
+        ids = self.query_box(x, y, x, y)
+        return sorted(ids, key=lambda i: self.areas[i])
+
+    def iou(self, i: int, ids) -> np.ndarray:
+        """IoU giữa box i và các box ids"""
+        ids = np.asarray(ids, dtype=np.int64)
+        box, others = self.boxes[i], self.boxes[ids]
+        w = np.maximum(0, np.minimum(box[2], others[:, 2]) - np.maximum(box[0], others[:, 0]))
+        h = np.maximum(0, np.minimum(box[3], others[:, 3]) - np.maximum(box[1], others[:, 1]))
+        inter = w * h
+        return inter / np.maximum(1e-6, self.areas[i] + self.areas[ids] - inter)
+
+    def neighbours(self, i: int, iou_threshold: float = 0.5) -> list:
+        """
+        Các box chồng lên box i với IoU > iou_threshold
+
+        Returns:
+            List (chỉ số, IoU), IoU giảm dần
+        """
+        ids = [j for j in self.query_box(*self.boxes[i].tolist()) if j != i]
+        if not ids:
+            return []
+        overlaps = self.iou(i, ids)
+        pairs = [(j, float(o)) for j, o in zip(ids, overlaps) if o > iou_threshold]
+        return sorted(pairs, key=lambda pair: -pair[1])
+
+    def suppress(self, scores, iou_threshold: float = 0.5) -> list:
+        """
+        Non-maximum suppression chỉ so sánh các box lân cận trong lưới
+        (cùng kết quả với NMS tham lam thông thường)
+
+        Returns:
+            Chỉ số các box được giữ (theo score giảm dần)
+        """
+        order = np.argsort(-np.asarray(scores, dtype=np.float32), kind='stable')
+        suppressed = np.zeros(len(self.boxes), dtype=bool)
+        keep = []
+        for i in order.tolist():
+            if suppressed[i]:
+                continue
+            keep.append(i)
+            ids = [j for j in self.query_box(*self.boxes[i].tolist()) if not suppressed[j] and j != i]
+            if ids:
+                overlaps = self.iou(i, ids)
+                suppressed[np.asarray(ids)[overlaps > iou_threshold]] = True
+        return keep
+
+
+class IndexedDetections(list):
+    """
+    Danh sách detection (vẫn là list bình thường) kèm GridIndex tạo khi cần lần đầu
+
+    Coi như chỉ đọc: sửa danh sách sau khi đã truy cập .index thì index không còn đúng.
+    """
+
+    _index = None
+
+    @property
+    def index(self) -> GridIndex:
+        if self._index is None:
+            self._index = GridIndex.from_detections(self)
+        return self._index
+
+    def at(self, x: float, y: float):
+        """Detection trên cùng (box nhỏ nhất) chứa điểm (x, y), None nếu không có"""
+        ids = self.index.query_point(x, y)
+        return self[ids[0]] if ids else None
+
+    def within(self, x1: float, y1: float, x2: float, y2: float) -> list:
+        """Các detection giao với vùng"""
+        return [self[i] for i in self.index.query_box(x1, y1, x2, y2)]
+
+
+def indexed(detections: list) -> IndexedDetections:
+    """Bọc kết quả detect() để có index (giữ nguyên nếu đã được bọc)"""
+    if isinstance(detections, IndexedDetections):
+        return detections
+    return IndexedDetections(detections)
+
+
+def suppress_duplicates(detections: list, iou_threshold: float = 0.5) -> IndexedDetections:
+    """
+    Bỏ các detection trùng nhau (IoU > ngưỡng), giữ box confidence cao nhất,
+    đánh số lại theo thứ tự ban đầu
+    """
+    detections = indexed(detections)
+    keep = detections.index.suppress([det.get('confidence', 0.0) for det in detections], iou_threshold)
+    result = IndexedDetections()
+    for number, i in enumerate(sorted(keep), 1):
+        det = dict(detections[i])
+        det['number'] = number
+        result.append(det)
+    return result
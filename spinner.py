@@ -0,0 +1,63 @@
+"""
+Spinner Module
+Spinner loading dùng chung cho splash/launcher: các chấm được tạo một lần trên canvas,
+mỗi nhịp animation chỉ dời toạ độ (không xoá/tạo lại item), toạ độ mọi góc tính sẵn
+"""
+
+import math
+
+# Màu chấm gốc (accent color) - chấm sau nhạt dần
+_DOT_GREEN, _DOT_BLUE = 69, 96
+
+
+class Spinner:
+    """Vòng chấm xoay trên một Canvas"""
+
+    def __init__(self, canvas, cx: float = 30, cy: float = 30, radius: float = 20,
+                 num_dots: int = 8, step: float = -15):
+        """
+        Args:
+            canvas: Canvas để vẽ
+            cx, cy: Tâm vòng xoay
+            radius: Bán kính vòng xoay
+            num_dots: Số chấm
+            step: Số độ xoay mỗi nhịp (âm: ngược chiều kim đồng hồ)
+        """
+        self.canvas = canvas
+        self.phase = 0
+        sizes = [6 - (i * 0.5) for i in range(num_dots)]
+        self.items = []
+        for i, size in enumerate(sizes):
+            if size <= 0:
+                continue
+            opacity = 255 - (i * 25)
+            self.items.append(canvas.create_oval(
+                0, 0, 0, 0,
+                fill=f"#{opacity:02x}{_DOT_GREEN:02x}{_DOT_BLUE:02x}",
+                outline=""
+            ))
+
+        # Toạ độ của mọi chấm ở từng góc xoay (một vòng đầy đủ)
+        phases = max(1, round(360 / abs(step))) if step else 1
+        self._frames = []
+        for p in range(phases):
+            angle = p * step
+            coords = []
+            for i, size in enumerate(sizes):
+                if size <= 0:
+                    continue
+                angle_rad = math.radians(angle + i * (360 / num_dots))
+                x = cx + radius * math.cos(angle_rad)
+                y = cy + radius * math.sin(angle_rad)
+                coords.append((x - size, y - size, x + size, y + size))
+            self._frames.append(coords)
+        self._place()
+
+    def _place(self):
+        for item, coords in zip(self.items, self._frames[self.phase]):
+            self.canvas.coords(item, *coords)
+
+    def advance(self):
+        """Xoay thêm một nhịp"""
+        self.phase = (self.phase + 1) % len(self._frames)
+        self._place()
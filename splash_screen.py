@@ -5,7 +5,12 @@ Hiển thị màn hình loading khi ứng dụng khởi động
 
 import tkinter as tk
 import threading
-import math
+
+from spinner import Spinner
+
+# Nhịp animation (ms) và số nhịp giữa hai lần đổi dấu "..."
+FRAME_MS = 50
+DOTS_EVERY = 6
 
 
 class SplashScreen:
@@ -39,8 +44,7 @@ class SplashScreen:
         self.root.configure(bg=self.bg_color)
         
         # Animation variables
-        self.angle = 0
-        self.dots = 0
+        self.ticks = 0
         self.running = True
         
         # Tạo giao diện
@@ -94,6 +98,7 @@ class SplashScreen:
             highlightthickness=0
         )
         self.canvas.pack(pady=10)
+        self.spinner = Spinner(self.canvas)
         
         # Loading text
         self.loading_label = tk.Label(
@@ -115,51 +120,22 @@ class SplashScreen:
         )
         version_label.pack(pady=(10, 5))
         
-    def _draw_spinner(self):
-        """Vẽ spinner animation"""
-        self.canvas.delete("all")
-        
-        cx, cy = 30, 30  # Center
-        radius = 20
-        
-        # Vẽ các chấm xung quanh
-        num_dots = 8
-        for i in range(num_dots):
-            angle_rad = math.radians(self.angle + i * (360 / num_dots))
-            x = cx + radius * math.cos(angle_rad)
-            y = cy + radius * math.sin(angle_rad)
-            
-            # Độ lớn và màu sắc giảm dần
-            size = 6 - (i * 0.5)
-            opacity = 255 - (i * 25)
-            
-            # Tạo màu với opacity khác nhau
-            color = f"#{opacity:02x}{69:02x}{96:02x}"  # Gradient của accent color
-            
-            if size > 0:
-                self.canvas.create_oval(
-                    x - size, y - size,
-                    x + size, y + size,
-                    fill=color,
-                    outline=""
-                )
-        
     def _animate(self):
         """Animation loop"""
         if not self.running:
             return
             
-        # Update spinner
-        self.angle -= 15  # Xoay ngược chiều kim đồng hồ
-        self._draw_spinner()
+        # Update spinner (dời các chấm có sẵn, không vẽ lại)
+        self.spinner.advance()
         
-        # Update loading text với dots
-        dots_text = "." * (self.dots % 4)
-        self.loading_label.config(text=f"Đang khởi động{dots_text}")
-        self.dots += 1
+        # Update loading text với dots, chỉ khi số dấu chấm thay đổi
+        if self.ticks % DOTS_EVERY == 0:
+            dots_text = "." * (self.ticks // DOTS_EVERY % 4)
+            self.loading_label.config(text=f"Đang khởi động{dots_text}")
+        self.ticks += 1
         
         # Tiếp tục animation
-        self.root.after(50, self._animate)
+        self.root.after(FRAME_MS, self._animate)
         
     def close(self):
         """Đóng splash screen"""
@@ -0,0 +1,43 @@
+import threading
+
+from memory_budget import MemoryBudget
+
+MB = 1024 ** 2
+
+
+def test_oversized_acquire_granted_while_view_is_held():
+    budget = MemoryBudget(100 * MB)
+    budget.add('view', 80 * MB)
+    # Không có ảnh nào khác trong pipeline: ảnh lớn vẫn được cấp dù vượt ngân sách
+    assert budget.acquire(50 * MB, 'decode', timeout=1.0)
+    budget.release(50 * MB, 'decode')
+    assert budget.used == 80 * MB
+
+
+def test_acquire_waits_for_other_reservations():
+    budget = MemoryBudget(100 * MB)
+    assert budget.acquire(70 * MB, 'decode', timeout=1.0)
+    assert not budget.acquire(50 * MB, 'decode', timeout=0.2)
+
+    timer = threading.Timer(0.2, budget.release, args=(70 * MB, 'decode'))
+    timer.start()
+    assert budget.acquire(50 * MB, 'decode', timeout=5.0)
+    timer.join()
+
+
+def test_eviction_retried_on_each_wait_cycle():
+    budget = MemoryBudget(100 * MB)
+    budget.add('tiles', 60 * MB)
+    calls = []
+
+    def late_evictor(nbytes):
+        # Giống tile cache: lần đầu chỉ hẹn giải phóng, các lần sau mới giảm thật
+        calls.append(nbytes)
+        if len(calls) == 2:
+            budget.add('tiles', -60 * MB)
+        return 0
+
+    budget.register_cache("tiles", late_evictor)
+    assert budget.acquire(30 * MB, 'decode', timeout=1.0)
+    assert budget.acquire(30 * MB, 'decode', timeout=2.0)
+    assert len(calls) >= 2
@@ -0,0 +1,460 @@
+"""
+Updater Module
+Cập nhật delta cho bản cài đặt: chỉ tải các file thay đổi theo manifest,
+ghép từ các chunk định danh bằng nội dung và thay thế nguyên tử
+
+Phía phát hành:
+    python updater.py build <thư mục bản build> <thư mục publish> --version 1.1
+"""
+
+import os
+import sys
+import json
+import queue
+import shutil
+import hashlib
+import argparse
+import threading
+import urllib.parse
+
+from downloader import open_url, DownloadError
+
+MANIFEST_NAME = "manifest.json"
+CHUNK_SIZE = 1024 * 1024  # 1MB mỗi chunk
+UPDATE_DIR_NAME = ".update"
+
+
+def _file_hashes(path: str, chunk_size: int = CHUNK_SIZE) -> tuple:
+    """Trả về (sha256 cả file, list sha256 từng chunk, kích thước)"""
+    whole = hashlib.sha256()
+    chunks = []
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            whole.update(block)
+            chunks.append(hashlib.sha256(block).hexdigest())
+            size += len(block)
+    return whole.hexdigest(), chunks, size
+
+
+def _walk_files(root_dir: str):
+    """Liệt kê file (đường dẫn tương đối dạng '/'), bỏ qua manifest và thư mục .update"""
+    for current, dirs, files in os.walk(root_dir):
+        dirs[:] = [d for d in dirs if d != UPDATE_DIR_NAME]
+        for name in files:
+            full = os.path.join(current, name)
+            rel = os.path.relpath(full, root_dir).replace(os.sep, '/')
+            if rel != MANIFEST_NAME:
+                yield rel, full
+
+
+def scan_directory(root_dir: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Tạo manifest bằng cách hash toàn bộ file trong thư mục"""
+    files = {}
+    for rel, full in _walk_files(root_dir):
+        sha, chunks, size = _file_hashes(full, chunk_size)
+        files[rel] = {'size': size, 'sha256': sha, 'chunks': chunks}
+    return {'version': "", 'chunk_size': chunk_size, 'files': files}
+
+
+def manifest_digest(manifest: dict) -> str:
+    """Định danh nội dung manifest (không phụ thuộc thứ tự key)"""
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def write_manifest(manifest: dict, path: str):
+    """Ghi manifest nguyên tử (tmp + os.replace)"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_install_manifest(source_dir: str, install_dir: str, version: str = "") -> dict:
+    """
+    Ghi manifest của bản vừa cài từ zip
+
+    Hash thư mục staging (chỉ chứa file của bản phát hành) nên dữ liệu người dùng
+    trong thư mục cài đặt không bao giờ nằm trong manifest, và cũng không bị xoá khi cập nhật.
+    """
+    manifest = scan_directory(source_dir)
+    manifest['version'] = version
+    write_manifest(manifest, os.path.join(install_dir, MANIFEST_NAME))
+    return manifest
+
+
+def build_manifest(source_dir: str, publish_dir: str, version: str = "",
+                   chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Tạo manifest và kho chunk để publish lên server
+
+    Args:
+        source_dir: Thư mục bản build
+        publish_dir: Thư mục đầu ra (manifest.json + chunks/<sha256>)
+        version: Tên phiên bản
+        chunk_size: Kích thước chunk
+
+    Returns:
+        Manifest (dict)
+    """
+    chunk_dir = os.path.join(publish_dir, "chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    manifest = scan_directory(source_dir, chunk_size)
+    manifest['version'] = version
+    manifest['chunk_base'] = "chunks/"
+
+    for rel, full in _walk_files(source_dir):
+        with open(full, 'rb') as f:
+            for digest in manifest['files'][rel]['chunks']:
+                block = f.read(chunk_size)
+                target = os.path.join(chunk_dir, digest)
+                if not os.path.exists(target):
+                    with open(target, 'wb') as out:
+                        out.write(block)
+
+    with open(os.path.join(publish_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def fetch_manifest(url: str) -> dict:
+    """Tải manifest từ server"""
+    with open_url(url, timeout=15) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+class DeltaUpdater:
+    """
+    So sánh manifest trên server với bản cài đặt và chỉ tải phần thay đổi
+
+    - Mỗi file được mô tả bằng sha256 và danh sách sha256 của các chunk
+    - Chunk đã có trong bản cài đặt cũ được tái sử dụng, chỉ tải chunk thiếu
+    - File mới được ghép trong .update/new, kiểm tra sha256, sau đó đổi chỗ
+      bằng os.replace; file cũ giữ trong .update/old để rollback nếu lỗi giữa chừng
+    """
+
+    def __init__(self, install_dir: str, manifest_url: str,
+                 connections: int = 4, on_progress=None):
+        """
+        Args:
+            install_dir: Thư mục cài đặt
+            manifest_url: URL của manifest.json
+            connections: Số kết nối tải chunk song song
+            on_progress: Callback(done_bytes, total_bytes)
+        """
+        self.install_dir = install_dir
+        self.manifest_url = manifest_url
+        self.connections = max(1, connections)
+        self.on_progress = on_progress
+
+        self.update_dir = os.path.join(install_dir, UPDATE_DIR_NAME)
+        self.local_manifest_path = os.path.join(install_dir, MANIFEST_NAME)
+        self.remote = None
+        self.changed = []
+        self.removed = []
+
+    # ------------------------------------------------------------------
+    # Manifest
+    # ------------------------------------------------------------------
+    def load_local_manifest(self) -> dict:
+        """
+        Manifest của bản đang cài; hash lại thư mục nếu chưa có (bản cài cũ không ghi manifest)
+
+        Manifest hash lại được đánh dấu 'scanned': nó có cả file dữ liệu của người dùng
+        nên không được dùng để quyết định xoá file.
+        """
+        try:
+            with open(self.local_manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            chunk_size = (self.remote or {}).get('chunk_size', CHUNK_SIZE)
+            manifest = scan_directory(self.install_dir, chunk_size)
+            manifest['scanned'] = True
+            return manifest
+
+    def _local_file_ok(self, rel: str, info: dict) -> bool:
+        """File có tồn tại và đúng kích thước khai báo"""
+        path = os.path.join(self.install_dir, rel)
+        return os.path.isfile(path) and os.path.getsize(path) == info['size']
+
+    def _is_safe_rel(self, rel: str) -> bool:
+        """
+        Đường dẫn trong manifest phải là đường dẫn tương đối nằm trong install_dir,
+        không trỏ vào manifest hay thư mục .update
+        """
+        if not isinstance(rel, str) or not rel or os.path.isabs(rel) or os.path.splitdrive(rel)[0]:
+            return False
+        parts = rel.replace('\\', '/').split('/')
+        if '..' in parts or parts[0] in (UPDATE_DIR_NAME, MANIFEST_NAME):
+            return False
+        root = os.path.realpath(self.install_dir)
+        target = os.path.realpath(os.path.join(root, rel))
+        return os.path.commonpath([root, target]) == root and target != root
+
+    def check(self) -> int:
+        """
+        Kiểm tra cập nhật
+
+        Returns:
+            Số byte cần tải (0 nếu đã là bản mới nhất)
+        """
+        self.recover()
+        self.remote = fetch_manifest(self.manifest_url)
+        remote_files = self.remote['files']
+        # Kiểm tra trước khi tải/ghi/xoá bất cứ thứ gì: manifest không được ghi ra ngoài thư mục cài đặt
+        unsafe = [rel for rel in remote_files if not self._is_safe_rel(rel)]
+        if unsafe:
+            raise DownloadError(f"Manifest có đường dẫn không hợp lệ: {unsafe[0]!r}")
+        local = self.load_local_manifest()
+        local_files = local.get('files', {})
+        for rel in [rel for rel in local_files if not self._is_safe_rel(rel)]:
+            # Manifest cục bộ hỏng/bị sửa: bỏ mục đó (không bao giờ xoá theo nó)
+            print(f"Bỏ qua mục không hợp lệ trong manifest cục bộ: {rel!r}")
+            del local_files[rel]
+
+        self.changed = [
+            rel for rel, info in remote_files.items()
+            if local_files.get(rel, {}).get('sha256') != info['sha256']
+            or not self._local_file_ok(rel, info)
+        ]
+        # Chỉ xoá file mà một manifest đã ghi trước đó liệt kê (không bao giờ theo kết quả quét thư mục)
+        if local.get('scanned'):
+            self.removed = []
+        else:
+            self.removed = [rel for rel in local_files if rel not in remote_files]
+        if local.get('scanned') and not self.changed:
+            # Bản cài khớp hoàn toàn với server: ghi manifest để các lần sau có danh sách file tin cậy
+            write_manifest(self.remote, self.local_manifest_path)
+
+        self._local_chunks = self._index_local_chunks(local)
+        needed = self._needed_chunks()
+        return sum(size for size in needed.values())
+
+    def _index_local_chunks(self, local: dict) -> dict:
+        """Map sha256 chunk -> (file, offset, size) của các chunk đang có trên đĩa"""
+        chunk_size = local.get('chunk_size', CHUNK_SIZE)
+        if chunk_size != self.remote.get('chunk_size', CHUNK_SIZE):
+            return {}
+        index = {}
+        for rel, info in local.get('files', {}).items():
+            if not self._local_file_ok(rel, info):
+                continue
+            path = os.path.join(self.install_dir, rel)
+            for i, digest in enumerate(info['chunks']):
+                offset = i * chunk_size
+                index.setdefault(digest, (path, offset, min(chunk_size, info['size'] - offset)))
+        return index
+
+    def _needed_chunks(self) -> dict:
+        """Các chunk phải tải: {sha256: kích thước}"""
+        chunk_size = self.remote.get('chunk_size', CHUNK_SIZE)
+        needed = {}
+        for rel in self.changed:
+            info = self.remote['files'][rel]
+            for i, digest in enumerate(info['chunks']):
+                if digest not in self._local_chunks:
+                    needed[digest] = min(chunk_size, info['size'] - i * chunk_size)
+        return needed
+
+    # ------------------------------------------------------------------
+    # Tải và ghép
+    # ------------------------------------------------------------------
+    def _chunk_url(self, digest: str) -> str:
+        base = urllib.parse.urljoin(self.manifest_url, self.remote.get('chunk_base', "chunks/"))
+        return base + digest
+
+    def _download_chunks(self, needed: dict, chunk_dir: str):
+        """Tải các chunk thiếu song song, kiểm tra sha256 từng chunk"""
+        total = sum(needed.values())
+        progress = {'done': 0}
+        lock = threading.Lock()
+        work = queue.Queue()
+        errors = []
+
+        for digest in needed:
+            target = os.path.join(chunk_dir, digest)
+            # Chunk đã tải ở lần cập nhật bị gián đoạn trước
+            if os.path.exists(target) and os.path.getsize(target) == needed[digest]:
+                progress['done'] += needed[digest]
+                continue
+            work.put(digest)
+
+        def worker():
+            while not errors:
+                try:
+                    digest = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with open_url(self._chunk_url(digest)) as response:
+                        data = response.read()
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise DownloadError(f"Chunk {digest[:12]} bị hỏng")
+                    tmp_path = os.path.join(chunk_dir, digest + ".tmp")
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_path, os.path.join(chunk_dir, digest))
+                except Exception as e:
+                    errors.append(e)
+                    return
+                with lock:
+                    progress['done'] += len(data)
+                    if self.on_progress is not None:
+                        self.on_progress(progress['done'], total)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.connections)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+
+    def _read_chunk(self, digest: str, chunk_dir: str) -> bytes:
+        """Đọc chunk từ kho tải về, hoặc từ file cũ trong bản cài đặt"""
+        downloaded = os.path.join(chunk_dir, digest)
+        if os.path.exists(downloaded):
+            with open(downloaded, 'rb') as f:
+                return f.read()
+        path, offset, size = self._local_chunks[digest]
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise DownloadError(f"Chunk cục bộ trong {path} không khớp manifest")
+        return data
+
+    def _assemble(self, rel: str, chunk_dir: str, new_dir: str):
+        """Ghép file mới từ các chunk và kiểm tra sha256"""
+        info = self.remote['files'][rel]
+        target = os.path.join(new_dir, rel)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        whole = hashlib.sha256()
+        with open(target, 'wb') as f:
+            for digest in info['chunks']:
+                data = self._read_chunk(digest, chunk_dir)
+                whole.update(data)
+                f.write(data)
+        if whole.hexdigest() != info['sha256']:
+            raise DownloadError(f"File {rel} không khớp manifest")
+
+    # ------------------------------------------------------------------
+    # Đổi chỗ nguyên tử
+    # ------------------------------------------------------------------
+    def _journal_path(self) -> str:
+        return os.path.join(self.update_dir, "journal.json")
+
+    def _swap(self, new_dir: str, old_dir: str):
+        """Đưa file mới vào chỗ; ghi journal để rollback nếu bị ngắt"""
+        moves = []
+        with open(self._journal_path(), 'w', encoding='utf-8') as f:
+            json.dump({'changed': self.changed, 'removed': self.removed,
+                       'target': manifest_digest(self.remote)}, f)
+
+        try:
+            for rel in self.changed + self.removed:
+                target = os.path.join(self.install_dir, rel)
+                backup = os.path.join(old_dir, rel)
+                if os.path.exists(target):
+                    os.makedirs(os.path.dirname(backup), exist_ok=True)
+                    os.replace(target, backup)
+                    moves.append((backup, target))
+                if rel in self.remote['files']:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    os.replace(os.path.join(new_dir, rel), target)
+                    moves.append((target, None))
+        except Exception:
+            # Rollback theo thứ tự ngược lại
+            for src, dst in reversed(moves):
+                if dst is None:
+                    os.remove(src)
+                else:
+                    os.replace(src, dst)
+            os.remove(self._journal_path())
+            raise
+
+        # Ghi manifest mới là điểm commit: sau bước này recover() không khôi phục bản cũ nữa
+        write_manifest(self.remote, self.local_manifest_path)
+        os.remove(self._journal_path())
+
+    def recover(self):
+        """Khôi phục bản cũ nếu lần cập nhật trước bị ngắt giữa lúc đổi chỗ"""
+        journal = self._journal_path()
+        if not os.path.exists(journal):
+            return
+        with open(journal, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        try:
+            with open(self.local_manifest_path, 'r', encoding='utf-8') as f:
+                installed = manifest_digest(json.load(f))
+        except (OSError, ValueError):
+            installed = None
+        if installed is not None and installed == entries.get('target'):
+            # Bị ngắt sau khi đã commit manifest mới: bản mới đã đầy đủ, chỉ dọn journal
+            os.remove(journal)
+            return
+        old_dir = os.path.join(self.update_dir, "old")
+        for rel in entries['changed'] + entries['removed']:
+            backup = os.path.join(old_dir, rel)
+            if os.path.exists(backup):
+                target = os.path.join(self.install_dir, rel)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(backup, target)
+        os.remove(journal)
+
+    def apply(self):
+        """Tải, ghép và cài đặt các file thay đổi (gọi sau check())"""
+        if not self.changed and not self.removed:
+            return
+        chunk_dir = os.path.join(self.update_dir, "chunks")
+        new_dir = os.path.join(self.update_dir, "new")
+        old_dir = os.path.join(self.update_dir, "old")
+        for path in (new_dir, old_dir):
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(chunk_dir, exist_ok=True)
+
+        self._download_chunks(self._needed_chunks(), chunk_dir)
+        for rel in self.changed:
+            self._assemble(rel, chunk_dir, new_dir)
+        self._swap(new_dir, old_dir)
+        shutil.rmtree(self.update_dir, ignore_errors=True)
+
+
+def main():
+    """CLI tạo manifest/chunk cho phía phát hành"""
+    parser = argparse.ArgumentParser(description="Công cụ cập nhật delta")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Tạo manifest và kho chunk từ thư mục bản build")
+    build.add_argument("source_dir", help="Thư mục bản build")
+    build.add_argument("publish_dir", help="Thư mục đầu ra để upload lên server")
+    build.add_argument("--version", default="", help="Tên phiên bản")
+
+    update = sub.add_parser("update", help="Cập nhật một thư mục cài đặt")
+    update.add_argument("install_dir", help="Thư mục cài đặt")
+    update.add_argument("manifest_url", help="URL manifest.json")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        manifest = build_manifest(args.source_dir, args.publish_dir, args.version)
+        total = sum(info['size'] for info in manifest['files'].values())
+        print(f"Đã tạo manifest: {len(manifest['files'])} files, {total / (1024 * 1024):.1f} MB")
+    else:
+        updater = DeltaUpdater(args.install_dir, args.manifest_url)
+        size = updater.check()
+        if not updater.changed and not updater.removed:
+            print("Đã là bản mới nhất")
+            sys.exit(0)
+        print(f"Cần cập nhật {len(updater.changed)} files, tải {size / (1024 * 1024):.1f} MB")
+        updater.apply()
+        print("Cập nhật xong")
+
+
+if __name__ == "__main__":
+    main()
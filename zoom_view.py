@@ -0,0 +1,454 @@
+"""
+Zoom View Module
+Xem ảnh kết quả có zoom/pan trên Tkinter Canvas cho ảnh rất lớn (panorama 100 MP):
+ảnh được giữ dưới dạng pyramid, chỉ các tile đang hiển thị ở mức zoom hiện tại
+mới được cắt, resize, vẽ annotation và chuyển thành PhotoImage (cache LRU)
+"""
+
+import math
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from annotator import default_annotator, style_for
+from memory_budget import get_budget
+from spatial_index import indexed
+
+TILE_SIZE = 256
+MAX_TILES = 192          # Số PhotoImage tile giữ trong cache
+ZOOM_STEP = 1.25         # Hệ số zoom mỗi nấc lăn chuột
+MAX_ZOOM = 8.0           # Zoom tối đa (pixel màn hình / pixel ảnh)
+MIN_LEVEL_SIDE = 256     # Mức nhỏ nhất của pyramid
+FIT_MARGIN = 10          # Lề quanh ảnh khi vừa khung
+
+HOVER_COLOR = "#ffffff"
+SELECTED_COLOR = "#ffd93d"
+
+# Giới hạn cỡ label trên màn hình khi zoom
+MIN_FONT_SIZE = 8
+MAX_FONT_SIZE = 22
+
+
+class ImagePyramid:
+    """
+    Ảnh RGB ở nhiều mức phân giải (mỗi mức bằng một nửa mức trước)
+
+    Mức đầu tiên có thể đã thu nhỏ theo ngân sách bộ nhớ; width/height luôn là
+    kích thước ảnh gốc (toạ độ của detection). Tạo được trong thread nền;
+    sau đó chỉ đọc nên dùng chung an toàn.
+    """
+
+    def __init__(self, image, budget=None):
+        """
+        Args:
+            image: Đường dẫn ảnh, ảnh BGR (numpy array) hoặc PIL Image
+            budget: MemoryBudget quyết định tỉ lệ decode (mặc định: ngân sách dùng chung)
+        """
+        budget = budget or get_budget()
+        if isinstance(image, np.ndarray):
+            self.height, self.width = image.shape[:2]
+            self.decode_scale = budget.decode_scale(self.width, self.height)
+            if self.decode_scale > 1:
+                image = cv2.resize(image, self._reduced_size(), interpolation=cv2.INTER_AREA)
+            rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        else:
+            if not isinstance(image, Image.Image):
+                image = Image.open(image)
+            self.width, self.height = image.size
+            self.decode_scale = budget.decode_scale(self.width, self.height)
+            if self.decode_scale > 1:
+                # JPEG: decoder tự thu nhỏ 1/2, 1/4, 1/8 (không cần decode đủ độ phân giải)
+                image.draft('RGB', self._reduced_size())
+            rgb = np.asarray(image.convert('RGB'))
+            if self.decode_scale > 1 and rgb.shape[1] > self._reduced_size()[0]:
+                rgb = cv2.resize(rgb, self._reduced_size(), interpolation=cv2.INTER_AREA)
+        self.levels = [rgb]
+        while max(self.levels[-1].shape[:2]) > MIN_LEVEL_SIDE * 2:
+            prev = self.levels[-1]
+            size = (max(1, prev.shape[1] // 2), max(1, prev.shape[0] // 2))
+            self.levels.append(cv2.resize(prev, size, interpolation=cv2.INTER_AREA))
+        self.nbytes = sum(level.nbytes for level in self.levels)
+
+    def _reduced_size(self) -> tuple:
+        return (max(1, self.width // self.decode_scale), max(1, self.height // self.decode_scale))
+
+    def level_for(self, zoom: float) -> tuple:
+        """
+        Mức nhỏ nhất vẫn đủ chi tiết cho zoom (không phải phóng mức thấp lên)
+
+        Returns:
+            (mảng RGB, tỉ lệ x, tỉ lệ y so với ảnh gốc)
+        """
+        chosen = self.levels[0]
+        for level in reversed(self.levels):
+            if level.shape[1] / self.width >= zoom:
+                chosen = level
+                break
+        return chosen, chosen.shape[1] / self.width, chosen.shape[0] / self.height
+
+
+class TileCache:
+    """
+    Cache LRU các tile đã render, key (zoom, cột, hàng)
+
+    Dung lượng (ước lượng 4 bytes/pixel như Tk giữ ảnh) được ghi vào ngân sách bộ nhớ.
+    Chỉ dùng từ thread Tk.
+    """
+
+    def __init__(self, max_tiles: int = MAX_TILES, budget=None):
+        self.max_tiles = max_tiles
+        self.budget = budget or get_budget()
+        self._tiles = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, key):
+        entry = self._tiles.get(key)
+        if entry is None:
+            return None
+        self._tiles.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, tile):
+        size = tile.width() * tile.height() * 4
+        self._tiles[key] = (tile, size)
+        self._tiles.move_to_end(key)
+        self._account(size)
+        while len(self._tiles) > self.max_tiles:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        _, (_, size) = self._tiles.popitem(last=False)
+        self._account(-size)
+        return size
+
+    def _account(self, delta: int):
+        self.nbytes += delta
+        self.budget.add('tiles', delta)
+
+    def trim(self, nbytes: int) -> int:
+        """Bỏ tile ít dùng nhất cho tới khi giải phóng đủ nbytes"""
+        freed = 0
+        while self._tiles and freed < nbytes:
+            freed += self._drop_oldest()
+        return freed
+
+    def clear(self):
+        self._tiles.clear()
+        self._account(-self.nbytes)
+
+
+class ZoomView:
+    """
+    Điều khiển hiển thị ảnh + annotation trên một Canvas có sẵn
+
+    Lăn chuột để zoom quanh con trỏ, kéo chuột phải/giữa (hoặc gọi start_pan/drag_pan)
+    để di chuyển, double-click để vừa khung. Toạ độ "world" là toạ độ ảnh nhân zoom;
+    offset là vị trí world của góc trên trái canvas.
+    """
+
+    def __init__(self, canvas, tile_size: int = TILE_SIZE, max_tiles: int = MAX_TILES):
+        self.canvas = canvas
+        self.tile_size = tile_size
+        self.budget = get_budget()
+        self.cache = TileCache(max_tiles, self.budget)
+        self.pyramid = None
+        self.detections = indexed([])
+        self.hover = None            # Detection dưới con trỏ
+        self.selected = None         # Detection đang chọn
+        self.zoom = 1.0
+        self.offset = (0.0, 0.0)
+        self.on_render = None        # Callback sau mỗi lần vẽ lại (vd: vẽ ROI)
+        self._items = {}             # (cột, hàng) -> (canvas item, PhotoImage)
+        self._items_zoom = None
+        self._render_pending = False
+        self._pan_start = None
+        self._fitted = True          # Đang ở chế độ vừa khung (resize canvas thì fit lại)
+
+        # Thiếu bộ nhớ (có thể từ thread khác) -> bỏ bớt tile trên thread Tk
+        self.budget.register_cache(f"zoom_tiles_{id(self)}", self._request_trim)
+
+        canvas.bind("<MouseWheel>", self._on_wheel)
+        canvas.bind("<Button-4>", self._on_wheel)
+        canvas.bind("<Button-5>", self._on_wheel)
+        canvas.bind("<Double-Button-1>", lambda e: self.fit())
+        for button in (2, 3):
+            canvas.bind(f"<ButtonPress-{button}>", lambda e: self.start_pan(e.x, e.y))
+            canvas.bind(f"<B{button}-Motion>", lambda e: self.drag_pan(e.x, e.y))
+
+    def _request_trim(self, nbytes: int) -> int:
+        """Evictor cho MemoryBudget: tile chỉ được bỏ trên thread Tk, phần giải phóng báo sau qua budget.add"""
+        self.canvas.after(0, lambda: self.cache.trim(nbytes))
+        return 0
+
+    @property
+    def has_image(self) -> bool:
+        return self.pyramid is not None
+
+    def set_image(self, image, detections: list):
+        """
+        Hiển thị ảnh mới (vừa khung)
+
+        Args:
+            image: ImagePyramid (nên tạo sẵn trong thread nền), hoặc ảnh như ImagePyramid nhận
+            detections: Kết quả detect() theo toạ độ ảnh gốc
+        """
+        pyramid = image if isinstance(image, ImagePyramid) else ImagePyramid(image, self.budget)
+        self._set_pyramid(pyramid)
+        self.set_detections(detections)
+        self.fit()
+
+    def set_detections(self, detections: list):
+        """Đổi annotation (giữ nguyên vị trí xem)"""
+        self.detections = indexed(detections)
+        self.hover = self.selected = None
+        self._reset_tiles()
+        self.schedule_render()
+
+    def _set_pyramid(self, pyramid):
+        """Đổi ảnh đang xem, ghi lại dung lượng vào ngân sách bộ nhớ"""
+        old = self.pyramid.nbytes if self.pyramid is not None else 0
+        self.pyramid = pyramid
+        self.budget.add('view', (pyramid.nbytes if pyramid is not None else 0) - old)
+
+    def clear(self):
+        self._set_pyramid(None)
+        self.detections = indexed([])
+        self.hover = self.selected = None
+        self._reset_tiles()
+        self.canvas.delete("mark")
+
+    def _reset_tiles(self):
+        self.cache.clear()
+        self.canvas.delete("tile")
+        self._items.clear()
+        self._items_zoom = None
+
+    # ------------------------------------------------------------------
+    # Toạ độ
+    # ------------------------------------------------------------------
+    def _canvas_size(self) -> tuple:
+        return max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+
+    def fit_zoom(self) -> float:
+        width, height = self._canvas_size()
+        return min(
+            max(1, width - FIT_MARGIN * 2) / self.pyramid.width,
+            max(1, height - FIT_MARGIN * 2) / self.pyramid.height
+        )
+
+    def canvas_to_image(self, x: float, y: float) -> tuple:
+        return (x + self.offset[0]) / self.zoom, (y + self.offset[1]) / self.zoom
+
+    def image_to_canvas(self, x: float, y: float) -> tuple:
+        return x * self.zoom - self.offset[0], y * self.zoom - self.offset[1]
+
+    def _clamp_offset(self, offset_x: float, offset_y: float) -> tuple:
+        """Ảnh nhỏ hơn canvas thì căn giữa, lớn hơn thì không cho kéo ra ngoài"""
+        width, height = self._canvas_size()
+
+        def clamp(offset, view, world):
+            if world <= view:
+                return -(view - world) / 2
+            return min(max(offset, 0), world - view)
+
+        return (
+            clamp(offset_x, width, self.pyramid.width * self.zoom),
+            clamp(offset_y, height, self.pyramid.height * self.zoom)
+        )
+
+    # ------------------------------------------------------------------
+    # Zoom / pan
+    # ------------------------------------------------------------------
+    def fit(self):
+        if not self.has_image:
+            return
+        self.zoom = self.fit_zoom()
+        self.offset = self._clamp_offset(0, 0)
+        self._fitted = True
+        self.schedule_render()
+
+    def on_resize(self):
+        """Gọi khi canvas đổi kích thước"""
+        if self._fitted:
+            self.fit()
+        else:
+            self.schedule_render()
+
+    def zoom_at(self, x: float, y: float, factor: float):
+        """Zoom giữ nguyên điểm ảnh nằm dưới (x, y) trên canvas"""
+        if not self.has_image:
+            return
+        min_zoom = min(1.0, self.fit_zoom())
+        zoom = min(MAX_ZOOM, max(min_zoom, self.zoom * factor))
+        if zoom == self.zoom:
+            return
+        image_x, image_y = self.canvas_to_image(x, y)
+        self.zoom = zoom
+        self._fitted = False
+        self.offset = self._clamp_offset(image_x * zoom - x, image_y * zoom - y)
+        self.schedule_render()
+
+    def start_pan(self, x: float, y: float):
+        self._pan_start = (x, y)
+
+    def drag_pan(self, x: float, y: float):
+        if self._pan_start is None or not self.has_image:
+            return
+        dx, dy = x - self._pan_start[0], y - self._pan_start[1]
+        self._pan_start = (x, y)
+        self.offset = self._clamp_offset(self.offset[0] - dx, self.offset[1] - dy)
+        self._fitted = False
+        self.schedule_render()
+
+    # ------------------------------------------------------------------
+    # Hover / chọn khuôn mặt
+    # ------------------------------------------------------------------
+    def detection_at(self, x: float, y: float):
+        """Detection dưới điểm (x, y) trên canvas (tra qua spatial index), None nếu không có"""
+        if not self.has_image:
+            return None
+        return self.detections.at(*self.canvas_to_image(x, y))
+
+    def hover_at(self, x: float, y: float):
+        """Cập nhật viền hover; chỉ vẽ lại khi đổi sang khuôn mặt khác"""
+        det = self.detection_at(x, y)
+        if det is not self.hover:
+            self.hover = det
+            self._draw_marks()
+        return det
+
+    def select_at(self, x: float, y: float):
+        self.selected = self.detection_at(x, y)
+        self._draw_marks()
+        return self.selected
+
+    def _draw_marks(self):
+        """Viền hover/chọn vẽ bằng canvas item (không phải render lại tile)"""
+        self.canvas.delete("mark")
+        for det, color, width in ((self.hover, HOVER_COLOR, 1), (self.selected, SELECTED_COLOR, 3)):
+            if det is None:
+                continue
+            x1, y1, x2, y2 = det['bbox']
+            self.canvas.create_rectangle(
+                *self.image_to_canvas(x1, y1), *self.image_to_canvas(x2, y2),
+                outline=color, width=width, tags="mark"
+            )
+
+    def _on_wheel(self, event):
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.zoom_at(event.x, event.y, ZOOM_STEP)
+        else:
+            self.zoom_at(event.x, event.y, 1 / ZOOM_STEP)
+
+    # ------------------------------------------------------------------
+    # Render
+    # ------------------------------------------------------------------
+    def schedule_render(self):
+        """Gộp nhiều sự kiện (lăn chuột, kéo) trong một vòng event loop thành một lần vẽ"""
+        if not self._render_pending:
+            self._render_pending = True
+            self.canvas.after_idle(self.render)
+
+    def render(self):
+        self._render_pending = False
+        if not self.has_image:
+            return
+        self.offset = self._clamp_offset(*self.offset)
+        if self._items_zoom != self.zoom:
+            self.canvas.delete("tile")
+            self._items.clear()
+            self._items_zoom = self.zoom
+
+        size = self.tile_size
+        width, height = self._canvas_size()
+        world_w = self.pyramid.width * self.zoom
+        world_h = self.pyramid.height * self.zoom
+        offset_x, offset_y = self.offset
+        cols = range(
+            max(0, int(offset_x // size)),
+            int(math.ceil(min(world_w, offset_x + width) / size))
+        )
+        rows = range(
+            max(0, int(offset_y // size)),
+            int(math.ceil(min(world_h, offset_y + height) / size))
+        )
+        visible = {(col, row) for col in cols for row in rows}
+
+        for key in list(self._items):
+            if key not in visible:
+                self.canvas.delete(self._items.pop(key)[0])
+        for col, row in visible:
+            x, y = col * size - offset_x, row * size - offset_y
+            item = self._items.get((col, row))
+            if item is not None:
+                self.canvas.coords(item[0], x, y)
+                continue
+            photo = self._tile(col, row)
+            item_id = self.canvas.create_image(x, y, image=photo, anchor='nw', tags="tile")
+            self._items[(col, row)] = (item_id, photo)
+        self.canvas.tag_lower("tile")
+        self._draw_marks()
+
+        if self.on_render:
+            self.on_render()
+
+    def _style(self) -> tuple:
+        """Cỡ label/viền theo ảnh gốc rồi nhân zoom, giới hạn để vẫn đọc được"""
+        font_size, box_width = style_for(self.pyramid.width, self.pyramid.height)
+        font_size = int(min(MAX_FONT_SIZE, max(MIN_FONT_SIZE, font_size * self.zoom)))
+        box_width = int(min(3, max(1, round(box_width * self.zoom))))
+        return font_size, box_width
+
+    def _tile(self, col: int, row: int):
+        """PhotoImage của một tile ở zoom hiện tại (render nếu chưa có trong cache)"""
+        key = (self.zoom, col, row)
+        photo = self.cache.get(key)
+        if photo is not None:
+            return photo
+
+        size, zoom = self.tile_size, self.zoom
+        world_x1, world_y1 = col * size, row * size
+        world_x2 = min(world_x1 + size, int(math.ceil(self.pyramid.width * zoom)))
+        world_y2 = min(world_y1 + size, int(math.ceil(self.pyramid.height * zoom)))
+        out_w, out_h = max(1, world_x2 - world_x1), max(1, world_y2 - world_y1)
+
+        # Cắt từ mức pyramid gần nhất rồi co/giãn đúng kích thước tile
+        level, scale_x, scale_y = self.pyramid.level_for(zoom)
+        factor_x, factor_y = zoom / scale_x, zoom / scale_y  # pixel màn hình / pixel của mức
+        enlarge = factor_x > 1
+        extra = 1 if enlarge else 0  # Thêm một pixel cho nội suy ở mép khi phóng to
+        lx1 = int(world_x1 / zoom * scale_x)
+        ly1 = int(world_y1 / zoom * scale_y)
+        lx2 = max(lx1 + 1, min(level.shape[1], int(math.ceil(world_x2 / zoom * scale_x)) + extra))
+        ly2 = max(ly1 + 1, min(level.shape[0], int(math.ceil(world_y2 / zoom * scale_y)) + extra))
+        crop = level[ly1:ly2, lx1:lx2]
+        if enlarge:
+            # Phóng to: lệch nửa pixel ảnh đã là vài pixel màn hình -> ánh xạ affine chính xác
+            matrix = np.float32([
+                [factor_x, 0, lx1 * factor_x - world_x1],
+                [0, factor_y, ly1 * factor_y - world_y1]
+            ])
+            interpolation = cv2.INTER_NEAREST if factor_x >= 2 else cv2.INTER_LINEAR
+            pixels = cv2.warpAffine(crop, matrix, (out_w, out_h), flags=interpolation,
+                                    borderMode=cv2.BORDER_REPLICATE)
+        else:
+            pixels = cv2.resize(crop, (out_w, out_h), interpolation=cv2.INTER_AREA)
+
+        # Chỉ vẽ các box chạm tile (nới thêm một label để label tràn từ tile bên cạnh)
+        font_size, box_width = self._style()
+        pad = font_size * 4 / zoom
+        ids = self.detections.index.query_box(
+            world_x1 / zoom - pad, world_y1 / zoom - pad,
+            world_x2 / zoom + pad, world_y2 / zoom + pad
+        )
+        if ids:
+            default_annotator.draw(
+                pixels, [self.detections[i] for i in ids], scale=zoom,
+                origin=(world_x1, world_y1), style=(font_size, box_width)
+            )
+
+        photo = ImageTk.PhotoImage(Image.fromarray(pixels))
+        self.cache.put(key, photo)
+        return photo